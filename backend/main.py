@@ -9,22 +9,37 @@ from pathlib import Path
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse, Response
+
+try:
+    import orjson  # noqa: F401 - required by ORJSONResponse
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import Optional, List, Dict, Any
+from collections import defaultdict
 from datetime import timedelta
 import time
+import json
+import asyncio
 from contextlib import asynccontextmanager
 
 from src.config import config
 from src.logging_config import setup_logging, log_query_metrics
-from src.orchestrator.retriever import get_retriever
+from src.orchestrator.retriever import (
+    setup_retriever, batch_get_relevant_documents, abatch_get_relevant_documents, AnnProfile
+)
 from src.orchestrator.agents import SupportOrchestrator
-from src.orchestrator.ingest import ingest_from_directory
-from src.orchestrator.memory import ConversationMemory
-from src.orchestrator.cache import QueryCache
+from src.orchestrator.jobs import IngestJobQueue
+from src.orchestrator.llm_client import aclose_async_client
+from src.orchestrator.sessions import make_session_store
+from src.orchestrator.cache import QueryCache, make_cache_backend
+from src.orchestrator.semantic_cache import SemanticQueryCache
 from src.orchestrator.feedback import FeedbackCollector
+from src.orchestrator.concurrency import MicroBatcher, SingleFlight
 
 # Initialize logging
 logger = setup_logging(config.log_level, config.log_file)
@@ -34,20 +49,154 @@ orchestrator = None
 retriever = None
 query_cache = None
 feedback_collector = None
-sessions = {}  # Store conversation memories by session_id
+query_batcher = None
+session_store = None  # Conversation memories by session_id (bounded LRU + TTL)
+ingest_queue = None
+query_flights = SingleFlight()  # In-flight /query generations keyed by normalized query
+
+
+def _build_vector_index():
+    """Build the configured in-process ANN index over the retriever's collection."""
+    from src.orchestrator.vector_index import attach_faiss_index
+    
+    attach_faiss_index(retriever, config.vector_store)
+
+
+def _warm_up():
+    """Run one dummy query through every stage so the first request is not the cold one.
+    
+    Loads the embedding model weights, persisted query embeddings and vector
+    index pages, and sends one prompt to the LLM (waking remote endpoints).
+    The rerank kernels were already compiled by `setup_retriever`.
+    """
+    embeddings = getattr(retriever, "embeddings", None)
+    if hasattr(embeddings, "warm_query_cache"):
+        logger.info(f"Preloaded {embeddings.warm_query_cache()} cached query embeddings")
+    
+    docs = retriever.get_relevant_documents("ping") if retriever else []
+    if orchestrator:
+        orchestrator.answer_with_judgment("ping", docs)
+
+
+def _answer_batch(items: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Retrieve and answer a batch of queries in one retriever and one LLM call.
+    
+    Args:
+        items: Dicts with the user `query`, the `retrieval_query` (query plus
+            conversation context for follow-ups) and the `ann_profile`
+    
+    Returns:
+        One dict per item with the raw documents, answer, confidence,
+        escalation flag and stage timings
+    """
+    retrieval_start = time.time()
+    docs_lists = [[] for _ in items]
+    out_of_scope = [False] * len(items)
+    if retriever:
+        # Queries far from the corpus centroid skip retrieval and the LLM
+        try:
+            out_of_scope = orchestrator.out_of_scope_batch([item["retrieval_query"] for item in items])
+        except Exception as e:
+            logger.warning(f"Scope check failed: {e}")
+        # One retrieval call per ANN profile present in the batch
+        by_profile = defaultdict(list)
+        for i, item in enumerate(items):
+            if not out_of_scope[i]:
+                by_profile[item["ann_profile"]].append(i)
+        try:
+            for ann_profile, indices in by_profile.items():
+                results = batch_get_relevant_documents(
+                    retriever, [items[i]["retrieval_query"] for i in indices], ann_profile=ann_profile
+                )
+                for i, docs in zip(indices, results):
+                    docs_lists[i] = docs
+        except Exception as e:
+            logger.warning(f"Retrieval failed: {e}")
+    
+    if config.orchestrator.grade_documents:
+        try:
+            docs_lists = orchestrator.rerank_by_grade(
+                [item["query"] for item in items], docs_lists,
+                top_n=config.orchestrator.graded_top_n
+            )
+        except Exception as e:
+            logger.warning(f"Document grading failed: {e}")
+    retrieval_time = time.time() - retrieval_start
+    
+    generation_start = time.time()
+    judgments = [None] * len(items)
+    in_scope = [i for i in range(len(items)) if not out_of_scope[i]]
+    refused = [i for i in range(len(items)) if out_of_scope[i]]
+    if in_scope:
+        answered = orchestrator.answer_with_judgment_batch(
+            [items[i]["query"] for i in in_scope], [docs_lists[i] for i in in_scope]
+        )
+        for i, judgment in zip(in_scope, answered):
+            judgments[i] = judgment
+    if refused:
+        for i, judgment in zip(refused, orchestrator.refuse_batch([items[i]["query"] for i in refused])):
+            judgments[i] = judgment
+    generation_time = time.time() - generation_start
+    
+    return [
+        {
+            "docs": docs,
+            **judgment,
+            "retrieval_time": retrieval_time,
+            "generation_time": generation_time,
+            "batch_size": len(items)
+        }
+        for docs, judgment in zip(docs_lists, judgments)
+    ]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize resources on startup."""
-    global orchestrator, retriever, query_cache, feedback_collector
+    global orchestrator, retriever, query_cache, feedback_collector, query_batcher, session_store, ingest_queue
     
     logger.info("Starting Customer Support Orchestrator API...")
     
     # Initialize cache
-    query_cache = QueryCache(ttl_minutes=60, max_size=500)
+    try:
+        cache_backend = make_cache_backend(config.cache.backend, config.cache.redis_url)
+    except Exception as e:
+        logger.warning(f"Failed to initialize {config.cache.backend} cache backend, using memory: {e}")
+        cache_backend = None
+    if config.cache.semantic:
+        query_cache = SemanticQueryCache(
+            ttl_minutes=config.cache.ttl_minutes,
+            max_size=config.cache.max_size,
+            backend=cache_backend,
+            threshold=config.cache.semantic_threshold,
+            safe_radius=config.cache.semantic_safe_radius
+        )
+    else:
+        query_cache = QueryCache(
+            ttl_minutes=config.cache.ttl_minutes,
+            max_size=config.cache.max_size,
+            backend=cache_backend
+        )
     logger.info("Query cache initialized")
     
+    # Initialize session store and its expiry sweep
+    try:
+        session_store = make_session_store(
+            config.sessions.backend,
+            redis_url=config.cache.redis_url,
+            max_size=config.sessions.max_sessions,
+            ttl_s=config.sessions.ttl_seconds
+        )
+    except Exception as e:
+        logger.warning(f"Failed to initialize {config.sessions.backend} session store, using memory: {e}")
+        session_store = make_session_store(
+            "memory",
+            max_size=config.sessions.max_sessions,
+            ttl_s=config.sessions.ttl_seconds
+        )
+    session_store.start_purging(config.sessions.purge_interval_seconds)
+    logger.info("Session store initialized")
+    
     # Initialize feedback collector
     feedback_collector = FeedbackCollector()
     logger.info("Feedback collector initialized")
@@ -59,12 +208,27 @@ async def lifespan(app: FastAPI):
     
     # Initialize retriever
     try:
-        retriever = get_retriever(persist_directory=config.vector_store.persist_directory)
+        retriever = setup_retriever(config.vector_store)
         logger.info("Retriever initialized successfully")
+        if isinstance(query_cache, SemanticQueryCache):
+            query_cache.attach_embeddings(retriever.embeddings)
     except Exception as e:
         logger.error(f"Failed to initialize retriever: {e}")
         retriever = None
     
+    # Load the collection into an in-process ANN index once at startup
+    if retriever is not None and config.vector_store.ann_index == "faiss":
+        from src.orchestrator.vector_index import _FAISS_AVAILABLE
+        try:
+            if not _FAISS_AVAILABLE:
+                logger.info("faiss not installed, searching Chroma directly")
+            else:
+                await asyncio.to_thread(_build_vector_index)
+                if retriever.index is not None:
+                    logger.info(f"FAISS {retriever.index.index_type} index ready")
+        except Exception as e:
+            logger.warning(f"Failed to build FAISS index, searching Chroma directly: {e}")
+    
     # Initialize orchestrator
     try:
         # Set environment variables for HF mode
@@ -79,20 +243,59 @@ async def lifespan(app: FastAPI):
             mode=config.model.mode
         )
         logger.info(f"Orchestrator initialized in {config.model.mode} mode")
+        
+        # Learned confidence/escalation judge, if one has been trained
+        judge_path = Path(config.orchestrator.judge_model_path)
+        if judge_path.exists() and hasattr(retriever, "embeddings"):
+            try:
+                from src.orchestrator.judge import JudgeClassifier
+                orchestrator.attach_judge(JudgeClassifier.load(str(judge_path)), retriever.embeddings)
+                logger.info(f"Answer judge loaded from {judge_path}")
+            except Exception as e:
+                logger.warning(f"Failed to load answer judge, using heuristics: {e}")
     except Exception as e:
         logger.error(f"Failed to initialize orchestrator: {e}")
         orchestrator = None
     
+    # Coalesce concurrent queries into batched retrieval + generation calls
+    query_batcher = MicroBatcher(
+        _answer_batch,
+        max_batch_size=config.batching.max_batch_size,
+        max_wait_ms=config.batching.max_wait_ms
+    )
+    query_batcher.start()
+    
+    if config.warmup_on_startup:
+        start = time.time()
+        try:
+            await asyncio.to_thread(_warm_up)
+            logger.info(f"Warm-up completed in {time.time() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}")
+    
+    # Ingestion runs in worker processes, off the API event loop
+    if config.ingest.enabled:
+        ingest_queue = IngestJobQueue(
+            max_workers=config.ingest.max_workers,
+            max_tracked_jobs=config.ingest.max_tracked_jobs
+        )
+    
     yield
     
     logger.info("Shutting down API...")
+    await query_batcher.stop()
+    await session_store.stop_purging()
+    await aclose_async_client()
+    if ingest_queue:
+        ingest_queue.shutdown()
 
 
 app = FastAPI(
     title="Customer Support Orchestrator",
     description="RAG-powered multi-agent customer support system",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
 # CORS middleware
@@ -106,12 +309,26 @@ app.add_middleware(
 
 
 # Request/Response models
+# Request bodies are immutable and reject unknown fields
+_REQUEST_MODEL_CONFIG = ConfigDict(extra="forbid", frozen=True, populate_by_name=True)
+
+
 class QueryRequest(BaseModel):
     """Query request model."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
     query: str = Field(..., min_length=1, description="User query text")
     session_id: Optional[str] = Field(None, description="Session ID for conversation context")
     top_k: Optional[int] = Field(3, ge=1, le=10, description="Number of documents to retrieve")
     use_workflow: Optional[bool] = Field(False, description="Use LangGraph workflow")
+    ann_profile: Optional[AnnProfile] = Field(None, description="Vector search profile: fast, balanced or recall")
+
+
+class QueryBatchRequest(BaseModel):
+    """Batch query request model."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
+    queries: List[QueryRequest] = Field(..., min_length=1, max_length=32, description="Queries to process")
 
 
 class Document(BaseModel):
@@ -121,6 +338,10 @@ class Document(BaseModel):
     chunk_index: int
 
 
+# Built once; dumps retrieved documents for the cache without per-model calls
+_DOCUMENT_LIST_ADAPTER = TypeAdapter(List[Document])
+
+
 class QueryResponse(BaseModel):
     """Query response model."""
     answer: str
@@ -134,6 +355,8 @@ class QueryResponse(BaseModel):
 
 class IngestRequest(BaseModel):
     """Ingestion request model."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
     data_directory: Optional[str] = Field(None, description="Directory containing documents")
 
 
@@ -142,10 +365,13 @@ class IngestResponse(BaseModel):
     status: str
     message: str
     documents_processed: int
+    job_id: Optional[str] = None
 
 
 class FeedbackRequest(BaseModel):
     """Feedback submission model."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
     query: str
     answer: str
     rating: int = Field(..., ge=1, le=5, description="Rating from 1-5")
@@ -200,29 +426,98 @@ async def query_support(request: QueryRequest):
     if not orchestrator:
         raise HTTPException(status_code=503, detail="Orchestrator not initialized")
     
+    return await _process_query(request, encoded_cache_hits=True)
+
+
+@app.post("/query_batch", response_model=List[QueryResponse])
+async def query_support_batch(request: QueryBatchRequest):
+    """Process several queries at once.
+    
+    The queries are submitted concurrently so the micro-batcher folds them
+    into shared retrieval and generation calls.
+    
+    Args:
+        request: Batch of query requests
+    
+    Returns:
+        One QueryResponse per query, in request order
+    """
+    if not orchestrator:
+        raise HTTPException(status_code=503, detail="Orchestrator not initialized")
+    
+    return await asyncio.gather(*(_process_query(q) for q in request.queries))
+
+
+def _to_documents(raw_docs: list, top_k: int) -> List[Document]:
+    """Convert retrieved LangChain-style documents to response models.
+    
+    Fields are gathered column by column and zipped into models once.
+    Retrieved documents are trusted internal data, so `model_construct`
+    skips per-document validation.
+    """
+    raw_docs = raw_docs[:top_k]
+    metadatas = [doc.metadata for doc in raw_docs]
+    contents = [doc.page_content for doc in raw_docs]
+    sources = [meta.get("source", "unknown") for meta in metadatas]
+    chunk_indices = [meta.get("chunk_index", 0) for meta in metadatas]
+    return [
+        Document.model_construct(content=content, source=source, chunk_index=chunk_index)
+        for content, source, chunk_index in zip(contents, sources, chunk_indices)
+    ]
+
+
+def _use_query_cache(request: QueryRequest, memory) -> bool:
+    """Whether a query may be answered from, and stored in, the query cache.
+    
+    Entries are keyed by query and `top_k` only, and are shared by every
+    session: follow-ups are answered with their session's context, and an
+    explicit `ann_profile` searches differently, so both bypass the cache.
+    Call before the query is added to the session's memory.
+    """
+    if query_cache is None or request.ann_profile is not None:
+        return False
+    return not (memory.has_context() and memory.is_follow_up_question(request.query))
+
+
+async def _process_query(request: QueryRequest, encoded_cache_hits: bool = False):
+    """Answer a single query using the cache, session memory and batcher.
+    
+    Args:
+        request: Query request
+        encoded_cache_hits: Return cache hits as a ready-made JSON `Response`
+            built from the cached body, skipping model validation and encoding
+    
+    Returns:
+        QueryResponse, or a Response for encoded cache hits
+    """
     logger.info(f"Received query: {request.query[:100]}...")
     
     # Get or create session
     session_id = request.session_id or f"session_{int(time.time()*1000)}"
-    if session_id not in sessions:
-        sessions[session_id] = ConversationMemory(session_id=session_id)
-    
-    memory = sessions[session_id]
+    memory = await session_store.get_or_create(session_id)
     
     # Check cache first
-    cached_response = query_cache.get(request.query) if query_cache else None
-    if cached_response:
+    use_cache = _use_query_cache(request, memory)
+    cached = await query_cache.aget_response(request.query, request.top_k) if use_cache else None
+    if cached:
         logger.info("Cache hit! Returning cached response")
+        cached_response = cached.data
         # Add to conversation memory
         memory.add_message("user", request.query)
         memory.add_message("assistant", cached_response['answer'], 
                           {'cached': True, 'confidence': cached_response['confidence']})
+        await session_store.persist(memory)
         
-        return QueryResponse(
+        if encoded_cache_hits:
+            return Response(
+                content=cached.render(session_id=session_id, cached=True),
+                media_type="application/json"
+            )
+        return QueryResponse(**{
             **cached_response,
-            session_id=session_id,
-            cached=True
-        )
+            "session_id": session_id,
+            "cached": True
+        })
     
     start_time = time.time()
     
@@ -237,44 +532,79 @@ async def query_support(request: QueryRequest):
             query_with_context = f"Context:\n{context}\n\nCurrent question: {request.query}"
             logger.info("Follow-up question detected, adding conversation context")
         
-        # Retrieve documents
-        retrieval_start = time.time()
-        docs = []
-        if retriever:
-            try:
-                raw_docs = retriever.get_relevant_documents(query_with_context)
-                docs = [
-                    Document(
-                        content=doc.page_content,
-                        source=doc.metadata.get("source", "unknown"),
-                        chunk_index=doc.metadata.get("chunk_index", 0)
-                    )
-                    for doc in raw_docs[:request.top_k]
-                ]
-            except Exception as e:
-                logger.warning(f"Retrieval failed: {e}")
-        retrieval_time = time.time() - retrieval_start
-        
-        # Generate answer
-        generation_start = time.time()
+        batch_size = 1
         if request.use_workflow:
-            try:
-                from src.orchestrator.graph import run_support_workflow
-                result = run_support_workflow(request.query, retriever, orchestrator.llm)
-                answer = result.get("answer", "Workflow execution failed")
-                confidence = result.get("confidence", 0.0)
-                should_escalate = result.get("escalate", False)
-            except Exception as e:
-                logger.error(f"Workflow execution failed: {e}")
-                answer = orchestrator.answer(request.query)
-                confidence = orchestrator.classify_confidence(request.query, answer)
-                should_escalate = orchestrator.should_escalate(request.query, answer)
+            retrieval_start = time.time()
+            query_vector = None
+            if retriever and hasattr(retriever, "aembed_query"):
+                try:
+                    # Embed once; both the response retrieval and the workflow reuse the vector
+                    query_vector = await retriever.aembed_query(query_with_context)
+                except Exception as e:
+                    logger.warning(f"Query embedding failed: {e}")
+            
+            async def retrieve_documents():
+                docs = []
+                if retriever:
+                    try:
+                        if query_vector is not None:
+                            raw_docs = await asyncio.to_thread(
+                                retriever.get_relevant_documents_with_vector, query_vector,
+                                ann_profile=request.ann_profile
+                            )
+                        else:
+                            raw_docs = await asyncio.to_thread(
+                                retriever.get_relevant_documents, query_with_context
+                            )
+                        docs = _to_documents(raw_docs, request.top_k)
+                    except Exception as e:
+                        logger.warning(f"Retrieval failed: {e}")
+                return docs, time.time() - retrieval_start
+            
+            async def generate_answer():
+                generation_start = time.time()
+                try:
+                    from src.orchestrator.graph import run_support_workflow
+                    result = await asyncio.to_thread(
+                        run_support_workflow,
+                        request.query, retriever, orchestrator.llm,
+                        query_vector if query_with_context == request.query else None
+                    )
+                    answer = result.get("answer", "Workflow execution failed")
+                    confidence = result.get("confidence", 0.0)
+                    should_escalate = result.get("escalate", False)
+                except Exception as e:
+                    logger.error(f"Workflow execution failed: {e}")
+                    judgment = await asyncio.to_thread(orchestrator.answer_with_judgment, request.query)
+                    answer = judgment["answer"]
+                    confidence = judgment["confidence"]
+                    should_escalate = judgment["escalate"]
+                return answer, confidence, should_escalate, time.time() - generation_start
+            
+            # The response documents and the workflow run overlap in worker threads
+            (docs, retrieval_time), (answer, confidence, should_escalate, generation_time) = \
+                await asyncio.gather(retrieve_documents(), generate_answer())
         else:
-            answer = orchestrator.answer(request.query)
-            confidence = orchestrator.classify_confidence(request.query, answer)
-            should_escalate = orchestrator.should_escalate(request.query, answer)
+            # Retrieval and generation are batched with concurrent requests
+            item = {
+                "query": request.query,
+                "retrieval_query": query_with_context,
+                "ann_profile": request.ann_profile
+            }
+            if query_with_context == request.query:
+                # Identical context-free queries in flight share one generation
+                flight_key = (" ".join(request.query.lower().split()), request.ann_profile)
+                batch_result = await query_flights.do(flight_key, lambda: query_batcher.submit(item))
+            else:
+                batch_result = await query_batcher.submit(item)
+            docs = _to_documents(batch_result["docs"], request.top_k)
+            answer = batch_result["answer"]
+            retrieval_time = batch_result["retrieval_time"]
+            generation_time = batch_result["generation_time"]
+            batch_size = batch_result["batch_size"]
+            confidence = batch_result["confidence"]
+            should_escalate = batch_result["escalate"]
         
-        generation_time = time.time() - generation_start
         total_time = time.time() - start_time
         
         # Add assistant response to memory
@@ -283,6 +613,7 @@ async def query_support(request: QueryRequest):
             'escalate': should_escalate,
             'num_documents': len(docs)
         })
+        await session_store.persist(memory)
         
         # Log metrics
         log_query_metrics(
@@ -304,13 +635,17 @@ async def query_support(request: QueryRequest):
                 "total_time": total_time,
                 "num_documents": len(docs),
                 "workflow_used": request.use_workflow,
+                "batch_size": batch_size,
                 "conversation_turns": len(memory.get_history())
             }
         }
         
         # Cache the response (only non-escalated, high confidence responses)
-        if query_cache and confidence >= 0.6 and not should_escalate:
-            query_cache.set(request.query, response_data)
+        if use_cache and confidence >= 0.6 and not should_escalate:
+            await query_cache.aset(request.query, {
+                **response_data,
+                "documents": _DOCUMENT_LIST_ADAPTER.dump_python(docs)
+            }, request.top_k)
             logger.info("Response cached for future queries")
         
         return QueryResponse(**response_data)
@@ -320,6 +655,130 @@ async def query_support(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(data: Any, event: Optional[str] = None) -> str:
+    """Format one server-sent event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/query_stream")
+async def query_support_stream(request: QueryRequest):
+    """Stream the answer as server-sent events.
+    
+    Retrieval runs first, then each answer chunk is sent as a `data:` event
+    holding a JSON string. A final `event: done` carries the confidence,
+    escalation flag, documents and metrics.
+    
+    Args:
+        request: Query request containing user question
+    
+    Returns:
+        StreamingResponse with `text/event-stream` content
+    """
+    if not orchestrator:
+        raise HTTPException(status_code=503, detail="Orchestrator not initialized")
+    
+    logger.info(f"Received streaming query: {request.query[:100]}...")
+    
+    session_id = request.session_id or f"session_{int(time.time()*1000)}"
+    memory = await session_store.get_or_create(session_id)
+    use_cache = _use_query_cache(request, memory)
+    cached_response = await query_cache.aget(request.query, request.top_k) if use_cache else None
+    
+    async def event_stream():
+        memory.add_message("user", request.query)
+        
+        if cached_response:
+            memory.add_message("assistant", cached_response['answer'],
+                              {'cached': True, 'confidence': cached_response['confidence']})
+            await session_store.persist(memory)
+            yield _sse(cached_response["answer"])
+            yield _sse({
+                **{k: v for k, v in cached_response.items() if k != "answer"},
+                "session_id": session_id,
+                "cached": True
+            }, event="done")
+            return
+        
+        start_time = time.time()
+        try:
+            query_with_context = request.query
+            if memory.has_context() and memory.is_follow_up_question(request.query):
+                context = memory.get_context(num_messages=3)
+                query_with_context = f"Context:\n{context}\n\nCurrent question: {request.query}"
+            
+            retrieval_start = time.time()
+            raw_docs = []
+            # None unless the out-of-scope check is enabled
+            query_vec = await orchestrator.aquery_vector(query_with_context) if retriever else None
+            if retriever and not orchestrator.is_out_of_scope(query_vec):
+                try:
+                    raw_docs = (await abatch_get_relevant_documents(
+                        retriever, [query_with_context], request.ann_profile
+                    ))[0]
+                except Exception as e:
+                    logger.warning(f"Retrieval failed: {e}")
+            retrieval_time = time.time() - retrieval_start
+            docs = _to_documents(raw_docs, request.top_k)
+            
+            generation_start = time.time()
+            first_token_time = None
+            chunks = []
+            async for chunk in orchestrator.astream_answer(request.query, raw_docs, query_vec):
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                chunks.append(chunk)
+                yield _sse(chunk)
+            generation_time = time.time() - generation_start
+            
+            answer = "".join(chunks)
+            judgment = (await asyncio.to_thread(orchestrator.judge_answers, [request.query], [answer]))[0]
+            confidence = judgment["confidence"]
+            should_escalate = judgment["escalate"]
+            total_time = time.time() - start_time
+            
+            memory.add_message("assistant", answer, {
+                'confidence': confidence,
+                'escalate': should_escalate,
+                'num_documents': len(docs)
+            })
+            await session_store.persist(memory)
+            log_query_metrics(
+                logger, request.query, answer,
+                retrieval_time, generation_time,
+                len(docs), confidence
+            )
+            
+            response_data = {
+                "answer": answer,
+                "confidence": confidence,
+                "should_escalate": should_escalate,
+                "documents": _DOCUMENT_LIST_ADAPTER.dump_python(docs),
+                "session_id": session_id,
+                "cached": False,
+                "metrics": {
+                    "retrieval_time": retrieval_time,
+                    "generation_time": generation_time,
+                    "time_to_first_token": first_token_time,
+                    "total_time": total_time,
+                    "num_documents": len(docs),
+                    "workflow_used": False,
+                    "conversation_turns": len(memory.get_history())
+                }
+            }
+            
+            if use_cache and confidence >= 0.6 and not should_escalate:
+                await query_cache.aset(request.query, response_data, request.top_k)
+            
+            yield _sse({k: v for k, v in response_data.items() if k != "answer"}, event="done")
+        
+        except Exception as e:
+            logger.error(f"Streaming query failed: {e}")
+            yield _sse({"detail": str(e)}, event="error")
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.post("/feedback")
 async def submit_feedback(feedback: FeedbackRequest):
     """Submit feedback for a query response.
@@ -400,6 +859,7 @@ async def get_cache_stats():
         
         return {
             "cache_stats": stats,
+            "cache_info": query_cache.cache_info()._asdict(),
             "most_cached_queries": [
                 {"query": query, "hits": hits}
                 for query, hits in popular
@@ -422,7 +882,7 @@ async def clear_cache():
         raise HTTPException(status_code=503, detail="Cache not initialized")
     
     try:
-        query_cache.clear()
+        await query_cache.aclear()
         logger.info("Cache cleared successfully")
         
         return {
@@ -445,11 +905,11 @@ async def get_session_history(session_id: str):
     Returns:
         Conversation history
     """
-    if session_id not in sessions:
+    memory = await session_store.get(session_id)
+    if memory is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
     try:
-        memory = sessions[session_id]
         return {
             "session_id": session_id,
             "history": memory.get_history(),
@@ -472,8 +932,7 @@ async def clear_session(session_id: str):
     Returns:
         Success status
     """
-    if session_id in sessions:
-        del sessions[session_id]
+    if await session_store.delete(session_id):
         logger.info(f"Session {session_id} cleared")
     
     return {
@@ -482,48 +941,108 @@ async def clear_session(session_id: str):
     }
 
 
+def _refresh_search_structures():
+    """Rebuild the FAISS index or drop retriever caches, and recompute the centroid."""
+    if retriever is None:
+        return
+    if getattr(retriever, "index", None) is not None:
+        _build_vector_index()
+        logger.info("FAISS index rebuilt")
+    elif hasattr(retriever, "clear_cache"):
+        retriever.clear_cache()
+    threshold = config.vector_store.scope_threshold
+    if threshold is not None and hasattr(retriever, "compute_centroid"):
+        retriever.compute_centroid(threshold)
+        logger.info("Corpus centroid recomputed")
+
+
+async def _after_ingestion():
+    """Refresh search structures and drop cached answers once an ingestion job finishes."""
+    await asyncio.to_thread(_refresh_search_structures)
+    if query_cache is not None:
+        # Includes the semantic and Redis tiers, which would keep serving pre-ingestion answers
+        await query_cache.aclear()
+
+
 @app.post("/ingest", response_model=IngestResponse)
-async def ingest_documents(request: IngestRequest, background_tasks: BackgroundTasks):
-    """Ingest documents into the vector store.
+async def ingest_documents(request: IngestRequest):
+    """Queue document ingestion into the vector store.
+    
+    Ingestion runs in a worker process; poll `/ingest/{job_id}` for its status.
     
     Args:
         request: Ingestion request with optional directory path
-        background_tasks: FastAPI background tasks
     
     Returns:
-        IngestResponse with status and document count
+        IngestResponse with the job ID
     """
-    data_dir = request.data_directory or str(config.data_dir)
+    if not ingest_queue:
+        raise HTTPException(status_code=503, detail="Ingestion queue disabled or not initialized")
     
-    logger.info(f"Starting ingestion from: {data_dir}")
-    
-    def run_ingestion():
-        try:
-            ingest_from_directory(
-                data_dir=data_dir,
-                persist_directory=config.vector_store.persist_directory,
-                chunk_size=config.vector_store.chunk_size,
-                chunk_overlap=config.vector_store.chunk_overlap
-            )
-            logger.info("Ingestion completed successfully")
-        except Exception as e:
-            logger.error(f"Ingestion failed: {e}")
+    data_dir = request.data_directory or str(config.data_dir)
     
-    # Run ingestion in background
-    background_tasks.add_task(run_ingestion)
+    job_id = ingest_queue.submit(
+        on_success=_after_ingestion,
+        data_dir=data_dir,
+        persist_directory=config.vector_store.persist_directory,
+        chunk_size=config.vector_store.chunk_size,
+        chunk_overlap=config.vector_store.chunk_overlap
+    )
+    logger.info(f"Queued ingestion job {job_id} for: {data_dir}")
     
     return IngestResponse(
-        status="processing",
-        message=f"Ingestion started for directory: {data_dir}",
-        documents_processed=0
+        status="queued",
+        message=f"Ingestion queued for directory: {data_dir}",
+        documents_processed=0,
+        job_id=job_id
     )
 
 
+@app.get("/ingest/{job_id}")
+async def get_ingest_status(job_id: str):
+    """Get the status of an ingestion job.
+    
+    Args:
+        job_id: Job identifier returned by `/ingest`
+        
+    Returns:
+        Job status record (queued, running, completed, failed or cancelled)
+    """
+    job = ingest_queue.get(job_id) if ingest_queue else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "backend.main:app",
-        host=config.api_host,
-        port=config.api_port,
-        reload=config.api_reload
-    )
+    if config.env == "prod":
+        if config.api_workers > 1 and config.sessions.backend == "memory":
+            raise SystemExit(
+                f"Refusing to start {config.api_workers} workers with SESSION_BACKEND=memory: "
+                "each worker would keep its own conversations. Set SESSION_BACKEND=redis "
+                "or API_WORKERS=1."
+            )
+        if config.api_workers > 1 and config.ingest.enabled:
+            raise SystemExit(
+                f"Refusing to start {config.api_workers} workers with INGEST_QUEUE enabled: "
+                "job status and index refreshes are per process. Set INGEST_QUEUE=0 "
+                "or API_WORKERS=1."
+            )
+        # uvloop event loop, httptools parser, API_WORKERS processes, no reloader
+        uvicorn.run(
+            "backend.main:app",
+            host=config.api_host,
+            port=config.api_port,
+            loop="uvloop",
+            http="httptools",
+            workers=config.api_workers,
+            reload=False
+        )
+    else:
+        uvicorn.run(
+            "backend.main:app",
+            host=config.api_host,
+            port=config.api_port,
+            reload=config.api_reload
+        )
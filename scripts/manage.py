@@ -4,6 +4,7 @@
 Provides commands for ingestion, testing, and maintenance.
 """
 import argparse
+import os
 import sys
 from pathlib import Path
 
@@ -13,12 +14,30 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.config import config
 from src.logging_config import setup_logging
 from src.orchestrator.ingest import ingest_from_directory
-from src.orchestrator.retriever import get_retriever
+from src.orchestrator.retriever import get_retriever, batch_get_relevant_documents
 from src.orchestrator.agents import SupportOrchestrator
 
 logger = setup_logging(config.log_level)
 
 
+def _build_orchestrator(args):
+    """Create the retriever and orchestrator for the requested mode."""
+    if args.mode == "hf":
+        if config.model.hf_token:
+            os.environ["HUGGINGFACEHUB_API_TOKEN"] = config.model.hf_token
+        if config.model.hf_model:
+            os.environ["HUGGINGFACE_MODEL"] = config.model.hf_model
+    
+    retriever = get_retriever(persist_directory=args.persist_dir)
+    orchestrator = SupportOrchestrator(retriever=retriever, mode=args.mode)
+    
+    judge_path = Path(config.orchestrator.judge_model_path)
+    if judge_path.exists():
+        from src.orchestrator.judge import JudgeClassifier
+        orchestrator.attach_judge(JudgeClassifier.load(str(judge_path)), retriever.embeddings)
+    return retriever, orchestrator
+
+
 def cmd_ingest(args):
     """Ingest documents into the vector store."""
     logger.info(f"Ingesting documents from: {args.data_dir}")
@@ -41,18 +60,14 @@ def cmd_query(args):
     logger.info(f"Processing query: {args.query}")
     
     try:
-        retriever = get_retriever(persist_directory=args.persist_dir)
-        orchestrator = SupportOrchestrator(
-            retriever=retriever,
-            mode=args.mode,
-            hf_token=config.model.hf_token,
-            hf_model=config.model.hf_model
-        )
+        retriever, orchestrator = _build_orchestrator(args)
         
-        # Get answer
-        answer = orchestrator.answer(args.query)
-        confidence = orchestrator.classify_confidence(args.query, answer)
-        should_escalate = orchestrator.should_escalate(args.query, answer)
+        # Get answer, confidence and escalation in one call
+        docs = retriever.get_relevant_documents(args.query)
+        judgment = orchestrator.answer_with_judgment(args.query, docs)
+        answer = judgment["answer"]
+        confidence = judgment["confidence"]
+        should_escalate = judgment["escalate"]
         
         # Display results
         print("\n" + "="*60)
@@ -68,7 +83,6 @@ def cmd_query(args):
             print("\n" + "-"*60)
             print("RETRIEVED DOCUMENTS:")
             print("-"*60)
-            docs = retriever.get_relevant_documents(args.query)
             for i, doc in enumerate(docs[:args.top_k], 1):
                 print(f"\n[{i}] {doc.metadata.get('source', 'unknown')}")
                 print(doc.page_content[:200] + "...")
@@ -92,22 +106,18 @@ def cmd_test(args):
     ]
     
     try:
-        retriever = get_retriever(persist_directory=args.persist_dir)
-        orchestrator = SupportOrchestrator(
-            retriever=retriever,
-            mode=args.mode,
-            hf_token=config.model.hf_token,
-            hf_model=config.model.hf_model
-        )
+        retriever, orchestrator = _build_orchestrator(args)
+        
+        # One embedding pass and one vector search for all test queries
+        docs_per_query = batch_get_relevant_documents(retriever, test_queries)
+        judgments = orchestrator.answer_with_judgment_batch(test_queries, docs_per_query)
         
         results = []
-        for query in test_queries:
-            answer = orchestrator.answer(query)
-            confidence = orchestrator.classify_confidence(query, answer)
+        for query, judgment in zip(test_queries, judgments):
             results.append({
                 "query": query,
-                "answer_length": len(answer),
-                "confidence": confidence
+                "answer_length": len(judgment["answer"]),
+                "confidence": judgment["confidence"]
             })
         
         # Display summary
@@ -130,6 +140,28 @@ def cmd_test(args):
         sys.exit(1)
 
 
+def cmd_train_judge(args):
+    """Train the confidence/escalation judge from collected feedback."""
+    from src.orchestrator.embeddings import HuggingFaceEmbeddings
+    from src.orchestrator.feedback import FeedbackCollector
+    from src.orchestrator.judge import train_judge
+    
+    try:
+        feedback = FeedbackCollector(args.feedback_file).get_all_feedback()
+        logger.info(f"Training judge on {len(feedback)} feedback entries")
+        
+        judge = train_judge(feedback, HuggingFaceEmbeddings(), min_examples=args.min_examples)
+        if judge is None:
+            logger.error("❌ Not enough rated feedback (need both good and bad ratings)")
+            sys.exit(1)
+        
+        judge.save(args.output)
+        logger.info(f"✅ Judge saved to {args.output}")
+    except Exception as e:
+        logger.error(f"❌ Judge training failed: {e}")
+        sys.exit(1)
+
+
 def cmd_clear(args):
     """Clear the vector store."""
     import shutil
@@ -230,6 +262,12 @@ def main():
     test_parser.add_argument("--mode", choices=["local", "hf"], default=config.model.mode, help="LLM mode")
     test_parser.add_argument("--persist-dir", default=config.vector_store.persist_directory, help="Vector store directory")
     
+    # Train judge command
+    judge_parser = subparsers.add_parser("train-judge", help="Train the answer judge from feedback")
+    judge_parser.add_argument("--feedback-file", default="data/feedback.jsonl", help="Feedback JSONL file")
+    judge_parser.add_argument("--output", default=config.orchestrator.judge_model_path, help="Output weights file")
+    judge_parser.add_argument("--min-examples", type=int, default=20, help="Minimum rated examples")
+    
     # Clear command
     clear_parser = subparsers.add_parser("clear", help="Clear vector store")
     clear_parser.add_argument("--persist-dir", default=config.vector_store.persist_directory, help="Vector store directory")
@@ -249,6 +287,7 @@ def main():
         "ingest": cmd_ingest,
         "query": cmd_query,
         "test": cmd_test,
+        "train-judge": cmd_train_judge,
         "clear": cmd_clear,
         "info": cmd_info
     }
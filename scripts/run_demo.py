@@ -18,17 +18,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from src.orchestrator.ingest import ingest_from_directory
-from src.orchestrator.retriever import get_retriever
-from src.orchestrator.agents import SupportOrchestrator, EscalationAgent, MockLLM
-from src.orchestrator.local_retriever import LocalRetriever
-
-try:
-    from src.orchestrator.graph import run_support_workflow, _LANGGRAPH_AVAILABLE
-except Exception:
-    run_support_workflow = None
-    _LANGGRAPH_AVAILABLE = False
-
+# Orchestrator modules are imported where they are used: Chroma,
+# sentence-transformers and LangGraph are only loaded by the paths that need them.
 
 
 def main():
@@ -38,6 +29,7 @@ def main():
     parser.add_argument("--mode", type=str, choices=["local", "hf"], default="local", help="Mode to run the demo in: local or hf (Hugging Face)")
     parser.add_argument("--persist", type=str, default=".chroma", help="Chroma persistence directory")
     parser.add_argument("--graph", action="store_true", help="Use LangGraph workflow (if available)")
+    parser.add_argument("--batch-size", type=int, default=250, help="Chunks embedded and written to Chroma per batch")
     args = parser.parse_args()
 
     # Mode-specific warnings about missing API keys
@@ -48,20 +40,31 @@ def main():
         if args.mode == "local":
             print("Local mode: no external embeddings will be created — nothing to persist.")
         else:
+            from src.orchestrator.ingest import ingest_from_directory
             print("Ingesting data into Chroma (this may take a moment)...")
-            ingest_from_directory(data_dir="examples/data", persist_directory=args.persist)
+            ingest_from_directory(data_dir="examples/data", persist_directory=args.persist, batch_size=args.batch_size)
             print("Ingest complete. Persisted to", args.persist)
 
     if args.query:
+        from src.orchestrator.agents import SupportOrchestrator, EscalationAgent, MockLLM
+
         if args.mode == "local":
+            from src.orchestrator.local_retriever import LocalRetriever
             retriever = LocalRetriever(data_dir="examples/data")
         else:
+            from src.orchestrator.retriever import get_retriever
             retriever = get_retriever(persist_directory=args.persist)
 
         llm = MockLLM()
         
         # Use LangGraph workflow if requested and available
         if args.graph:
+            try:
+                from src.orchestrator.graph import run_support_workflow, _LANGGRAPH_AVAILABLE
+            except Exception:
+                run_support_workflow = None
+                _LANGGRAPH_AVAILABLE = False
+
             if _LANGGRAPH_AVAILABLE and run_support_workflow:
                 print("Running LangGraph workflow...")
                 result = run_support_workflow(args.query, retriever, llm)
@@ -86,7 +89,7 @@ def main():
         if not args.graph:
             orchestrator = SupportOrchestrator(retriever, mode=args.mode)
             print("Query:", args.query)
-            result = orchestrator.answer(args.query)
+            result = orchestrator.answer_with_judgment(args.query)
             print("Answer:\n", result["answer"])
             if result.get("escalate"):
                 print("Confidence low — creating escalation ticket...")
@@ -1,16 +1,32 @@
 """Configuration management for the Customer Support Orchestrator."""
+import functools
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 from dataclasses import dataclass, field
 
 
+# Environment overrides, read once at import: the environment of a running
+# process does not change, so configs never need to poll it again.
+_ENV_APP_ENV = os.getenv("APP_ENV")
+_ENV_LLM_MODE = os.getenv("LLM_MODE")
+_ENV_HF_MODEL = os.getenv("HF_MODEL")
+_ENV_HF_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN", "")
+_ENV_LOG_LEVEL = os.getenv("LOG_LEVEL")
+_ENV_CACHE_BACKEND = os.getenv("CACHE_BACKEND")
+_ENV_REDIS_URL = os.getenv("REDIS_URL")
+_ENV_SESSION_BACKEND = os.getenv("SESSION_BACKEND")
+_ENV_ANN_INDEX = os.getenv("ANN_INDEX")
+_ENV_API_WORKERS = os.getenv("API_WORKERS")
+_ENV_INGEST_QUEUE = os.getenv("INGEST_QUEUE")
+
+
 @dataclass
 class ModelConfig:
     """LLM and embedding model configuration."""
     mode: Literal["local", "hf"] = "local"
     hf_model: str = "google/flan-t5-base"
-    hf_token: str = field(default_factory=lambda: os.getenv("HUGGINGFACE_API_TOKEN", ""))
+    hf_token: str = _ENV_HF_TOKEN
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
     temperature: float = 0.7
     max_tokens: int = 512
@@ -24,6 +40,18 @@ class VectorStoreConfig:
     chunk_size: int = 500
     chunk_overlap: int = 50
     top_k: int = 3
+    ann_profile: Literal["fast", "balanced", "recall"] = "balanced"
+    ann_index: Literal["chroma", "faiss"] = "faiss"  # "faiss" builds an in-process index at startup when installed
+    faiss_index_type: Literal["auto", "flat", "hnsw", "ivfpq"] = "auto"  # auto: exact flat up to flat_max_vectors, else HNSW
+    flat_max_vectors: int = 20_000
+    faiss_cache_dir: str = ".chroma/faiss"  # built indexes are reused from here while the collection is unchanged ("" = off)
+    hnsw_m: int = 32  # HNSW graph degree, fixed at build time; ann_profile only changes ef_search/nprobe
+    hnsw_ef_construction: int = 200
+    quantization: Literal["none", "int8", "fp16"] = "int8"  # in-process index vector storage
+    rerank_factor: int = 0  # over-fetch factor for exact reranking of ANN candidates (0 = off); keeps a float32 copy of the vectors, memory-mapped from faiss_cache_dir
+    retrieval_cache_size: int = 1024  # cached retriever results (0 = off)
+    retrieval_semantic_threshold: float = 0.97  # query similarity for reusing cached results
+    scope_threshold: Optional[float] = None  # min query cosine to the corpus centroid; lower is refused without retrieval or the LLM. Off until tuned on your KB (see README)
 
 
 @dataclass
@@ -35,6 +63,47 @@ class OrchestatorConfig:
     ])
     max_retries: int = 3
     timeout_seconds: int = 30
+    grade_documents: bool = False  # Grade retrieved docs in one LLM call and keep the best
+    graded_top_n: int = 3
+    judge_model_path: str = "models/judge.npz"  # written by `manage.py train-judge`
+
+
+@dataclass
+class BatchConfig:
+    """Micro-batching configuration for the query path."""
+    max_batch_size: int = 8
+    max_wait_ms: float = 10.0
+
+
+@dataclass
+class CacheConfig:
+    """Query cache configuration."""
+    backend: Literal["memory", "redis"] = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    ttl_minutes: int = 60
+    max_size: int = 500
+    semantic: bool = False  # also serve paraphrases of cached queries; enable once semantic_threshold is tuned on real traffic
+    semantic_threshold: float = 0.95  # minimum query cosine similarity for a hit
+    semantic_safe_radius: float = 0.01  # refuse hits that are this close to a different cached query
+
+
+@dataclass
+class SessionConfig:
+    """Conversation session store configuration."""
+    backend: Literal["memory", "redis"] = "memory"  # redis shares sessions across workers (uses cache.redis_url)
+    max_sessions: int = 10_000
+    ttl_seconds: int = 3600
+    purge_interval_seconds: int = 60
+
+
+@dataclass
+class IngestConfig:
+    """Background ingestion worker configuration."""
+    # Serve /ingest; job records and index refreshes are per API process,
+    # so the queue only works with a single API worker
+    enabled: bool = True
+    max_workers: int = 1
+    max_tracked_jobs: int = 100
 
 
 @dataclass
@@ -48,11 +117,23 @@ class AppConfig:
     model: ModelConfig = field(default_factory=ModelConfig)
     vector_store: VectorStoreConfig = field(default_factory=VectorStoreConfig)
     orchestrator: OrchestatorConfig = field(default_factory=OrchestatorConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    batching: BatchConfig = field(default_factory=BatchConfig)
+    sessions: SessionConfig = field(default_factory=SessionConfig)
+    ingest: IngestConfig = field(default_factory=IngestConfig)
+    
+    # Deployment environment: "dev" or "prod"
+    env: str = "dev"
+    
+    # Run a dummy query at startup to load models before the first request
+    warmup_on_startup: bool = True
     
     # API settings
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     api_reload: bool = True
+    # Uvicorn worker processes in prod; more than one needs the redis session backend
+    api_workers: int = 1
     
     # Logging
     log_level: str = "INFO"
@@ -62,13 +143,27 @@ class AppConfig:
         """Initialize derived paths."""
         self.data_dir = self.project_root / "examples" / "data"
         
-        # Load from environment if available
-        if mode := os.getenv("LLM_MODE"):
-            self.model.mode = mode
-        if hf_model := os.getenv("HF_MODEL"):
-            self.model.hf_model = hf_model
-        if log_level := os.getenv("LOG_LEVEL"):
-            self.log_level = log_level
+        # Apply environment overrides if available
+        if _ENV_APP_ENV:
+            self.env = _ENV_APP_ENV
+        if _ENV_LLM_MODE:
+            self.model.mode = _ENV_LLM_MODE
+        if _ENV_HF_MODEL:
+            self.model.hf_model = _ENV_HF_MODEL
+        if _ENV_LOG_LEVEL:
+            self.log_level = _ENV_LOG_LEVEL
+        if _ENV_CACHE_BACKEND:
+            self.cache.backend = _ENV_CACHE_BACKEND
+        if _ENV_REDIS_URL:
+            self.cache.redis_url = _ENV_REDIS_URL
+        if _ENV_SESSION_BACKEND:
+            self.sessions.backend = _ENV_SESSION_BACKEND
+        if _ENV_ANN_INDEX:
+            self.vector_store.ann_index = _ENV_ANN_INDEX
+        if _ENV_API_WORKERS:
+            self.api_workers = int(_ENV_API_WORKERS)
+        if _ENV_INGEST_QUEUE:
+            self.ingest.enabled = _ENV_INGEST_QUEUE.lower() in ("1", "true", "yes")
     
     def validate(self) -> list[str]:
         """Validate configuration and return list of issues."""
@@ -83,8 +178,30 @@ class AppConfig:
         if self.orchestrator.confidence_threshold < 0 or self.orchestrator.confidence_threshold > 1:
             issues.append("Confidence threshold must be between 0 and 1")
         
+        if self.api_workers < 1:
+            issues.append("API_WORKERS must be at least 1")
+        
+        if self.env == "prod" and self.api_workers > 1 and self.sessions.backend == "memory":
+            issues.append(
+                "API_WORKERS > 1 with SESSION_BACKEND=memory splits conversations across "
+                "workers; use SESSION_BACKEND=redis"
+            )
+        
+        if self.env == "prod" and self.api_workers > 1 and self.ingest.enabled:
+            issues.append(
+                "API_WORKERS > 1 with INGEST_QUEUE enabled: job status and index refreshes "
+                "stay in the worker that ran the job; set INGEST_QUEUE=0 and ingest with "
+                "scripts/manage.py"
+            )
+        
         return issues
 
 
+@functools.lru_cache(maxsize=None)
+def get_config() -> AppConfig:
+    """Get the process-wide configuration, built on first use."""
+    return AppConfig()
+
+
 # Global config instance
-config = AppConfig()
+config = get_config()
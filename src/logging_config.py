@@ -4,6 +4,18 @@ import sys
 from pathlib import Path
 from datetime import datetime
 
+_CONSOLE_FORMAT = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+_FILE_FORMAT = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# (log_level, log_file) the logger is currently configured with
+_configured_for = None
+
 
 def setup_logging(log_level: str = "INFO", log_file: str = None) -> logging.Logger:
     """Configure application logging.
@@ -14,22 +26,29 @@ def setup_logging(log_level: str = "INFO", log_file: str = None) -> logging.Logg
     
     Returns:
         Configured logger instance
+    
+    Calling it again with the same settings returns the already configured
+    logger instead of rebuilding its handlers.
     """
+    global _configured_for
+    
     # Create logger
     logger = logging.getLogger("customer_support")
+    key = (log_level.upper(), log_file)
+    if _configured_for == key and logger.handlers:
+        return logger
+    
     logger.setLevel(getattr(logging, log_level.upper()))
     
-    # Remove existing handlers
-    logger.handlers.clear()
+    # Remove existing handlers, closing any open log files
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
     
     # Console handler with formatting
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(console_format)
+    console_handler.setFormatter(_CONSOLE_FORMAT)
     logger.addHandler(console_handler)
     
     # File handler if specified
@@ -39,24 +58,29 @@ def setup_logging(log_level: str = "INFO", log_file: str = None) -> logging.Logg
         
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(logging.DEBUG)
-        file_format = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_format)
+        file_handler.setFormatter(_FILE_FORMAT)
         logger.addHandler(file_handler)
     
+    _configured_for = key
     return logger
 
 
 def log_query_metrics(logger: logging.Logger, query: str, response: str, 
                       retrieval_time: float, generation_time: float, 
                       num_docs: int, confidence: float):
-    """Log query processing metrics."""
+    """Log query processing metrics.
+    
+    Formatting is deferred to the logging framework, so nothing is formatted
+    when INFO is disabled. The raw values are also attached as record
+    attributes for structured (e.g. JSON) handlers.
+    """
     logger.info(
-        f"Query processed | "
-        f"retrieval={retrieval_time:.3f}s | "
-        f"generation={generation_time:.3f}s | "
-        f"docs={num_docs} | "
-        f"confidence={confidence:.2f}"
+        "Query processed | retrieval=%.3fs | generation=%.3fs | docs=%d | confidence=%.2f",
+        retrieval_time, generation_time, num_docs, confidence,
+        extra={
+            "retrieval_ms": retrieval_time * 1000,
+            "generation_ms": generation_time * 1000,
+            "num_docs": num_docs,
+            "confidence": confidence
+        }
     )
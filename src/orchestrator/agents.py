@@ -1,15 +1,115 @@
-from typing import Optional
+import asyncio
+import functools
+import json
+import re
+from typing import AsyncIterator, List, Optional, Tuple
 
 try:
-    from langchain.chains import RetrievalQA
+    import ahocorasick
+    _AHOCORASICK_AVAILABLE = True
 except Exception:
-    RetrievalQA = None
-try:
-    from langchain.llms import HuggingFaceHub
-except Exception:
-    HuggingFaceHub = None
+    ahocorasick = None
+    _AHOCORASICK_AVAILABLE = False
 import os
 
+# Same wording as LangChain's default "stuff" QA prompt used by RetrievalQA.
+_QA_PROMPT = (
+    "Use the following pieces of context to answer the question at the end. "
+    "If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n"
+    "{context}\n\n"
+    "Question: {question}\n"
+    "Helpful Answer:"
+)
+
+# Asks for the answer and its self-assessment in a single generation.
+_JUDGED_QA_PROMPT = (
+    "Use the following pieces of context to answer the question at the end. "
+    "If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n"
+    "{context}\n\n"
+    "Question: {question}\n\n"
+    "Respond with only a JSON object of the form "
+    '{{"answer": "<your answer>", "confidence": <number between 0 and 1>, '
+    '"escalate": <true if a human agent should take over, else false>}}\n'
+    "JSON:"
+)
+
+# Grades every retrieved chunk in one prompt instead of one call per chunk.
+_GRADE_DOCS_PROMPT = (
+    "Rate how relevant each numbered document is to the question, "
+    "from 0 (irrelevant) to 1 (fully answers it).\n\n"
+    "{documents}\n\n"
+    "Question: {question}\n\n"
+    "Respond with only a JSON array of {count} numbers, one score per document in order.\n"
+    "Scores:"
+)
+
+
+def _split_qa_template(template: str) -> Tuple[str, str, str]:
+    """Split a QA template into the literal text around `{context}` and `{question}`.
+
+    The instructions before `{context}` are identical for every query, so
+    prompts always start with the same bytes and endpoints with prefix
+    caching reuse that part of the prompt across queries.
+    """
+    head, rest = template.split("{context}")
+    middle, tail = rest.split("{question}")
+    # format() with no arguments only unescapes the doubled braces
+    return head.format(), middle.format(), tail.format()
+
+
+# Built once so each prompt is a concatenation rather than a template scan
+_QA_PROMPT_PARTS = {template: _split_qa_template(template) for template in (_QA_PROMPT, _JUDGED_QA_PROMPT)}
+
+_JSON_ARRAY_RE = re.compile(r"\[.*?\]", re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+_ANSWER_FIELD_RE = re.compile(r'"answer"\s*:\s*"((?:[^"\\]|\\.)*)"', re.DOTALL)
+_CONFIDENCE_FIELD_RE = re.compile(r'"confidence"\s*:\s*([0-9]*\.?[0-9]+)')
+_ESCALATE_FIELD_RE = re.compile(r'"escalate"\s*:\s*(true|false)', re.IGNORECASE)
+
+# Whitespace runs containing a line break: lines are stripped and blank lines dropped
+_LINE_BREAK_RE = re.compile(r"\s*\n\s*")
+# Longest prefix of the first 600 characters ending in a period past index 300
+_SENTENCE_END_RE = re.compile(r".{301,599}\.", re.DOTALL)
+
+# Phrase lists for the confidence/escalation heuristics, built once at import.
+# Matching is by substring, so "managers" and "legal," still count.
+_UNCERTAINTY_PHRASES = frozenset(("i don't know", "i'm not sure", "unclear", "not able to find"))
+_SOURCE_PHRASES = frozenset(("based on", "according to"))
+_URGENT_KEYWORDS = frozenset(("manager", "supervisor", "urgent", "complaint", "legal", "lawsuit"))
+
+
+def _phrase_union(phrases) -> "re.Pattern":
+    """One alternation matching any of the phrases as a substring."""
+    # Longest first so a phrase is never shadowed by its own prefix
+    return re.compile("|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True)))
+
+
+_UNCERTAINTY_RE = _phrase_union(_UNCERTAINTY_PHRASES)
+_SOURCE_RE = _phrase_union(_SOURCE_PHRASES)
+_URGENT_RE = _phrase_union(_URGENT_KEYWORDS)
+
+
+_OUT_OF_SCOPE_MESSAGE = (
+    "I'm a customer support assistant and can only help with questions related to our service. "
+    "This query appears to be outside my area of expertise. "
+    "Please ask questions about:\n"
+    "- Account management and login issues\n"
+    "- Billing, payments, and subscriptions\n"
+    "- Technical problems and troubleshooting\n"
+    "- Product features and how to use them\n"
+    "- Data privacy and security\n"
+    "- Contacting our support team\n\n"
+    "How can I help you with your account or our services today?"
+)
+
+
+def _content_lower(doc) -> str:
+    """Lowercased document text, using the copy cached on the document when present."""
+    cached = getattr(doc, "content_lower", None)
+    if isinstance(cached, str):
+        return cached
+    return getattr(doc, "page_content", str(doc)).lower()
+
 
 class MockLLM:
     """Enhanced LLM that generates query-specific answers from retrieved documents.
@@ -48,31 +148,78 @@ class MockLLM:
             'address', 'office', 'response time'
         ]
         
-    def is_relevant_query(self, query: str) -> bool:
-        """Check if query is relevant to customer support domain.
-        
-        Returns True if query appears to be support-related, False otherwise.
-        """
-        query_lower = query.lower()
-        
-        # Check if query contains any support-related keywords
-        keyword_matches = sum(1 for keyword in self.support_keywords if keyword in query_lower)
-        
-        # Check for common question words that might indicate a support query
-        question_patterns = [
+        # Common question words that might indicate a support query
+        self.question_patterns = [
             'how do i', 'how can i', 'how to', 'what is', 'where is', 'when',
             'why', 'can i', 'do you', 'does', 'is there', 'are there'
         ]
-        has_question_pattern = any(pattern in query_lower for pattern in question_patterns)
         
         # Out-of-scope indicators (queries clearly not about customer support)
-        out_of_scope_indicators = [
+        self.out_of_scope_indicators = [
             'weather', 'joke', 'story', 'recipe', 'restaurant', 'movie', 'music',
             'sports', 'news', 'stock', 'celebrity', 'game', 'what time is it',
             'temperature', 'forecast', 'capital of', 'who is', 'when was',
             'calculate', 'math', 'translate', 'definition of'
         ]
-        has_out_of_scope = any(indicator in query_lower for indicator in out_of_scope_indicators)
+        
+        self._automaton = self._build_automaton() if _AHOCORASICK_AVAILABLE else None
+        
+        # Memoized per instance: both depend on the phrase lists above
+        self._relevance = functools.lru_cache(maxsize=2048)(self._compute_relevance)
+        self._best_doc_index = functools.lru_cache(maxsize=2048)(self._compute_best_doc_index)
+    
+    def _build_automaton(self):
+        """Compile every phrase list into one Aho-Corasick automaton.
+        
+        Each phrase maps to its kind and how often it appears in its list, so
+        a duplicated keyword still counts once per listing.
+        """
+        automaton = ahocorasick.Automaton()
+        for kind, phrases in (('support', self.support_keywords),
+                              ('q', self.question_patterns),
+                              ('oos', self.out_of_scope_indicators)):
+            for phrase in set(phrases):
+                key = (kind, phrase)
+                if automaton.exists(phrase):
+                    automaton.add_word(phrase, automaton.get(phrase) + ((key, phrases.count(phrase)),))
+                else:
+                    automaton.add_word(phrase, ((key, phrases.count(phrase)),))
+        automaton.make_automaton()
+        return automaton
+    
+    def _match_phrases(self, query_lower: str):
+        """Count support keywords and detect question / out-of-scope phrases.
+        
+        Returns:
+            Tuple of (keyword_matches, has_question_pattern, has_out_of_scope)
+        """
+        if self._automaton is None:
+            keyword_matches = sum(1 for keyword in self.support_keywords if keyword in query_lower)
+            has_question_pattern = any(pattern in query_lower for pattern in self.question_patterns)
+            has_out_of_scope = any(indicator in query_lower for indicator in self.out_of_scope_indicators)
+            return keyword_matches, has_question_pattern, has_out_of_scope
+        
+        # One pass over the query; a phrase seen several times still counts once
+        hits = {}
+        for _, entries in self._automaton.iter(query_lower):
+            for key, count in entries:
+                hits[key] = count
+        keyword_matches = sum(count for (kind, _), count in hits.items() if kind == 'support')
+        has_question_pattern = any(kind == 'q' for kind, _ in hits)
+        has_out_of_scope = any(kind == 'oos' for kind, _ in hits)
+        return keyword_matches, has_question_pattern, has_out_of_scope
+        
+    def is_relevant_query(self, query: str, query_lower: Optional[str] = None) -> bool:
+        """Check if query is relevant to customer support domain.
+        
+        Returns True if query appears to be support-related, False otherwise.
+        """
+        if query_lower is None:
+            query_lower = query.lower()
+        return self._relevance(query_lower)
+    
+    def _compute_relevance(self, query_lower: str) -> bool:
+        keyword_matches, has_question_pattern, has_out_of_scope = self._match_phrases(query_lower)
         
         # Query is relevant if:
         # - Has at least 2 keyword matches, OR
@@ -82,53 +229,43 @@ class MockLLM:
         
         return is_relevant
 
-    def generate_answer(self, query: str, docs: list) -> str:
+    def generate_answer(self, query: str, docs: list, query_lower: Optional[str] = None) -> str:
+        if query_lower is None:
+            query_lower = query.lower()
+        
         # First, check if query is relevant to customer support
-        if not self.is_relevant_query(query):
-            return ("I'm a customer support assistant and can only help with questions related to our service. "
-                    "This query appears to be outside my area of expertise. "
-                    "Please ask questions about:\n"
-                    "- Account management and login issues\n"
-                    "- Billing, payments, and subscriptions\n"
-                    "- Technical problems and troubleshooting\n"
-                    "- Product features and how to use them\n"
-                    "- Data privacy and security\n"
-                    "- Contacting our support team\n\n"
-                    "How can I help you with your account or our services today?")
+        if not self.is_relevant_query(query, query_lower):
+            return _OUT_OF_SCOPE_MESSAGE
         
         if not docs:
             return "I don't have information about that in my knowledge base. Please contact our support team for assistance."
         
-        query_lower = query.lower()
-        
-        # Find most relevant document based on query keywords
-        best_doc = docs[0]
-        best_score = 0
-        
-        for doc in docs[:3]:
-            content_lower = doc.page_content.lower()
-            keywords = [w for w in query_lower.split() if len(w) > 3]
-            score = sum(1 for kw in keywords if kw in content_lower)
-            if score > best_score:
-                best_score = score
-                best_doc = doc
-        
-        # Get the content
-        content = best_doc.page_content.strip()
+        # Find most relevant document based on query keywords; keyed on the
+        # texts themselves so a repeated (query, docs) pair skips the scan
+        best_doc = docs[self._best_doc_index(query_lower, tuple(_content_lower(doc) for doc in docs[:3]))]
         
         # Clean up the content - remove excessive newlines but keep structure
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        content = '\n\n'.join(lines)
+        content = _LINE_BREAK_RE.sub('\n\n', best_doc.page_content.strip())
         
         # Limit length but try to keep complete sentences
         if len(content) > 600:
-            content = content[:600]
-            # Try to end at a sentence
-            last_period = content.rfind('.')
-            if last_period > 300:
-                content = content[:last_period + 1]
+            match = _SENTENCE_END_RE.match(content, 0, 600)
+            content = match.group(0) if match else content[:600]
         
         return content
+    
+    def _compute_best_doc_index(self, query_lower: str, contents_lower: tuple) -> int:
+        """Index of the text containing the most longer query words (first wins ties)."""
+        best_index = 0
+        best_score = 0
+        keywords = [w for w in query_lower.split() if len(w) > 3]
+        
+        for i, content_lower in enumerate(contents_lower):
+            score = sum(1 for kw in keywords if kw in content_lower)
+            if score > best_score:
+                best_score = score
+                best_index = i
+        return best_index
 
 
 class SupportOrchestrator:
@@ -142,38 +279,415 @@ class SupportOrchestrator:
         self.retriever = retriever
         self.mode = mode
         self.llm = llm
+        self.async_llm = None  # `HFInferenceClient` used by async paths in hf mode when httpx is installed
         if self.mode == "local":
             self.llm = MockLLM()
         elif self.mode == "hf":
+            # Imported here so local mode never pays for loading LangChain
+            try:
+                from langchain.llms import HuggingFaceHub
+            except Exception:
+                HuggingFaceHub = None
             if HuggingFaceHub is not None:
                 hf_token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HUGGINGFACE_API_KEY")
                 model = os.getenv("HUGGINGFACE_MODEL", "google/flan-t5-small")
                 if not hf_token:
                     raise RuntimeError("Hugging Face API token not set. Set HUGGINGFACEHUB_API_TOKEN or HUGGINGFACE_API_KEY in env")
-                # LangChain's HuggingFaceHub expects `repo_id` and `huggingfacehub_api_token`
-                self.llm = HuggingFaceHub(repo_id=model, huggingfacehub_api_token=hf_token)
+                # LangChain's HuggingFaceHub expects `repo_id` and `huggingfacehub_api_token`;
+                # greedy decoding keeps answers reproducible, and so cacheable
+                self.llm = HuggingFaceHub(repo_id=model, huggingfacehub_api_token=hf_token,
+                                          model_kwargs={"do_sample": False})
+                # Async callers post directly over a shared connection pool
+                from .llm_client import _HTTPX_AVAILABLE, HFInferenceClient
+                if _HTTPX_AVAILABLE:
+                    self.async_llm = HFInferenceClient(model, hf_token, {"do_sample": False})
             else:
                 raise RuntimeError("HuggingFaceHub LLM not available in this environment. Install compatible langchain or run in local mode.")
 
-        self.escalate_phrases = escalate_phrases or ["i don't know", "i am not sure", "i'm not sure"]
+        self.escalate_phrases = frozenset(escalate_phrases or ["i don't know", "i am not sure", "i'm not sure"])
+        self._escalate_re = _phrase_union(self.escalate_phrases)
+        self.judge = None
+        self.judge_embeddings = None
+
+    def attach_judge(self, judge, embeddings):
+        """Score answers with a learned `JudgeClassifier` instead of the heuristics.
+
+        Args:
+            judge: Trained `JudgeClassifier`
+            embeddings: Embeddings the judge was trained with (`embed_documents`)
+        """
+        self.judge = judge
+        self.judge_embeddings = embeddings
 
     def answer(self, query: str) -> str:
         """Generate an answer to the query.
         
         Returns just the answer text string for compatibility with backend.
         """
+        if self._scope_check_enabled():
+            return self.answer_with_embedding(query, self.retriever.embed_query(query))
+        docs = self.retriever.get_relevant_documents(query)
+        return self.answer_batch([query], [docs])[0]
+
+    def answer_with_embedding(self, query: str, query_vec) -> str:
+        """Answer a query whose embedding was already computed, e.g. in a batch.
+
+        Retrievers that accept vectors search with `query_vec` directly and
+        skip embedding the query; others fall back to `answer`. Queries the
+        retriever reports as out of scope are refused without retrieval.
+        """
+        if self.is_out_of_scope(query_vec):
+            return _OUT_OF_SCOPE_MESSAGE
+        if not hasattr(self.retriever, "get_relevant_documents_with_vector"):
+            return self.answer(query)
+        docs = self.retriever.get_relevant_documents_with_vector(query_vec)
+        return self.answer_batch([query], [docs])[0]
+
+    async def aanswer(self, query: str, query_vec=None) -> str:
+        """Async `answer`, so many queries can be in flight at once.
+
+        Retrieval uses the retriever's coroutine when it has one and a worker
+        thread otherwise; with `query_vec` it searches with that embedding
+        like `answer_with_embedding`. In `hf` mode the prompt is posted from
+        the event loop by `async_llm`, else the LLM's `ainvoke` is awaited
+        when it exists; other LLMs generate in a worker thread.
+        """
+        query_vec = await self.aquery_vector(query, query_vec)
+        if self.is_out_of_scope(query_vec):
+            return _OUT_OF_SCOPE_MESSAGE
+        docs = await self._aretrieve(query, query_vec)
+        if self.mode != "local" and self.async_llm is not None:
+            return await self.async_llm.agenerate(self._build_prompt(query, docs))
+        if self.mode != "local" and hasattr(self.llm, "ainvoke"):
+            return str(await self.llm.ainvoke(self._build_prompt(query, docs)))
+        return (await asyncio.to_thread(self.answer_batch, [query], [docs]))[0]
+
+    async def astream(self, query: str, query_vec=None) -> AsyncIterator[str]:
+        """Retrieve like `aanswer`, then stream the answer with `astream_answer`.
+
+        Callers see the first tokens as soon as the LLM emits them instead of
+        waiting for the whole completion, and can stop iterating early.
+        """
+        query_vec = await self.aquery_vector(query, query_vec)
+        if self.is_out_of_scope(query_vec):
+            yield _OUT_OF_SCOPE_MESSAGE
+            return
+        docs = await self._aretrieve(query, query_vec)
+        async for chunk in self.astream_answer(query, docs, query_vec):
+            yield chunk
+
+    def _scope_check_enabled(self) -> bool:
+        return getattr(self.retriever, "centroid", None) is not None
+
+    def is_out_of_scope(self, query_vec) -> bool:
+        """Centroid pre-filter: a single dot product instead of retrieval and the LLM.
+
+        False when `query_vec` is None or the retriever has no centroid.
+        """
+        return query_vec is not None and self._scope_check_enabled() and self.retriever.is_out_of_scope(query_vec)
+
+    async def aquery_vector(self, query: str, query_vec=None):
+        """Embed the query for the scope check unless it is disabled or already embedded."""
+        if query_vec is None and self._scope_check_enabled():
+            return await self.retriever.aembed_query(query)
+        return query_vec
+
+    def out_of_scope_batch(self, queries: List[str]) -> List[bool]:
+        """`is_out_of_scope` for several queries, embedded in one call.
+
+        The embeddings go through the retriever's query LRU, so retrieving the
+        in-scope queries afterwards does not encode them again.
+        """
+        if not queries or not self._scope_check_enabled():
+            return [False] * len(queries)
+        vecs = self.retriever.embeddings.embed_query_vectors(queries)
+        return [self.is_out_of_scope(vec) for vec in vecs]
+
+    def refuse_batch(self, queries: List[str]) -> List[dict]:
+        """Judgments carrying the out-of-scope message, shaped like `answer_with_judgment_batch`."""
+        return self.judge_answers(queries, [_OUT_OF_SCOPE_MESSAGE] * len(queries))
+
+    async def _aretrieve(self, query: str, query_vec=None) -> list:
+        """Retrieve documents without blocking the event loop."""
+        if query_vec is not None and hasattr(self.retriever, "get_relevant_documents_with_vector"):
+            return await asyncio.to_thread(self.retriever.get_relevant_documents_with_vector, query_vec)
+        if hasattr(self.retriever, "abatch_get_relevant_documents"):
+            return (await self.retriever.abatch_get_relevant_documents([query]))[0]
+        return await asyncio.to_thread(self.retriever.get_relevant_documents, query)
+
+    def answer_batch(self, queries: List[str], docs_lists: List[list]) -> List[str]:
+        """Generate answers for several queries from already-retrieved documents.
+
+        In `hf` mode all prompts are submitted to the LLM in a single batched call.
+        """
         if self.mode == "local":
+            return [self.llm.generate_answer(q, docs) for q, docs in zip(queries, docs_lists)]
+
+        prompts = [self._build_prompt(q, docs) for q, docs in zip(queries, docs_lists)]
+        return self._generate(prompts)
+
+    def answer_with_judgment(self, query: str, docs: Optional[list] = None) -> dict:
+        """Answer a query and judge confidence/escalation in one LLM call.
+
+        Args:
+            query: User query
+            docs: Already-retrieved documents; retrieved here when omitted
+
+        Returns:
+            Dict with `answer`, `confidence` and `escalate`
+        """
+        if docs is None:
             docs = self.retriever.get_relevant_documents(query)
-            answer = self.llm.generate_answer(query, docs)
+        return self.answer_with_judgment_batch([query], [docs])[0]
+
+    def evaluate(self, query: str, query_vec=None) -> Tuple[str, float, bool]:
+        """Answer a query and score it in one pass.
+
+        Retrieval runs once and `answer_with_judgment_batch` produces the
+        answer, confidence and escalation together: one LLM call in `hf` mode,
+        one heuristic or judge pass over the answer in `local` mode. Queries
+        the retriever reports as out of scope are refused and scored without
+        retrieval.
+
+        Args:
+            query: User query
+            query_vec: Precomputed query embedding, if any
+
+        Returns:
+            Tuple of (answer, confidence, should_escalate)
+        """
+        if query_vec is None and self._scope_check_enabled():
+            query_vec = self.retriever.embed_query(query)
+        if self.is_out_of_scope(query_vec):
+            judgment = self.judge_answers([query], [_OUT_OF_SCOPE_MESSAGE])[0]
         else:
-            if RetrievalQA is None:
-                raise RuntimeError("RetrievalQA not available — ensure langchain and LLM are installed or use --mode local")
-            qa = RetrievalQA.from_chain_type(llm=self.llm, chain_type="stuff", retriever=self.retriever)
-            answer = qa.run(query)
-        
-        return answer
+            if query_vec is not None and hasattr(self.retriever, "get_relevant_documents_with_vector"):
+                docs = self.retriever.get_relevant_documents_with_vector(query_vec)
+            else:
+                docs = self.retriever.get_relevant_documents(query)
+            judgment = self.answer_with_judgment_batch([query], [docs])[0]
+        return judgment["answer"], float(judgment["confidence"]), bool(judgment["escalate"])
+
+    def answer_with_judgment_batch(self, queries: List[str], docs_lists: List[list]) -> List[dict]:
+        """Batched form of `answer_with_judgment`.
+
+        In `hf` mode the LLM returns `{answer, confidence, escalate}` as JSON for
+        each prompt. The local mock has no self-assessment, so the heuristics in
+        `classify_confidence` and `should_escalate` are applied to its answers.
+        """
+        if self.mode == "local":
+            return self.judge_answers(queries, self.answer_batch(queries, docs_lists))
+
+        prompts = [
+            self._build_prompt(q, docs, template=_JUDGED_QA_PROMPT)
+            for q, docs in zip(queries, docs_lists)
+        ]
+        return [self._parse_judgment(q, out) for q, out in zip(queries, self._generate(prompts))]
+
+    def grade_docs_batch(self, query: str, docs: list) -> List[float]:
+        """Score the relevance of all retrieved documents in a single LLM call.
+
+        Args:
+            query: User query
+            docs: Retrieved documents
+
+        Returns:
+            One score in [0, 1] per document, in input order
+        """
+        return self.grade_docs_batches([query], [docs])[0]
+
+    def grade_docs_batches(self, queries: List[str], docs_lists: List[list]) -> List[List[float]]:
+        """Grade the documents of several queries, one grading prompt per query.
+
+        In `local` mode, and whenever the LLM output cannot be parsed, documents
+        are scored by the fraction of query keywords they contain.
+        """
+        if self.mode == "local":
+            return [self._keyword_scores(q, docs) for q, docs in zip(queries, docs_lists)]
+
+        pending = [i for i, docs in enumerate(docs_lists) if docs]
+        outputs = self._generate([
+            self._build_grade_prompt(queries[i], docs_lists[i]) for i in pending
+        ]) if pending else []
+
+        scores = [[] for _ in docs_lists]
+        for i, text in zip(pending, outputs):
+            scores[i] = self._parse_grades(text, len(docs_lists[i])) \
+                or self._keyword_scores(queries[i], docs_lists[i])
+        return scores
+
+    def rerank_by_grade(self, queries: List[str], docs_lists: List[list], top_n: int = 3) -> List[list]:
+        """Keep the `top_n` best-graded documents per query, best first."""
+        reranked = []
+        for docs, scores in zip(docs_lists, self.grade_docs_batches(queries, docs_lists)):
+            order = sorted(range(len(docs)), key=lambda j: scores[j], reverse=True)
+            reranked.append([docs[j] for j in order[:top_n]])
+        return reranked
+
+    def _build_grade_prompt(self, query: str, docs: list) -> str:
+        """Number the documents and stuff them into the grading prompt."""
+        documents = "\n\n".join(
+            f"[{i}] {getattr(d, 'page_content', str(d))}" for i, d in enumerate(docs, 1)
+        )
+        return _GRADE_DOCS_PROMPT.format(documents=documents, question=query, count=len(docs))
+
+    @staticmethod
+    def _parse_grades(text: str, count: int) -> Optional[List[float]]:
+        """Parse the JSON score array, or return None if it is unusable."""
+        match = _JSON_ARRAY_RE.search(text)
+        if not match:
+            return None
+        try:
+            scores = [max(0.0, min(1.0, float(x))) for x in json.loads(match.group(0))]
+        except (TypeError, ValueError):
+            return None
+        return scores if len(scores) == count else None
+
+    @staticmethod
+    def _keyword_scores(query: str, docs: list) -> List[float]:
+        """Fraction of the query's longer words found in each document."""
+        keywords = [w for w in query.lower().split() if len(w) > 3]
+        if not keywords:
+            return [0.0] * len(docs)
+        scores = []
+        for doc in docs:
+            content_lower = _content_lower(doc)
+            scores.append(sum(1 for kw in keywords if kw in content_lower) / len(keywords))
+        return scores
+
+    def judge_answers(self, queries: List[str], answers: List[str]) -> List[dict]:
+        """Score confidence and escalation for already-generated answers.
+
+        Uses the attached judge when there is one (one embedding pass plus a dot
+        product per answer), otherwise `classify_confidence`/`should_escalate`.
+        The keyword escalation rules apply either way.
+        """
+        if self.judge is None:
+            judgments = []
+            for query, answer in zip(queries, answers):
+                answer_lower = answer.lower()
+                confidence = self.classify_confidence(query, answer, answer_lower)
+                judgments.append({
+                    "answer": answer,
+                    "confidence": confidence,
+                    "escalate": self.should_escalate(query, answer, confidence=confidence,
+                                                     answer_lower=answer_lower)
+                })
+            return judgments
+
+        texts = list(queries) + list(answers)
+        if hasattr(self.judge_embeddings, "embed_documents_array"):
+            vecs = self.judge_embeddings.embed_documents_array(texts)
+        else:
+            vecs = self.judge_embeddings.embed_documents(texts)
+        confidences = self.judge.predict(vecs[:len(queries)], vecs[len(queries):])
+        return [
+            {
+                "answer": answer,
+                "confidence": float(confidence),
+                "escalate": bool(confidence < self.judge.escalate_below) or self._rule_escalate(query, answer)
+            }
+            for query, answer, confidence in zip(queries, answers, confidences)
+        ]
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        """Run prompts through the LLM, batched when it supports it."""
+        if hasattr(self.llm, "batch"):
+            return [str(out) for out in self.llm.batch(prompts)]
+        return [self.llm(prompt) for prompt in prompts]
+
+    def _parse_judgment(self, query: str, text: str) -> dict:
+        """Parse the JSON judgment emitted by the LLM.
+
+        Falls back to pulling fields out with regexes when the output is not
+        valid JSON, and to the heuristics when no answer field is present.
+        """
+        data = None
+        match = _JSON_OBJECT_RE.search(text)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+
+        if not isinstance(data, dict) or "answer" not in data:
+            answer_match = _ANSWER_FIELD_RE.search(text)
+            if not answer_match:
+                answer = text.strip()
+                return {
+                    "answer": answer,
+                    "confidence": self.classify_confidence(query, answer),
+                    "escalate": self.should_escalate(query, answer)
+                }
+            data = {"answer": answer_match.group(1).replace('\\"', '"')}
+            confidence_match = _CONFIDENCE_FIELD_RE.search(text)
+            escalate_match = _ESCALATE_FIELD_RE.search(text)
+            if confidence_match:
+                data["confidence"] = confidence_match.group(1)
+            if escalate_match:
+                data["escalate"] = escalate_match.group(1).lower() == "true"
+
+        answer = str(data["answer"])
+        try:
+            confidence = max(0.0, min(1.0, float(data["confidence"])))
+        except (KeyError, TypeError, ValueError):
+            confidence = self.classify_confidence(query, answer)
+        escalate = data.get("escalate")
+        if isinstance(escalate, bool):
+            # The LLM can add an escalation but never overrule the hard rules
+            escalate = bool(escalate is True or self._rule_escalate(query, answer))
+        else:
+            escalate = self.should_escalate(query, answer)
+
+        return {"answer": answer, "confidence": confidence, "escalate": escalate}
+
+    async def astream_answer(self, query: str, docs: Optional[list] = None,
+                             query_vec=None) -> AsyncIterator[str]:
+        """Stream the answer to a query as text chunks.
+
+        In `hf` mode the `async_llm` completion is yielded whole, or tokens are
+        yielded as the LLM produces them when it supports `astream`; otherwise
+        the full answer is generated off the event loop and yielded word by word.
+        Queries the retriever reports as out of scope get the refusal message
+        as a single chunk, without retrieval or generation.
+
+        Args:
+            query: User query
+            docs: Already-retrieved documents; retrieved here when omitted
+            query_vec: Embedding used for the out-of-scope check; the query is
+                embedded when omitted and the check is enabled
+
+        Yields:
+            Consecutive pieces of the answer text
+        """
+        if self.is_out_of_scope(await self.aquery_vector(query, query_vec)):
+            yield _OUT_OF_SCOPE_MESSAGE
+            return
+        if docs is None:
+            docs = await asyncio.to_thread(self.retriever.get_relevant_documents, query)
+
+        if self.mode != "local" and self.async_llm is not None:
+            yield await self.async_llm.agenerate(self._build_prompt(query, docs))
+            return
+        if self.mode != "local" and hasattr(self.llm, "astream"):
+            async for chunk in self.llm.astream(self._build_prompt(query, docs)):
+                yield str(chunk)
+            return
+
+        answer = (await asyncio.to_thread(self.answer_batch, [query], [docs]))[0]
+        for piece in re.findall(r"\S+\s*|\s+", answer):
+            yield piece
+
+    def _build_prompt(self, query: str, docs: list, template: str = _QA_PROMPT) -> str:
+        """Stuff retrieved documents into the QA prompt."""
+        context = "\n\n".join(getattr(d, 'page_content', str(d)) for d in docs)
+        parts = _QA_PROMPT_PARTS.get(template)
+        if parts is None:
+            return template.format(context=context, question=query)
+        head, middle, tail = parts
+        return "".join((head, context, middle, query, tail))
     
-    def classify_confidence(self, query: str, answer: str) -> float:
+    def classify_confidence(self, query: str, answer: str, answer_lower: Optional[str] = None) -> float:
         """Estimate confidence in the answer based on heuristics.
         
         Returns a float between 0 and 1.
@@ -181,11 +695,11 @@ class SupportOrchestrator:
         # Simple heuristics for confidence scoring
         confidence = 0.5  # baseline
         
-        answer_lower = answer.lower()
+        if answer_lower is None:
+            answer_lower = answer.lower()
         
         # Reduce confidence if answer contains uncertainty phrases
-        uncertainty_phrases = ["i don't know", "i'm not sure", "unclear", "not able to find"]
-        if any(phrase in answer_lower for phrase in uncertainty_phrases):
+        if _UNCERTAINTY_RE.search(answer_lower):
             confidence -= 0.3
         
         # Increase confidence if answer is detailed (longer)
@@ -193,35 +707,59 @@ class SupportOrchestrator:
             confidence += 0.2
         
         # Increase confidence if answer references documents/sources
-        if "based on" in answer_lower or "according to" in answer_lower:
+        if _SOURCE_RE.search(answer_lower):
             confidence += 0.1
         
         return max(0.0, min(1.0, confidence))
     
-    def should_escalate(self, query: str, answer: str) -> bool:
+    def should_escalate(self,
+                        query: str,
+                        answer: str,
+                        confidence: Optional[float] = None,
+                        query_lower: Optional[str] = None,
+                        answer_lower: Optional[str] = None) -> bool:
         """Determine if query should be escalated to human agent.
         
+        Args:
+            query: User query
+            answer: Generated answer
+            confidence: Already-computed `classify_confidence` score, if any
+            query_lower: `query.lower()`, if the caller already has it
+            answer_lower: `answer.lower()`, if the caller already has it
+        
         Returns True if escalation is recommended.
         """
-        answer_lower = answer.lower()
-        query_lower = query.lower()
-        
-        # Check for escalation phrases in answer
-        if any(phrase in answer_lower for phrase in self.escalate_phrases):
-            return True
-        
-        # Check for urgent keywords in query
-        urgent_keywords = ["manager", "supervisor", "urgent", "complaint", "legal", "lawsuit"]
-        if any(keyword in query_lower for keyword in urgent_keywords):
+        if answer_lower is None:
+            answer_lower = answer.lower()
+        if self._rule_escalate(query, answer, query_lower, answer_lower):
             return True
         
         # Low confidence answers should escalate
-        confidence = self.classify_confidence(query, answer)
+        if confidence is None:
+            confidence = self.classify_confidence(query, answer, answer_lower)
         if confidence < 0.4:
             return True
         
         return False
 
+    def _rule_escalate(self,
+                       query: str,
+                       answer: str,
+                       query_lower: Optional[str] = None,
+                       answer_lower: Optional[str] = None) -> bool:
+        """Hard escalation rules: uncertain answers and urgent requests."""
+        if answer_lower is None:
+            answer_lower = answer.lower()
+        
+        # Check for escalation phrases in answer
+        if self._escalate_re.search(answer_lower):
+            return True
+        
+        # Check for urgent keywords in query
+        if query_lower is None:
+            query_lower = query.lower()
+        return _URGENT_RE.search(query_lower) is not None
+
 
 class EscalationAgent:
     """Simple escalation agent to format a human-handoff message."""
@@ -1,26 +1,202 @@
 """Query caching for improved performance."""
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, NamedTuple, Protocol
+from collections import OrderedDict
+from datetime import timedelta
 import hashlib
 import json
+import logging
+import os
+import pickle
+import time
 from pathlib import Path
 
+try:
+    import orjson
+    _ORJSON_AVAILABLE = True
+except Exception:
+    orjson = None
+    _ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    _MSGPACK_AVAILABLE = True
+except Exception:
+    msgpack = None
+    _MSGPACK_AVAILABLE = False
+
+try:
+    import xxhash
+    _XXHASH_AVAILABLE = True
+except Exception:
+    xxhash = None
+    _XXHASH_AVAILABLE = False
+
+try:
+    import redis.asyncio as aioredis
+    _REDIS_AVAILABLE = True
+except Exception:
+    aioredis = None
+    _REDIS_AVAILABLE = False
+
+logger = logging.getLogger("customer_support.cache")
+
+# Response fields that differ per request and are appended to the cached body
+PER_REQUEST_FIELDS = ("session_id", "cached")
+
+# Punctuation that doesn't change a query's meaning, removed from cache keys
+_PUNCT_TABLE = str.maketrans('', '', '?!.,')
+
+# Format of the file written by `QueryCache.save_to_disk`; the magic prefix
+# records which serializer wrote it
+CACHE_FILE_VERSION = 3
+_MSGPACK_MAGIC = b"QCMP"
+_PICKLE_MAGIC = b"QCPK"
+
+
+def _dumps(value: Any) -> bytes:
+    if _ORJSON_AVAILABLE:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _encode_body_prefix(response: Dict[str, Any]) -> bytes:
+    """Encode a response without its per-request fields or closing brace."""
+    body = {k: v for k, v in response.items() if k not in PER_REQUEST_FIELDS}
+    return _dumps(body)[:-1]
+
+
+class CachedResponse(NamedTuple):
+    """A cached response together with its pre-encoded JSON body."""
+    data: Dict[str, Any]
+    body_prefix: bytes
+    
+    def render(self, **fields) -> bytes:
+        """Splice per-request fields into the pre-encoded body.
+        
+        Args:
+            **fields: Values for the fields in PER_REQUEST_FIELDS
+            
+        Returns:
+            The complete JSON document
+        """
+        parts = [self.body_prefix]
+        for i, (name, value) in enumerate(fields.items()):
+            if i or len(self.body_prefix) > 1:
+                parts.append(b",")
+            parts.append(_dumps(name) + b":" + _dumps(value))
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+class CacheInfo(NamedTuple):
+    """Cache counters in the same shape as `functools.lru_cache().cache_info()`."""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class CacheBackend(Protocol):
+    """Shared cache tier consulted when the in-process cache misses."""
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+    
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: int):
+        ...
+    
+    async def delete(self, key: str):
+        ...
+    
+    async def clear(self):
+        ...
+
+
+class RedisBackend:
+    """Redis-backed cache tier shared by all API workers.
+    
+    Values are stored as JSON under `q:<sha1>` keys with a Redis-side expiry.
+    """
+    
+    KEY_PREFIX = "q:"
+    
+    def __init__(self, url: str = "redis://localhost:6379/0"):
+        """Initialize Redis backend.
+        
+        Args:
+            url: Redis connection URL
+        """
+        if not _REDIS_AVAILABLE:
+            raise RuntimeError("redis not installed. Install it: pip install redis")
+        self.url = url
+        self.client = aioredis.from_url(url)
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self.KEY_PREFIX + key)
+        return json.loads(raw) if raw is not None else None
+    
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: int):
+        await self.client.set(self.KEY_PREFIX + key, json.dumps(value), ex=ttl_seconds)
+    
+    async def delete(self, key: str):
+        await self.client.delete(self.KEY_PREFIX + key)
+    
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self.KEY_PREFIX + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def make_cache_backend(backend: str, redis_url: str = "") -> Optional[CacheBackend]:
+    """Create the shared cache tier selected in configuration.
+    
+    Args:
+        backend: "memory" (process-local only) or "redis"
+        redis_url: Redis connection URL for the redis backend
+        
+    Returns:
+        A CacheBackend, or None when only the in-process cache is used
+    """
+    if backend == "redis":
+        return RedisBackend(redis_url)
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return None
+
 
 class QueryCache:
-    """Cache for frequently asked questions to improve response time."""
+    """Cache for frequently asked questions to improve response time.
+    
+    The cache takes no locks: every operation is a plain dict access, so the
+    `aget`/`aset` coroutines can be awaited from the event loop without
+    blocking or contending with other requests.
     
-    def __init__(self, ttl_minutes: int = 60, max_size: int = 1000):
+    With a shared `backend` (e.g. Redis) the in-process dict acts as the
+    first tier; misses fall through to the backend and backend errors are
+    logged and treated as misses so the API keeps serving from memory.
+    """
+    
+    # Seconds to skip the shared backend after it fails
+    BACKEND_RETRY_SECONDS = 30
+    
+    def __init__(self, ttl_minutes: int = 60, max_size: int = 1000,
+                 backend: Optional[CacheBackend] = None):
         """Initialize query cache.
         
         Args:
             ttl_minutes: Time-to-live for cache entries in minutes
             max_size: Maximum number of entries to store
+            backend: Optional shared cache tier
         """
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        # Ordered least to most recently used
+        self.cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
         self.ttl = timedelta(minutes=ttl_minutes)
+        self._ttl_seconds = ttl_minutes * 60
         self.max_size = max_size
         self.hits = 0
         self.misses = 0
+        self.backend = backend
+        self._backend_retry_at = 0.0
     
     def _normalize_query(self, query: str) -> str:
         """Normalize query for consistent cache keys.
@@ -31,47 +207,55 @@ class QueryCache:
         Returns:
             Normalized query string
         """
-        # Convert to lowercase, strip whitespace, remove extra spaces
-        normalized = ' '.join(query.lower().strip().split())
-        
-        # Remove common punctuation that doesn't change meaning
-        for char in ['?', '!', '.', ',']:
-            normalized = normalized.replace(char, '')
-        
-        return normalized
+        # Lowercase, drop punctuation, then collapse whitespace
+        return ' '.join(query.lower().translate(_PUNCT_TABLE).split())
     
-    def _get_cache_key(self, query: str) -> str:
+    def _get_cache_key(self, query: str, top_k: Optional[int] = None) -> int:
         """Generate cache key from query.
         
         Args:
             query: Query string
+            top_k: Number of documents requested, if it affects the response
             
         Returns:
-            Cache key (MD5 hash)
+            Cache key (64-bit XXH3 hash, or BLAKE2b without xxhash). Keys are
+            only meaningful within one process; the shared backend uses
+            `_shared_key`.
         """
         normalized = self._normalize_query(query)
-        return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+        if top_k is not None:
+            normalized = f"{normalized}|k={top_k}"
+        data = normalized.encode('utf-8')
+        if _XXHASH_AVAILABLE:
+            return xxhash.xxh3_64_intdigest(data)
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
     
-    def get(self, query: str) -> Optional[Dict[str, Any]]:
+    def get(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """Get cached response for query.
         
         Args:
             query: Query string
+            top_k: Number of documents requested
             
         Returns:
             Cached response or None if not found/expired
         """
-        key = self._get_cache_key(query)
+        entry = self._lookup(query, top_k)
+        return entry['response'] if entry else None
+    
+    def _lookup(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Find a live entry and record the hit or miss."""
+        key = self._get_cache_key(query, top_k)
         
         if key in self.cache:
             entry = self.cache[key]
             
             # Check if entry is still valid
-            if datetime.now() - entry['cached_at'] < self.ttl:
+            if self._is_live(entry):
                 self.hits += 1
                 entry['hit_count'] += 1
-                entry['last_accessed'] = datetime.now()
-                return entry['response']
+                self.cache.move_to_end(key)
+                return entry
             else:
                 # Entry expired, remove it
                 del self.cache[key]
@@ -79,42 +263,131 @@ class QueryCache:
         self.misses += 1
         return None
     
-    def set(self, query: str, response: Dict[str, Any]):
+    def set(self, query: str, response: Dict[str, Any], top_k: Optional[int] = None):
         """Cache a response.
         
         Args:
             query: Query string
             response: Response to cache
+            top_k: Number of documents requested
         """
-        key = self._get_cache_key(query)
-        
-        # If cache is full, remove least recently used entry
-        if len(self.cache) >= self.max_size:
-            self._evict_lru()
+        key = self._get_cache_key(query, top_k)
         
         self.cache[key] = {
             'query': query,
+            'top_k': top_k,
             'response': response,
-            'cached_at': datetime.now(),
-            'last_accessed': datetime.now(),
+            'body_prefix': _encode_body_prefix(response),
+            'cached_at': time.monotonic(),
             'hit_count': 0
         }
+        self.cache.move_to_end(key)
+        
+        # If cache is full, remove least recently used entries
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+    
+    def _is_live(self, entry: Dict[str, Any]) -> bool:
+        """Whether an entry is within its TTL (`cached_at` is a monotonic timestamp)."""
+        return time.monotonic() - entry['cached_at'] < self._ttl_seconds
+    
+    def _shared_key(self, query: str, top_k: Optional[int] = None) -> str:
+        """Key used in the shared backend, stable across processes."""
+        normalized = self._normalize_query(query)
+        if top_k is not None:
+            normalized = f"{normalized}|k={top_k}"
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    
+    def _backend_available(self) -> bool:
+        return self.backend is not None and time.monotonic() >= self._backend_retry_at
+    
+    def _backend_failed(self, error: Exception):
+        logger.warning(f"Shared cache backend failed, using in-memory cache only: {error}")
+        self._backend_retry_at = time.monotonic() + self.BACKEND_RETRY_SECONDS
+    
+    async def aget(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get a cached response, consulting the shared backend on a local miss.
+        
+        Args:
+            query: Query string
+            top_k: Number of documents requested
+            
+        Returns:
+            Cached response or None
+        """
+        entry = await self._alookup(query, top_k)
+        return entry['response'] if entry else None
+    
+    async def aget_response(self, query: str, top_k: Optional[int] = None) -> Optional[CachedResponse]:
+        """Like `aget`, but also return the response's pre-encoded JSON body.
+        
+        Args:
+            query: Query string
+            top_k: Number of documents requested
+            
+        Returns:
+            CachedResponse or None
+        """
+        entry = await self._alookup(query, top_k)
+        return CachedResponse(entry['response'], entry['body_prefix']) if entry else None
+    
+    async def _alookup(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        entry = self._lookup(query, top_k)
+        if entry is not None or not self._backend_available():
+            return entry
+        
+        try:
+            response = await self.backend.get(self._shared_key(query, top_k))
+        except Exception as e:
+            self._backend_failed(e)
+            return None
+        
+        if response is None:
+            return None
+        
+        # Promote to the local tier and count as a hit instead of a miss
+        await self._aset_local(query, response, top_k)
+        self.misses -= 1
+        self.hits += 1
+        return self.cache[self._get_cache_key(query, top_k)]
+    
+    async def aset(self, query: str, response: Dict[str, Any], top_k: Optional[int] = None):
+        """Cache a response locally and in the shared backend.
+        
+        Args:
+            query: Query string
+            response: JSON-serializable response to cache
+            top_k: Number of documents requested
+        """
+        await self._aset_local(query, response, top_k)
+        if not self._backend_available():
+            return
+        
+        try:
+            await self.backend.set(
+                self._shared_key(query, top_k), response, int(self.ttl.total_seconds())
+            )
+        except Exception as e:
+            self._backend_failed(e)
+    
+    async def _aset_local(self, query: str, response: Dict[str, Any], top_k: Optional[int] = None):
+        """Store a response in the local tier from async code."""
+        self.set(query, response, top_k)
     
-    def _evict_lru(self):
-        """Evict least recently used entry."""
-        if not self.cache:
+    async def aclear(self):
+        """Clear the local cache and the shared backend."""
+        self.clear()
+        if self.backend is None:
             return
         
-        # Find entry with oldest last_accessed time
-        lru_key = min(
-            self.cache.keys(),
-            key=lambda k: self.cache[k]['last_accessed']
-        )
-        del self.cache[lru_key]
+        try:
+            await self.backend.clear()
+        except Exception as e:
+            self._backend_failed(e)
     
     def clear(self):
         """Clear all cache entries."""
-        self.cache = {}
+        self.cache = OrderedDict()
         self.hits = 0
         self.misses = 0
     
@@ -134,9 +407,18 @@ class QueryCache:
             'misses': self.misses,
             'total_requests': total_requests,
             'hit_rate_percent': round(hit_rate, 2),
-            'ttl_minutes': self.ttl.total_seconds() / 60
+            'ttl_minutes': self.ttl.total_seconds() / 60,
+            'backend': type(self.backend).__name__ if self.backend else 'memory'
         }
     
+    def cache_info(self) -> CacheInfo:
+        """Get hit/miss counters and size.
+        
+        Returns:
+            CacheInfo named tuple
+        """
+        return CacheInfo(self.hits, self.misses, self.max_size, len(self.cache))
+    
     def get_popular_queries(self, top_n: int = 10) -> list:
         """Get most frequently accessed queries.
         
@@ -157,13 +439,14 @@ class QueryCache:
             for entry in sorted_entries[:top_n]
         ]
     
-    def invalidate(self, query: str):
+    def invalidate(self, query: str, top_k: Optional[int] = None):
         """Invalidate specific cache entry.
         
         Args:
             query: Query string to invalidate
+            top_k: Number of documents the entry was cached for
         """
-        key = self._get_cache_key(query)
+        key = self._get_cache_key(query, top_k)
         if key in self.cache:
             del self.cache[key]
     
@@ -185,50 +468,81 @@ class QueryCache:
     def save_to_disk(self, filepath: str):
         """Save cache to disk.
         
+        Entries are written as `(cached_at, hit_count, query, top_k, response)`
+        tuples with msgpack (pickle without it) to a temporary file that is
+        fsynced and renamed over `filepath`, so a crash never leaves a
+        partially written cache.
+        
         Args:
             filepath: Path to save cache file
         """
+        # Entries hold monotonic timestamps; store wall-clock times on disk
+        wall_offset = time.time() - time.monotonic()
         cache_data = {
-            'cache': {
-                key: {
-                    **entry,
-                    'cached_at': entry['cached_at'].isoformat(),
-                    'last_accessed': entry['last_accessed'].isoformat()
-                }
-                for key, entry in self.cache.items()
-            },
-            'stats': {
-                'hits': self.hits,
-                'misses': self.misses
-            }
+            'version': CACHE_FILE_VERSION,
+            'entries': [
+                (entry['cached_at'] + wall_offset, entry['hit_count'], entry['query'],
+                 entry['top_k'], entry['response'])
+                for entry in self.cache.values()
+            ],
+            'stats': (self.hits, self.misses)
         }
         
-        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, indent=2)
+        if _MSGPACK_AVAILABLE:
+            payload = _MSGPACK_MAGIC + msgpack.packb(cache_data, use_bin_type=True)
+        else:
+            payload = _PICKLE_MAGIC + pickle.dumps(cache_data, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        path = Path(filepath)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
     
     def load_from_disk(self, filepath: str):
         """Load cache from disk.
         
         Args:
-            filepath: Path to cache file
+            filepath: Path to cache file written by `save_to_disk`
         """
         if not Path(filepath).exists():
             return
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+        
+        self.cache = OrderedDict()
+        magic, body = raw[:len(_MSGPACK_MAGIC)], raw[len(_MSGPACK_MAGIC):]
+        if magic == _MSGPACK_MAGIC and _MSGPACK_AVAILABLE:
+            cache_data = msgpack.unpackb(body, raw=False)
+        elif magic == _PICKLE_MAGIC:
+            # Only load cache files this application wrote: unpickling runs code
+            cache_data = pickle.loads(body)
+        else:
+            logger.info(f"Ignoring cache file {filepath} written in an older or unsupported format")
+            return
+        
+        if cache_data.get('version') != CACHE_FILE_VERSION:
+            logger.info(f"Ignoring cache file {filepath} written in an older format")
+            return
         
-        self.cache = {}
-        for key, entry in cache_data['cache'].items():
-            # Convert ISO format strings back to datetime
-            entry['cached_at'] = datetime.fromisoformat(entry['cached_at'])
-            entry['last_accessed'] = datetime.fromisoformat(entry['last_accessed'])
+        wall_offset = time.time() - time.monotonic()
+        for cached_at, hit_count, query, top_k, response in cache_data['entries']:
+            entry = {
+                'query': query,
+                'top_k': top_k,
+                'response': response,
+                'body_prefix': _encode_body_prefix(response),
+                'cached_at': cached_at - wall_offset,
+                'hit_count': hit_count
+            }
             
             # Only restore non-expired entries
-            if datetime.now() - entry['cached_at'] < self.ttl:
-                self.cache[key] = entry
+            if self._is_live(entry):
+                # Rebuild the key: the hash used when saving may differ from this process's
+                self.cache[self._get_cache_key(query, top_k)] = entry
         
-        stats = cache_data.get('stats', {})
-        self.hits = stats.get('hits', 0)
-        self.misses = stats.get('misses', 0)
+        self.hits, self.misses = cache_data.get('stats', (0, 0))
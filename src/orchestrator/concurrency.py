@@ -0,0 +1,169 @@
+"""Async helpers for coalescing concurrent work inside the API process."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
+
+
+class MicroBatcher:
+    """Coalesce concurrent submissions into batches for a blocking batch function.
+
+    Items are collected until `max_batch_size` is reached or `max_wait_ms`
+    has elapsed since the first item of the batch arrived. The batch function
+    then runs in a worker thread (so the event loop stays responsive) and
+    each caller's future is resolved with its own result, in order.
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0):
+        """Initialize the batcher.
+
+        Args:
+            batch_fn: Blocking callable mapping a list of items to a list of results
+            max_batch_size: Maximum number of items processed in one call
+            max_wait_ms: Maximum time to wait for a batch to fill up
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+    def start(self):
+        """Start the background collector task on the running loop."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        """Stop the collector and fail any requests still waiting in the queue."""
+        if self._worker is None:
+            return
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result.
+
+        Args:
+            item: Item passed to the batch function
+
+        Returns:
+            The result produced for this item
+        """
+        if self._worker is None:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """Gather items into batches and dispatch them."""
+        loop = asyncio.get_running_loop()
+
+        batch: list = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Dispatch without awaiting so the next batch can start filling
+                task = asyncio.create_task(self._dispatch(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # Items already taken off the queue would otherwise wait forever
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batcher stopped"))
+            raise
+
+    async def _dispatch(self, batch: list):
+        """Run the batch function and resolve each caller's future."""
+        items = [item for item, _ in batch]
+
+        try:
+            results = await asyncio.to_thread(self.batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the work; callers arriving while it is
+    in flight await the same result (or exception). The key is released as
+    soon as the work finishes, so later calls run again. Check-and-insert
+    happens without an intervening await, so no lock is needed on one loop.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn` unless a call with the same key is already in flight.
+
+        Args:
+            key: Identity of the work
+            fn: Coroutine function performing the work
+
+        Returns:
+            The result of the (possibly shared) call
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            # Shield so one waiter giving up does not cancel the others
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
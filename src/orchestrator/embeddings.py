@@ -1,20 +1,203 @@
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Literal
+
+import numpy as np
 
 try:
     from sentence_transformers import SentenceTransformer
 except Exception:
     SentenceTransformer = None
 
+try:
+    import torch
+except Exception:
+    torch = None
+
+from .concurrency import MicroBatcher
+
+logger = logging.getLogger("customer_support.embeddings")
+
+EmbeddingBackend = Literal["torch", "onnx", "onnx-int8"]
+
+# Dynamically quantized int8 export published in the sentence-transformers model repos
+_ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+
+def _default_device() -> str:
+    if torch is not None and torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+def _load_model(model_name: str, device: str, backend: EmbeddingBackend):
+    """Load a SentenceTransformer, on ONNX Runtime when asked and available."""
+    if backend != "torch":
+        model_kwargs = {"file_name": _ONNX_INT8_FILE} if backend == "onnx-int8" else {}
+        try:
+            return SentenceTransformer(model_name, device=device, backend="onnx", model_kwargs=model_kwargs)
+        except Exception as e:
+            # Needs sentence-transformers>=3.2 with onnxruntime/optimum installed
+            logger.warning(f"Could not load {model_name} with the {backend} backend, using torch: {e}")
+    return SentenceTransformer(model_name, device=device)
+
+
+def _compile_model(model, device: str):
+    """Compile the transformer forward pass with `torch.compile` in place.
+
+    Shapes vary with batch size and padded length, so the graph is traced
+    as dynamic. CUDA uses "reduce-overhead" (CUDA graphs) to cut launch
+    costs. Failures leave the eager model in place.
+    """
+    if torch is None or not hasattr(torch, "compile"):
+        logger.warning("torch.compile needs PyTorch>=2.0, running the embedding model eagerly")
+        return
+    mode = "reduce-overhead" if device.startswith("cuda") else "default"
+    try:
+        module = model[0]
+        module.auto_model = torch.compile(module.auto_model, mode=mode, dynamic=True)
+        logger.info(f"Compiled the embedding model with torch.compile (mode={mode})")
+    except Exception as e:
+        logger.warning(f"torch.compile failed, running the embedding model eagerly: {e}")
+
+
+class _DocumentEmbeddingCache:
+    """SQLite store of document embeddings keyed by a hash of the text.
+
+    Rows are namespaced by model and encoding settings, so switching models
+    never serves stale vectors. With `max_rows`, the namespace is pruned to
+    its `max_rows` most recently used rows once it outgrows that by a tenth.
+    """
+
+    # Stay well under SQLite's bound-parameter limit
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, namespace: str, max_rows: int | None = None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "namespace TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "last_used" not in columns:
+            # Files written before rows were timestamped
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self._conn.commit()
+        self._rows = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
+        self._prune_if_needed()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self._QUERY_CHUNK):
+                chunk = keys[start:start + self._QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE namespace = ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    [self.namespace, *chunk]
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def load(self, limit: int) -> Dict[bytes, np.ndarray]:
+        """Up to `limit` stored vectors of this namespace, most recently used first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, vector FROM embeddings WHERE namespace = ? "
+                "ORDER BY last_used DESC LIMIT ?",
+                (self.namespace, limit)
+            ).fetchall()
+        return {key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows}
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.namespace, key, vec.astype(np.float32).tobytes(), now) for key, vec in items.items()]
+            )
+            self._conn.commit()
+            # Replaced keys are counted too; pruning recounts
+            self._rows += len(items)
+        self._prune_if_needed()
+
+    def touch(self, keys: List[bytes]):
+        """Mark rows as used now, so pruning and `load` keep them."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE namespace = ? AND key = ?",
+                [(now, self.namespace, key) for key in keys]
+            )
+            self._conn.commit()
+
+    def _prune_if_needed(self):
+        if self.max_rows is None or self._rows <= self.max_rows + self.max_rows // 10:
+            return
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE namespace = ? AND key NOT IN ("
+                "SELECT key FROM embeddings WHERE namespace = ? ORDER BY last_used DESC LIMIT ?)",
+                (self.namespace, self.namespace, self.max_rows)
+            )
+            self._conn.commit()
+            self._rows = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
 
 class HuggingFaceEmbeddings:
     """Minimal wrapper around sentence-transformers to provide
     `embed_documents` and `embed_query` for compatibility with LangChain/Chroma.
 
     Model name can be set via `HUGGINGFACE_EMBEDDING_MODEL` env var or passed.
+    Query embeddings are memoized in a small LRU keyed by a hash of the text,
+    and concurrent `aembed_query_vector` calls are encoded together in one batch.
+    The model runs on CUDA when available. `backend` (or the
+    `HUGGINGFACE_EMBEDDING_BACKEND` env var) selects PyTorch, ONNX Runtime, or
+    ONNX Runtime with int8 weights; ONNX falls back to PyTorch if it cannot load.
+    With `compile` (or `HUGGINGFACE_EMBEDDING_COMPILE=1`) the PyTorch model is
+    wrapped in `torch.compile`; the first encode of each shape is slower.
+    Document embeddings are persisted in a SQLite file under `EMBED_CACHE_DIR`
+    (default `~/.cache/cso_embeds`), so re-ingesting unchanged text skips the
+    model; set it to an empty string to disable. Query embeddings are stored
+    there too, capped at the `persisted_query_limit` most recently used (or
+    `EMBED_QUERY_CACHE_ROWS`, default `query_cache_size`), and
+    `warm_query_cache` preloads the most recent into the LRU after a restart.
     """
 
-    def __init__(self, model_name: str | None = None):
+    def __init__(self,
+                 model_name: str | None = None,
+                 query_cache_size: int = 2048,
+                 device: str | None = None,
+                 batch_size: int = 64,
+                 normalize_embeddings: bool = True,
+                 query_batch_wait_ms: float = 5.0,
+                 backend: EmbeddingBackend | None = None,
+                 document_cache_dir: str | None = None,
+                 compile: bool | None = None,
+                 persisted_query_limit: int | None = None):
         model_name = model_name or os.getenv(
             "HUGGINGFACE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
         )
@@ -23,13 +206,165 @@ class HuggingFaceEmbeddings:
                 "sentence-transformers not installed. Add `sentence-transformers` to requirements.txt"
             )
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
+        self.device = device or _default_device()
+        self.backend = backend or os.getenv("HUGGINGFACE_EMBEDDING_BACKEND", "torch")
+        self.model = _load_model(model_name, self.device, self.backend)
+        if compile is None:
+            compile = os.getenv("HUGGINGFACE_EMBEDDING_COMPILE", "").lower() in ("1", "true", "yes")
+        if compile and self.backend == "torch":
+            _compile_model(self.model, self.device)
+        self.batch_size = batch_size
+        self.normalize_embeddings = normalize_embeddings
+        self.query_batch_wait_ms = query_batch_wait_ms
+        self._query_batcher: MicroBatcher | None = None
+        self._query_batcher_loop = None
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        if persisted_query_limit is None:
+            persisted_query_limit = int(os.getenv("EMBED_QUERY_CACHE_ROWS", query_cache_size))
+        self._document_cache = self._open_document_cache(document_cache_dir)
+        self._persistent_query_cache = self._open_document_cache(
+            document_cache_dir, kind="query", max_rows=persisted_query_limit
+        )
+
+    def _open_document_cache(self,
+                             cache_dir: str | None,
+                             kind: str = "document",
+                             max_rows: int | None = None) -> _DocumentEmbeddingCache | None:
+        if cache_dir is None:
+            cache_dir = os.getenv("EMBED_CACHE_DIR", "~/.cache/cso_embeds")
+        if not cache_dir:
+            return None
+        namespace = f"{self.model_name}|{self.backend}|normalize={self.normalize_embeddings}"
+        if kind != "document":
+            namespace += f"|{kind}"
+        try:
+            return _DocumentEmbeddingCache(
+                os.path.join(os.path.expanduser(cache_dir), "embeddings.sqlite"), namespace, max_rows
+            )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Document embedding cache disabled: {e}")
+            return None
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings
+        )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         # returns list of embedding vectors
-        embs = self.model.encode(texts, show_progress_bar=False)
-        return [list(map(float, e)) for e in embs]
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """Embed documents as one row-major float32 (n, dim) matrix.
+
+        Texts are encoded in `batch_size` chunks of padded model calls, and
+        only the ones missing from the document cache reach the model.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self._document_cache is None:
+            return np.ascontiguousarray(self._encode(texts), dtype=np.float32)
+
+        keys = [_DocumentEmbeddingCache.key(t) for t in texts]
+        cached = self._document_cache.get_many(keys)
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        embs = np.asarray(self._encode([texts[i] for i in misses]), dtype=np.float32) if misses else None
+
+        dim = embs.shape[1] if embs is not None else len(next(iter(cached.values())))
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key in cached:
+                out[i] = cached[key]
+        if misses:
+            out[misses] = embs
+            self._document_cache.put_many({keys[i]: emb for i, emb in zip(misses, embs)})
+        return out
 
     def embed_query(self, text: str) -> List[float]:
-        emb = self.model.encode([text], show_progress_bar=False)[0]
-        return list(map(float, emb))
+        return self.embed_query_vector(text).tolist()
+
+    def embed_query_vector(self, text: str) -> np.ndarray:
+        """Embed a query as a float32 vector, reusing cached results."""
+        return self.embed_query_vectors([text])[0]
+
+    def embed_query_vectors(self, texts: List[str]) -> np.ndarray:
+        """Embed several queries as a float32 matrix in one encode call for the cache misses."""
+        keys = [_DocumentEmbeddingCache.key(t) for t in texts]
+        vectors: List[np.ndarray | None] = [None] * len(texts)
+
+        with self._query_cache_lock:
+            for i, key in enumerate(keys):
+                vec = self._query_cache.get(key)
+                if vec is not None:
+                    self._query_cache.move_to_end(key)
+                    vectors[i] = vec
+
+        misses = [i for i, vec in enumerate(vectors) if vec is None]
+        stored = {}
+        if misses and self._persistent_query_cache is not None:
+            stored = self._persistent_query_cache.get_many([keys[i] for i in misses])
+            if stored:
+                self._persistent_query_cache.touch(list(stored))
+        to_encode = [i for i in misses if keys[i] not in stored]
+        embs = np.asarray(self._encode([texts[i] for i in to_encode]), dtype=np.float32) if to_encode else []
+        if to_encode and self._persistent_query_cache is not None:
+            self._persistent_query_cache.put_many({keys[i]: emb for i, emb in zip(to_encode, embs)})
+
+        if misses:
+            found = dict(stored)
+            found.update((keys[i], emb) for i, emb in zip(to_encode, embs))
+            with self._query_cache_lock:
+                for i in misses:
+                    vectors[i] = found[keys[i]]
+                    self._query_cache[keys[i]] = vectors[i]
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def warm_query_cache(self) -> int:
+        """Preload persisted query embeddings into the in-memory LRU.
+
+        Returns:
+            Number of vectors loaded
+        """
+        if self._persistent_query_cache is None:
+            return 0
+        stored = self._persistent_query_cache.load(self.query_cache_size)
+        with self._query_cache_lock:
+            # Oldest first, so the most recently used end up at the LRU's fresh end
+            for key, vec in reversed(stored.items()):
+                self._query_cache.setdefault(key, vec)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return len(stored)
+
+    async def aembed_query_vector(self, text: str) -> np.ndarray:
+        """Embed a query without blocking the event loop.
+
+        Cached queries return immediately; the rest, when submitted
+        concurrently within `query_batch_wait_ms`, are encoded in a single
+        model call.
+        """
+        key = _DocumentEmbeddingCache.key(text)
+        with self._query_cache_lock:
+            vec = self._query_cache.get(key)
+            if vec is not None:
+                self._query_cache.move_to_end(key)
+                return vec
+
+        loop = asyncio.get_running_loop()
+        if self._query_batcher is None or self._query_batcher_loop is not loop:
+            self._query_batcher = MicroBatcher(
+                self.embed_query_vectors,
+                max_batch_size=self.batch_size,
+                max_wait_ms=self.query_batch_wait_ms
+            )
+            self._query_batcher_loop = loop
+        return await self._query_batcher.submit(text)
@@ -1,9 +1,61 @@
 """User feedback collection and analysis."""
 import json
+import os
+import re
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
+from collections import Counter
+
+from .timestamps import now_isoformat
+
+# Bytes read per call when scanning the feedback file
+_READ_CHUNK_SIZE = 1 << 20
+
+# Significant words for common-issue detection: runs of 4+ letters (any script)
+_KEYWORD_RE = re.compile(r"[^\W\d_]{4,}")
+
+
+def _iter_lines(path: Path):
+    """Yield the non-blank lines of a file as bytes, reading it in large chunks.
+    
+    Avoids text decoding and per-line readline buffering; `json.loads`
+    accepts the bytes directly.
+    """
+    with open(path, 'rb') as f:
+        tail = b''
+        while True:
+            chunk = f.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            buf = tail + chunk if tail else chunk
+            start = 0
+            end = buf.find(b'\n')
+            while end >= 0:
+                line = buf[start:end]
+                if line.strip():
+                    yield line
+                start = end + 1
+                end = buf.find(b'\n', start)
+            tail = buf[start:]
+        if tail.strip():
+            yield tail
+
+
+_TIMESTAMP_PREFIX = b'{"timestamp": "'
+
+
+def _line_timestamp(line: bytes) -> bytes:
+    """ISO timestamp of a feedback line, without parsing the whole record.
+    
+    `record_feedback` writes the timestamp as the first key; other lines
+    fall back to a full JSON parse.
+    """
+    if line.startswith(_TIMESTAMP_PREFIX):
+        end = line.find(b'"', len(_TIMESTAMP_PREFIX))
+        if end > 0:
+            return line[len(_TIMESTAMP_PREFIX):end]
+    return json.loads(line)['timestamp'].encode('ascii')
 
 
 class FeedbackCollector:
@@ -21,6 +73,55 @@ class FeedbackCollector:
         # Create file if it doesn't exist
         if not self.feedback_file.exists():
             self.feedback_file.touch()
+        
+        # Parsed entries, valid while the file's (mtime_ns, size) matches _cache_key
+        self._cache_key: Optional[Tuple[int, int]] = None
+        self._cache: List[Dict] = []
+        
+        # Running aggregates over `_cache`, so stats never rescan the entries
+        self._rating_counts: Dict[int, int] = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        self._rating_sum = 0
+        self._with_comments = 0
+        
+        # get_common_issues results by min_occurrences, for the cache key they were computed at
+        self._issues_key: Optional[Tuple[int, int]] = None
+        self._issues: Dict[int, List[Tuple[str, int]]] = {}
+    
+    def _file_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.feedback_file.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
+    def _set_cache(self, entries: List[Dict], key: Optional[Tuple[int, int]]):
+        """Replace the cached entries and recompute the aggregates in one pass."""
+        self._cache = entries
+        self._cache_key = key
+        self._rating_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        self._rating_sum = 0
+        self._with_comments = 0
+        for fb in entries:
+            self._count(fb)
+    
+    def _count(self, fb: Dict):
+        self._rating_counts[fb['rating']] += 1
+        self._rating_sum += fb['rating']
+        if fb.get('comment'):
+            self._with_comments += 1
+    
+    def _refresh(self):
+        """Reparse the file if it changed since it was last read."""
+        key = self._file_key()
+        if key is not None and key == self._cache_key:
+            return
+        
+        feedback_list = []
+        
+        if key is not None and key[1] > 0:
+            feedback_list = [json.loads(line) for line in _iter_lines(self.feedback_file)]
+        
+        self._set_cache(feedback_list, key)
     
     def record_feedback(self, 
                        query: str, 
@@ -43,7 +144,7 @@ class FeedbackCollector:
             raise ValueError("Rating must be between 1 and 5")
         
         feedback = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now_isoformat(),
             'session_id': session_id,
             'query': query,
             'answer': answer,
@@ -52,27 +153,37 @@ class FeedbackCollector:
             'metadata': metadata or {}
         }
         
+        # Keep the cache if it was current: only our own line is being added
+        cache_current = self._cache_key is not None and self._cache_key == self._file_key()
+        
         # Append to JSONL file
         with open(self.feedback_file, 'a', encoding='utf-8') as f:
             f.write(json.dumps(feedback) + '\n')
+        
+        if cache_current:
+            self._cache.append(feedback)
+            self._count(feedback)
+            self._cache_key = self._file_key()
+        else:
+            self._cache_key = None
     
     def get_all_feedback(self) -> List[Dict]:
         """Get all feedback entries.
         
+        The file is parsed once and kept in memory until it changes on disk
+        (by modification time and size), so repeated analytics calls don't
+        re-read it.
+        
         Returns:
             List of all feedback entries
         """
-        feedback_list = []
-        
-        if not self.feedback_file.exists() or self.feedback_file.stat().st_size == 0:
-            return feedback_list
-        
-        with open(self.feedback_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    feedback_list.append(json.loads(line))
-        
-        return feedback_list
+        self._refresh()
+        return list(self._cache)
+    
+    def _iter_feedback(self):
+        """Iterate over the cached entries without copying them."""
+        self._refresh()
+        return iter(self._cache)
     
     def get_low_rated_queries(self, threshold: int = 3) -> List[Dict]:
         """Get queries with low ratings for improvement.
@@ -83,9 +194,8 @@ class FeedbackCollector:
         Returns:
             List of low-rated feedback entries
         """
-        all_feedback = self.get_all_feedback()
         return [
-            fb for fb in all_feedback
+            fb for fb in self._iter_feedback()
             if fb['rating'] <= threshold
         ]
     
@@ -98,9 +208,8 @@ class FeedbackCollector:
         Returns:
             List of high-rated feedback entries
         """
-        all_feedback = self.get_all_feedback()
         return [
-            fb for fb in all_feedback
+            fb for fb in self._iter_feedback()
             if fb['rating'] >= threshold
         ]
     
@@ -110,13 +219,12 @@ class FeedbackCollector:
         Returns:
             Average rating (0.0 if no feedback)
         """
-        all_feedback = self.get_all_feedback()
+        self._refresh()
         
-        if not all_feedback:
+        if not self._cache:
             return 0.0
         
-        ratings = [fb['rating'] for fb in all_feedback]
-        return sum(ratings) / len(ratings)
+        return self._rating_sum / len(self._cache)
     
     def get_rating_distribution(self) -> Dict[int, int]:
         """Get distribution of ratings.
@@ -124,13 +232,8 @@ class FeedbackCollector:
         Returns:
             Dictionary mapping rating (1-5) to count
         """
-        distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        
-        for fb in self.get_all_feedback():
-            rating = fb['rating']
-            distribution[rating] += 1
-        
-        return distribution
+        self._refresh()
+        return dict(self._rating_counts)
     
     def get_feedback_stats(self) -> Dict:
         """Get comprehensive feedback statistics.
@@ -138,9 +241,10 @@ class FeedbackCollector:
         Returns:
             Dictionary with various statistics
         """
-        all_feedback = self.get_all_feedback()
+        self._refresh()
+        total = len(self._cache)
         
-        if not all_feedback:
+        if not total:
             return {
                 'total_feedback': 0,
                 'average_rating': 0.0,
@@ -149,17 +253,17 @@ class FeedbackCollector:
                 'negative_rate': 0.0
             }
         
-        ratings = [fb['rating'] for fb in all_feedback]
-        positive = sum(1 for r in ratings if r >= 4)
-        negative = sum(1 for r in ratings if r <= 2)
+        counts = self._rating_counts
+        positive = counts[4] + counts[5]
+        negative = counts[1] + counts[2]
         
         return {
-            'total_feedback': len(all_feedback),
-            'average_rating': round(sum(ratings) / len(ratings), 2),
-            'rating_distribution': self.get_rating_distribution(),
-            'positive_rate': round(positive / len(all_feedback) * 100, 2),
-            'negative_rate': round(negative / len(all_feedback) * 100, 2),
-            'with_comments': sum(1 for fb in all_feedback if fb.get('comment'))
+            'total_feedback': total,
+            'average_rating': round(self._rating_sum / total, 2),
+            'rating_distribution': dict(counts),
+            'positive_rate': round(positive / total * 100, 2),
+            'negative_rate': round(negative / total * 100, 2),
+            'with_comments': self._with_comments
         }
     
     def get_common_issues(self, min_occurrences: int = 2) -> List[Tuple[str, int]]:
@@ -171,29 +275,26 @@ class FeedbackCollector:
         Returns:
             List of tuples (query pattern, count) sorted by frequency
         """
-        low_rated = self.get_low_rated_queries()
-        
-        # Simple keyword extraction from queries
-        query_keywords = defaultdict(int)
-        
-        for fb in low_rated:
-            # Extract significant words (length > 3)
-            words = [
-                word.lower() 
-                for word in fb['query'].split() 
-                if len(word) > 3
+        self._refresh()
+        if self._issues_key != self._cache_key or self._cache_key is None:
+            self._issues_key = self._cache_key
+            self._issues = {}
+        
+        common = self._issues.get(min_occurrences)
+        if common is None:
+            # Simple keyword extraction: significant words of low-rated queries, in one C pass
+            corpus = '\n'.join(fb['query'] for fb in self._cache if fb['rating'] <= 3).lower()
+            query_keywords = Counter(_KEYWORD_RE.findall(corpus))
+            
+            # most_common sorts stably, so ties keep first-seen order
+            common = [
+                (word, count)
+                for word, count in query_keywords.most_common()
+                if count >= min_occurrences
             ]
-            for word in words:
-                query_keywords[word] += 1
-        
-        # Filter and sort
-        common = [
-            (word, count) 
-            for word, count in query_keywords.items()
-            if count >= min_occurrences
-        ]
+            self._issues[min_occurrences] = common
         
-        return sorted(common, key=lambda x: x[1], reverse=True)
+        return list(common)
     
     def get_improvement_suggestions(self) -> List[str]:
         """Generate improvement suggestions based on feedback.
@@ -276,18 +377,26 @@ class FeedbackCollector:
     def clear_old_feedback(self, days: int = 90):
         """Remove feedback older than specified days.
         
+        Streams the file once, copying the surviving lines verbatim to a
+        temporary file that then atomically replaces it, so memory stays
+        constant and a crash never leaves a truncated log.
+        
         Args:
             days: Number of days to keep
         """
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        all_feedback = self.get_all_feedback()
-        recent_feedback = [
-            fb for fb in all_feedback
-            if datetime.fromisoformat(fb['timestamp']) > cutoff_date
-        ]
-        
-        # Rewrite file with recent feedback only
-        with open(self.feedback_file, 'w', encoding='utf-8') as f:
-            for fb in recent_feedback:
-                f.write(json.dumps(fb) + '\n')
+        # Same-format ISO timestamps sort chronologically as strings; with
+        # microseconds always present the cutoff matches `now_isoformat`
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec='microseconds').encode('ascii')
+        
+        tmp_file = self.feedback_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as out:
+            if self.feedback_file.exists():
+                for line in _iter_lines(self.feedback_file):
+                    if _line_timestamp(line) > cutoff:
+                        out.write(line.rstrip(b'\r') + b'\n')
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_file, self.feedback_file)
+        
+        # Reparsed on next access rather than held in memory here
+        self._cache_key = None
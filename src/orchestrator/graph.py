@@ -5,8 +5,12 @@ This module defines a graph-based workflow using LangGraph that:
 2. Routes to appropriate agents (retrieval + answer, or escalation)
 3. Returns structured responses with confidence and context
 """
-from typing import TypedDict, Annotated, Literal
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Annotated, Literal, Optional
 import operator
+import re
+import threading
 
 try:
     from langgraph.graph import StateGraph, END
@@ -16,89 +20,109 @@ except Exception:
     END = None
     _LANGGRAPH_AVAILABLE = False
 
+# Substring match, so "managers" and "escalated" also route to escalation
+_URGENT_RE = re.compile(r"urgent|escalate|speak to human|manager")
 
-class WorkflowState(TypedDict):
-    """State passed through the LangGraph workflow."""
-    query: str
-    intent: str  # "answer" or "escalate"
-    retrieved_docs: list
-    answer: str
-    confidence: float
-    escalate: bool
-    ticket: dict
-    messages: Annotated[list, operator.add]  # log of workflow steps
+# Compiled graphs by (id(retriever), id(llm)). Each graph holds its retriever
+# and llm, so an id cannot be reused by a new object while its entry exists.
+_GRAPH_CACHE_SIZE = 8
+_graph_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_graph_cache_lock = threading.Lock()
 
 
-def classify_intent_node(state: WorkflowState) -> WorkflowState:
+@dataclass(slots=True)
+class WorkflowState:
+    """State passed through the LangGraph workflow.
+
+    Nodes read it by attribute and return only the fields they change;
+    LangGraph merges those updates, appending to `messages` via its reducer.
+    """
+    query: str = ""
+    query_vector: Optional[list] = None  # precomputed query embedding, if the caller has one
+    intent: str = ""  # "answer" or "escalate"
+    retrieved_docs: list = field(default_factory=list)
+    context_short: str = ""  # first 500 chars of the top 3 docs, for escalation tickets
+    answer: str = ""
+    confidence: float = 0.0
+    escalate: bool = False
+    ticket: dict = field(default_factory=dict)
+    messages: Annotated[list, operator.add] = field(default_factory=list)  # log of workflow steps
+
+
+def classify_intent_node(state: WorkflowState) -> dict:
     """Classify the query intent: simple heuristic for demo.
     
     In production, this would use a trained classifier or LLM prompt.
     """
-    query_lower = state["query"].lower()
+    query_lower = state.query.lower()
     # Simple keyword heuristic
-    if any(kw in query_lower for kw in ["urgent", "escalate", "speak to human", "manager"]):
-        state["intent"] = "escalate"
-        state["messages"].append("Intent: escalate (urgent keywords detected)")
-    else:
-        state["intent"] = "answer"
-        state["messages"].append("Intent: answer (standard query)")
-    return state
+    if _URGENT_RE.search(query_lower):
+        return {"intent": "escalate", "messages": ["Intent: escalate (urgent keywords detected)"]}
+    return {"intent": "answer", "messages": ["Intent: answer (standard query)"]}
 
 
-def retrieve_docs_node(state: WorkflowState, retriever) -> WorkflowState:
-    """Retrieve relevant documents using the retriever."""
-    docs = retriever.get_relevant_documents(state["query"])
-    state["retrieved_docs"] = docs
-    state["messages"].append(f"Retrieved {len(docs)} documents")
-    return state
+def retrieve_docs_node(state: WorkflowState, retriever) -> dict:
+    """Retrieve relevant documents using the retriever.
+    
+    Reuses the query embedding from the state when the retriever can search by vector.
+    """
+    if state.query_vector is not None and hasattr(retriever, "get_relevant_documents_with_vector"):
+        docs = retriever.get_relevant_documents_with_vector(state.query_vector)
+    else:
+        docs = retriever.get_relevant_documents(state.query)
+    context_short = "\n\n".join(getattr(d, 'page_content', str(d))[:500] for d in docs[:3])
+    return {
+        "retrieved_docs": docs,
+        "context_short": context_short,
+        "messages": [f"Retrieved {len(docs)} documents"]
+    }
 
 
-def answer_node(state: WorkflowState, llm) -> WorkflowState:
+def answer_node(state: WorkflowState, llm) -> dict:
     """Generate answer using retrieved docs + LLM."""
-    if not state["retrieved_docs"]:
-        state["answer"] = "I don't have enough information to answer this query."
-        state["confidence"] = 0.1
-        state["escalate"] = True
-        state["messages"].append("Answer: low confidence (no docs retrieved)")
+    if not state.retrieved_docs:
+        return {
+            "answer": "I don't have enough information to answer this query.",
+            "confidence": 0.1,
+            "escalate": True,
+            "messages": ["Answer: low confidence (no docs retrieved)"]
+        }
+
+    answer_text = llm.generate_answer(state.query, state.retrieved_docs)
+    # Heuristic confidence based on length and uncertainty phrases
+    if any(p in answer_text.lower() for p in ["i don't know", "not sure", "unclear"]):
+        confidence, escalate = 0.3, True
     else:
-        # Simple concatenation for demo; in production use RetrievalQA or custom prompt
-        context = "\n\n".join(getattr(d, 'page_content', str(d)) for d in state["retrieved_docs"][:3])
-        answer_text = llm.generate_answer(state["query"], state["retrieved_docs"])
-        state["answer"] = answer_text
-        # Heuristic confidence based on length and uncertainty phrases
-        if any(p in answer_text.lower() for p in ["i don't know", "not sure", "unclear"]):
-            state["confidence"] = 0.3
-            state["escalate"] = True
-        else:
-            state["confidence"] = 0.8
-            state["escalate"] = False
-        state["messages"].append(f"Answer generated (confidence: {state['confidence']})")
-    return state
-
-
-def escalate_node(state: WorkflowState) -> WorkflowState:
+        confidence, escalate = 0.8, False
+    return {
+        "answer": answer_text,
+        "confidence": confidence,
+        "escalate": escalate,
+        "messages": [f"Answer generated (confidence: {confidence})"]
+    }
+
+
+def escalate_node(state: WorkflowState) -> dict:
     """Create escalation ticket with context."""
-    context = "\n\n".join(getattr(d, 'page_content', str(d))[:500] for d in state["retrieved_docs"][:3])
-    state["ticket"] = {
-        "subject": f"Escalation: {state['query'][:100]}",
-        "query": state["query"],
-        "context": context,
+    ticket = {
+        "subject": f"Escalation: {state.query[:100]}",
+        "query": state.query,
+        "context": state.context_short,
         "reason": "User request or low confidence"
     }
-    state["messages"].append("Escalation ticket created")
-    return state
+    return {"ticket": ticket, "messages": ["Escalation ticket created"]}
 
 
 def route_after_classify(state: WorkflowState) -> Literal["retrieve", "escalate_direct"]:
     """Routing logic after intent classification."""
-    if state["intent"] == "escalate":
+    if state.intent == "escalate":
         return "escalate_direct"
     return "retrieve"
 
 
 def route_after_answer(state: WorkflowState) -> Literal["escalate_post_answer", "end"]:
     """Routing logic after answer generation."""
-    if state.get("escalate", False):
+    if state.escalate:
         return "escalate_post_answer"
     return "end"
 
@@ -150,29 +174,47 @@ def build_support_graph(retriever, llm):
     return workflow.compile()
 
 
-def run_support_workflow(query: str, retriever, llm) -> dict:
+def get_support_graph(retriever, llm):
+    """Compiled workflow for this retriever and llm, built on first use.
+    
+    Args:
+        retriever: Retriever object with `get_relevant_documents(query)` method
+        llm: LLM object with `generate_answer(query, docs)` method
+    
+    Returns:
+        Compiled LangGraph workflow, shared by later calls with the same objects
+    """
+    key = (id(retriever), id(llm))
+    with _graph_cache_lock:
+        graph = _graph_cache.get(key)
+        if graph is not None:
+            _graph_cache.move_to_end(key)
+            return graph
+    
+    graph = build_support_graph(retriever, llm)
+    with _graph_cache_lock:
+        graph = _graph_cache.setdefault(key, graph)
+        _graph_cache.move_to_end(key)
+        while len(_graph_cache) > _GRAPH_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+    return graph
+
+
+def run_support_workflow(query: str, retriever, llm, query_vector=None) -> dict:
     """Execute the support workflow for a given query.
     
     Args:
         query: User query string
         retriever: Retriever instance
         llm: LLM instance
+        query_vector: Optional precomputed embedding of `query` to skip re-embedding
     
     Returns:
         Final workflow state as dict
     """
-    graph = build_support_graph(retriever, llm)
+    graph = get_support_graph(retriever, llm)
     
-    initial_state: WorkflowState = {
-        "query": query,
-        "intent": "",
-        "retrieved_docs": [],
-        "answer": "",
-        "confidence": 0.0,
-        "escalate": False,
-        "ticket": {},
-        "messages": []
-    }
+    initial_state = WorkflowState(query=query, query_vector=query_vector)
     
     result = graph.invoke(initial_state)
     return result
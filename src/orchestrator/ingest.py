@@ -1,6 +1,9 @@
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
+import itertools
+import logging
 import os
+import sqlite3
 
 try:
     from langchain.text_splitter import CharacterTextSplitter
@@ -23,21 +26,66 @@ except Exception:
     _CHROMADB_AVAILABLE = False
 
 from .embeddings import HuggingFaceEmbeddings
+from .retriever import chroma_client
+from .textfiles import read_texts
 
+logger = logging.getLogger("customer_support.ingest")
 
-def _simple_text_split(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-    if len(text) <= chunk_size:
-        return [text]
-    chunks = []
+
+def _iter_chunk_spans(n: int, chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) offsets of overlapping chunks of a length-`n` text.
+
+    Only the offsets are computed, so each chunk is sliced out of the text
+    when it is consumed rather than all of them up front.
+    """
+    if n <= chunk_size:
+        yield 0, n
+        return
     start = 0
-    while start < len(text):
+    while start < n:
         end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end >= len(text):
+        yield start, min(end, n)
+        if end >= n:
             break
         start = end - chunk_overlap
-    return chunks
+
+
+def _iter_chunk_records(texts: List[str],
+                        sources: List[str],
+                        chunk_size: int,
+                        chunk_overlap: int) -> Iterator[Tuple[str, str, dict]]:
+    """Lazily yield (id, chunk, metadata) for every chunk of every text."""
+    for idx, txt in enumerate(texts):
+        spans = _iter_chunk_spans(len(txt), chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        for cidx, (start, end) in enumerate(spans):
+            yield f"doc-{idx}-{cidx}", txt[start:end], {"source": sources[idx], "chunk_index": cidx}
+
+
+def _batches(items, batch_size: int) -> Iterator[list]:
+    """Consume an iterator in lists of at most `batch_size` items."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _enable_wal(persist_directory: str):
+    """Switch Chroma's SQLite file to write-ahead logging.
+
+    WAL lets readers proceed during ingestion and turns each batch commit into
+    a sequential append. The mode is stored in the database file, so it only
+    needs to be set once.
+    """
+    db_path = Path(persist_directory) / "chroma.sqlite3"
+    if not db_path.exists():
+        return
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.Error as e:
+        logger.warning(f"Could not enable WAL on {db_path}: {e}")
 
 
 def ingest_from_directory(
@@ -45,33 +93,43 @@ def ingest_from_directory(
     persist_directory: str = "./.chroma",
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    batch_size: int = 250,
 ):
     """Ingest markdown/text files under `data_dir` into a Chroma vectorstore.
 
     This function will prefer LangChain's `Chroma` wrapper when available. If
     LangChain isn't installed, it will fall back to using `chromadb` directly
     with `sentence-transformers` embeddings (no OpenAI key required).
+
+    Chunks are produced lazily and embedded and written `batch_size` at a
+    time, one `add` call (and one SQLite transaction) per batch, so only one
+    batch of chunks and vectors is held at once.
     """
     data_path = Path(data_dir)
-    texts = []
-    sources = []
-    for p in sorted(data_path.rglob("*.md")):
-        txt = p.read_text(encoding="utf-8")
-        texts.append(txt)
-        sources.append(str(p))
+    paths = sorted(data_path.rglob("*.md"))
+    texts = read_texts(paths)
+    sources = [str(p) for p in paths]
 
     hf_model = os.getenv("HUGGINGFACE_EMBEDDING_MODEL")
     embeddings = HuggingFaceEmbeddings(model_name=hf_model)
 
     # If LangChain is available, use its Chroma wrapper (compatibility)
     if _LANGCHAIN_AVAILABLE and Chroma is not None:
-        # build langchain Documents and use Chroma.from_documents
-        docs = []
+        # build langchain Documents lazily and add them to Chroma in batches
         splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        for t in texts:
-            docs.extend(splitter.split_documents([Document(page_content=t)]))
+        docs = (
+            doc
+            for t in texts
+            for doc in splitter.split_documents([Document(page_content=t)])
+        )
 
-        vectordb = Chroma.from_documents(docs, embedding=embeddings, persist_directory=persist_directory)
+        if os.getenv("CHROMA_HTTP_URL"):
+            vectordb = Chroma(client=chroma_client(persist_directory), embedding_function=embeddings)
+        else:
+            vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+        _enable_wal(persist_directory)
+        for batch in _batches(docs, batch_size):
+            vectordb.add_documents(batch)
         vectordb.persist()
         return vectordb
 
@@ -81,31 +139,24 @@ def ingest_from_directory(
             "Neither langchain nor chromadb are available. Please install requirements.txt (pip install -r requirements.txt)."
         )
 
-    # New Chroma PersistentClient API replaces legacy Client(Settings(...)) usage
-    try:
-        client = chromadb.PersistentClient(path=persist_directory)
-    except Exception:
-        client = chromadb.Client()  # in-memory fallback
+    # Local PersistentClient, or a Chroma server when CHROMA_HTTP_URL is set
+    client = chroma_client(persist_directory)
     try:
         collection = client.get_collection("orchestrator")
     except Exception:
         collection = client.create_collection("orchestrator")
-
-    documents = []
-    metadatas = []
-    ids = []
-    for idx, txt in enumerate(texts):
-        chunks = _simple_text_split(txt, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        for cidx, chunk in enumerate(chunks):
-            documents.append(chunk)
-            metadatas.append({"source": sources[idx], "chunk_index": cidx})
-            ids.append(f"doc-{idx}-{cidx}")
-
-    # compute embeddings
-    vectors = embeddings.embed_documents(documents)
-
-    # upsert into chroma collection
-    collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+    _enable_wal(persist_directory)
+
+    # embed and upsert into the chroma collection one batch at a time
+    records = _iter_chunk_records(texts, sources, chunk_size, chunk_overlap)
+    for batch in _batches(records, batch_size):
+        ids, documents, metadatas = (list(column) for column in zip(*batch))
+        collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings.embed_documents(documents)
+        )
     # PersistentClient auto-persists, no explicit persist() needed
     return collection
 
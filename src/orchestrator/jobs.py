@@ -0,0 +1,125 @@
+"""Background ingestion jobs run in worker processes."""
+import asyncio
+import logging
+import multiprocessing
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("customer_support.jobs")
+
+
+def _run_ingest_job(**kwargs) -> Dict[str, Any]:
+    """Worker-process entry point: ingest and report the number of stored chunks."""
+    from .ingest import ingest_from_directory
+
+    store = ingest_from_directory(**kwargs)
+    collection = getattr(store, "_collection", store)
+    try:
+        return {"chunks": collection.count()}
+    except Exception:
+        return {}
+
+
+class IngestJobQueue:
+    """Runs `ingest_from_directory` in a process pool and tracks job status.
+
+    Ingestion is CPU heavy (chunking and embedding), so it runs outside the
+    API process and its event loop. Job records are kept for the most recent
+    `max_tracked_jobs` submissions, in this process only: with several API
+    workers a status poll can reach a worker that never saw the job, so the
+    backend only enables the queue with a single worker.
+    """
+
+    def __init__(self, max_workers: int = 1, max_tracked_jobs: int = 100):
+        """Initialize the queue.
+
+        Args:
+            max_workers: Number of ingestion worker processes
+            max_tracked_jobs: Number of job records kept for status polling
+        """
+        # Spawn rather than fork: the API process holds model threads and locks
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.max_tracked_jobs = max_tracked_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._futures: Dict[str, Any] = {}
+        self._watchers: set = set()
+
+    def submit(self, on_success: Optional[Callable[[], Awaitable[Any]]] = None, **kwargs) -> str:
+        """Queue an ingestion job.
+
+        Args:
+            on_success: Optional coroutine function awaited after the job succeeds
+            **kwargs: Arguments for `ingest_from_directory`
+
+        Returns:
+            The job ID
+        """
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "data_directory": kwargs.get("data_dir"),
+            "submitted_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        while len(self._jobs) > self.max_tracked_jobs:
+            oldest, _ = self._jobs.popitem(last=False)
+            self._futures.pop(oldest, None)
+
+        future = self._executor.submit(_run_ingest_job, **kwargs)
+        self._futures[job_id] = future
+        watcher = asyncio.create_task(self._watch(job_id, future, on_success))
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+        return job_id
+
+    async def _watch(self, job_id: str, future, on_success: Optional[Callable[[], Awaitable[Any]]]):
+        """Follow a job to completion and record its outcome."""
+        job = self._jobs.get(job_id, {})
+        try:
+            job["result"] = await asyncio.wrap_future(future)
+            if on_success is not None:
+                await on_success()
+            job["status"] = "completed"
+            logger.info(f"Ingestion job {job_id} completed")
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            self._futures.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status record.
+
+        Args:
+            job_id: Job identifier
+
+        Returns:
+            Status dict, or None if the job is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = self._futures.get(job_id)
+        if job["status"] == "queued" and future is not None and (future.running() or future.done()):
+            job["status"] = "running"
+        return dict(job)
+
+    def shutdown(self):
+        """Stop the worker processes, cancelling jobs that have not started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for watcher in self._watchers:
+            watcher.cancel()
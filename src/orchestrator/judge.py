@@ -0,0 +1,103 @@
+"""Learned answer judge trained from user feedback.
+
+A logistic regression over `[query_embedding, answer_embedding]` predicts
+whether an answer will be rated helpful. Its weights are stored as a small
+`.npz` file, so serving is one dot product and needs neither sklearn nor
+an inference runtime.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from sklearn.linear_model import LogisticRegression
+    _SKLEARN_AVAILABLE = True
+except Exception:
+    LogisticRegression = None
+    _SKLEARN_AVAILABLE = False
+
+
+class JudgeClassifier:
+    """Predicts answer confidence from query and answer embeddings."""
+
+    def __init__(self, weights: np.ndarray, bias: float, escalate_below: float = 0.4):
+        """Initialize the judge.
+
+        Args:
+            weights: Coefficients over the concatenated embeddings
+            bias: Intercept
+            escalate_below: Confidence under which an answer is escalated
+        """
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.escalate_below = escalate_below
+
+    def predict(self, q_vecs: np.ndarray, a_vecs: np.ndarray) -> np.ndarray:
+        """Confidence that each answer is helpful.
+
+        Args:
+            q_vecs: (n, dim) query embeddings
+            a_vecs: (n, dim) answer embeddings
+
+        Returns:
+            (n,) probabilities in [0, 1]
+        """
+        features = np.hstack([np.asarray(q_vecs, dtype=np.float32), np.asarray(a_vecs, dtype=np.float32)])
+        return 1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias)))
+
+    def save(self, path: str):
+        """Write the weights to an `.npz` file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, escalate_below=self.escalate_below)
+
+    @classmethod
+    def load(cls, path: str) -> "JudgeClassifier":
+        """Load weights written by `save`."""
+        data = np.load(path)
+        return cls(data["weights"], float(data["bias"]), float(data["escalate_below"]))
+
+
+def feedback_training_set(feedback: List[Dict]) -> Tuple[List[str], List[str], List[int]]:
+    """Turn feedback records into (queries, answers, labels).
+
+    Ratings of 4-5 are helpful (1) and 1-2 unhelpful (0); neutral ratings of
+    3 are left out.
+    """
+    queries, answers, labels = [], [], []
+    for fb in feedback:
+        if fb.get('rating') == 3 or not fb.get('answer'):
+            continue
+        queries.append(fb['query'])
+        answers.append(fb['answer'])
+        labels.append(1 if fb['rating'] >= 4 else 0)
+    return queries, answers, labels
+
+
+def train_judge(feedback: List[Dict], embeddings, min_examples: int = 20) -> Optional[JudgeClassifier]:
+    """Fit a judge on historical feedback.
+
+    Args:
+        feedback: Records from `FeedbackCollector.get_all_feedback()`
+        embeddings: Object with `embed_documents(texts)`
+        min_examples: Minimum number of usable rated examples
+
+    Returns:
+        The trained judge, or None if there is too little or one-sided data
+    """
+    if not _SKLEARN_AVAILABLE:
+        raise RuntimeError("scikit-learn not installed. Add `scikit-learn` to requirements.txt")
+
+    queries, answers, labels = feedback_training_set(feedback)
+    if len(labels) < min_examples or len(set(labels)) < 2:
+        return None
+
+    if hasattr(embeddings, "embed_documents_array"):
+        vecs = embeddings.embed_documents_array(queries + answers)
+    else:
+        vecs = np.asarray(embeddings.embed_documents(queries + answers), dtype=np.float32)
+    features = np.hstack([vecs[:len(queries)], vecs[len(queries):]])
+
+    model = LogisticRegression(class_weight="balanced", max_iter=1000)
+    model.fit(features, np.asarray(labels))
+    return JudgeClassifier(model.coef_[0], model.intercept_[0])
@@ -0,0 +1,137 @@
+"""Async Hugging Face Inference API calls over shared keep-alive connections.
+
+LangChain's `HuggingFaceHub` has no native async path: `ainvoke` runs the
+blocking request in a worker thread. `HFInferenceClient` posts from the event
+loop instead, through one `httpx.AsyncClient` per loop, so concurrent queries
+share a pooled set of connections rather than each paying TCP and TLS setup.
+"""
+import asyncio
+import atexit
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import httpx
+    _HTTPX_AVAILABLE = True
+except Exception:
+    httpx = None
+    _HTTPX_AVAILABLE = False
+
+logger = logging.getLogger("customer_support.llm_client")
+
+_MAX_CONNECTIONS = 16
+_KEEPALIVE_SECONDS = 60.0
+
+# id(loop) -> (loop, client); an AsyncClient's connections belong to the loop that opened them
+_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, "httpx.AsyncClient"]] = {}
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """The keep-alive client for the running event loop, created on first use."""
+    if not _HTTPX_AVAILABLE:
+        raise RuntimeError("httpx not installed. Add `httpx` to requirements.txt")
+
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(id(loop))
+    # A new loop can reuse a closed loop's id
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=_MAX_CONNECTIONS,
+            max_keepalive_connections=_MAX_CONNECTIONS,
+            keepalive_expiry=_KEEPALIVE_SECONDS
+        ))
+        entry = _clients[id(loop)] = (loop, client)
+    return entry[1]
+
+
+async def aclose_async_client():
+    """Close the running loop's client, e.g. on application shutdown."""
+    entry = _clients.pop(id(asyncio.get_running_loop()), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+@atexit.register
+def _close_clients():
+    """Close clients whose loops are still usable; the rest died with their loop."""
+    while _clients:
+        _, (loop, client) = _clients.popitem()
+        if loop.is_closed() or loop.is_running():
+            continue
+        try:
+            loop.run_until_complete(client.aclose())
+        except Exception as e:
+            logger.debug(f"Failed to close HTTP client at exit: {e}")
+
+
+class HFInferenceClient:
+    """Text generation against the Hugging Face Inference API from async code.
+
+    Responses go through LangChain's global LLM cache (`set_llm_cache`) when
+    one is configured, as `HuggingFaceHub` calls do.
+    """
+
+    API_URL = "https://api-inference.huggingface.co/models/{repo_id}"
+
+    def __init__(self,
+                 repo_id: str,
+                 token: str,
+                 parameters: Optional[Dict[str, Any]] = None,
+                 timeout: float = 60.0):
+        """Initialize the client.
+
+        Args:
+            repo_id: Model repository on the Hub
+            token: Hugging Face API token
+            parameters: Generation parameters sent with every request
+            timeout: Request timeout in seconds
+        """
+        self.repo_id = repo_id
+        self.url = self.API_URL.format(repo_id=repo_id)
+        self.parameters = dict(parameters or {})
+        self.timeout = timeout
+        self._headers = {"Authorization": f"Bearer {token}"}
+        self._llm_string = f"hf_inference:{repo_id}:{sorted(self.parameters.items())}"
+
+    async def agenerate(self, prompt: str) -> str:
+        """Generate a completion for one prompt.
+
+        Args:
+            prompt: Full prompt text
+
+        Returns:
+            Generated text, without the prompt echoed by text-generation models
+        """
+        cache = _llm_cache()
+        if cache is not None:
+            hit = await cache.alookup(prompt, self._llm_string)
+            if hit:
+                return hit[0].text
+
+        response = await get_async_client().post(
+            self.url,
+            headers=self._headers,
+            json={"inputs": prompt, "parameters": self.parameters},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        text = data.get("generated_text", "")
+        if text.startswith(prompt):
+            text = text[len(prompt):]
+
+        if cache is not None:
+            from langchain_core.outputs import Generation
+            await cache.aupdate(prompt, self._llm_string, [Generation(text=text)])
+        return text
+
+
+def _llm_cache():
+    """LangChain's global LLM cache, or None when unset or LangChain is missing."""
+    try:
+        from langchain_core.globals import get_llm_cache
+    except Exception:
+        return None
+    return get_llm_cache()
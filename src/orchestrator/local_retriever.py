@@ -1,9 +1,27 @@
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 import numpy as np
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .scoring import l2_normalize, top_k_indices
+from .textfiles import read_texts
+
+logger = logging.getLogger("customer_support.local_retriever")
+
+# Bump when the layout of the pickled fit or the vectorizer settings change
+_FIT_CACHE_VERSION = 2
+
+# Vocabulary cap, bounding the matrix width on large knowledge bases
+_MAX_FEATURES = 50_000
 
 
 class SimpleDoc:
@@ -11,43 +29,266 @@ class SimpleDoc:
         self.page_content = page_content
         self.metadata = metadata or {}
 
+    @functools.cached_property
+    def content_lower(self) -> str:
+        """Lowercased `page_content`, computed once per document."""
+        return self.page_content.lower()
+
+
+def _make_vectorizer() -> TfidfVectorizer:
+    """TF-IDF with L2-normalized float32 rows and log-scaled term counts."""
+    return TfidfVectorizer(
+        stop_words="english",
+        dtype=np.float32,
+        max_features=_MAX_FEATURES,
+        sublinear_tf=True,
+        norm="l2"
+    )
+
+
+class _SparseSemanticCache:
+    """Like `semantic_cache.SemanticCache`, but for sparse TF-IDF rows.
+
+    Densified rows would cost the full vocabulary width per entry (up to
+    `_MAX_FEATURES` floats), so rows stay in CSR form and are compared with
+    one sparse product against all stored rows. Rows must be L2-normalized.
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row, value):
+        """Store a value under a 1-row sparse vector, replacing the oldest when full."""
+        if len(self._rows) < self.max_entries:
+            self._rows.append(row)
+            self._values.append(value)
+        else:
+            self._rows[self._next] = row
+            self._values[self._next] = value
+        self._next = (self._next + 1) % self.max_entries
+        self._stacked = None
+
+    def lookup_many(self, rows) -> List[Optional[Tuple[object, float]]]:
+        """Best (value, similarity) per query row, or None if nothing is close enough."""
+        if not self._rows:
+            return [None] * rows.shape[0]
+        if self._stacked is None:
+            self._stacked = sp.vstack(self._rows, format="csr").T.tocsr()
+        scores = (rows @ self._stacked).toarray()
+        best = scores.argmax(axis=1)
+        return [
+            (self._values[b], float(scores[r, b])) if scores[r, b] >= self.threshold else None
+            for r, b in enumerate(best)
+        ]
+
+    def clear(self):
+        """Remove all entries."""
+        self._rows: list = []
+        self._values: list = []
+        self._next = 0
+        self._stacked = None
+
 
 class LocalRetriever:
     """A very small retriever using TF-IDF over local files (no external API).
 
+    When `embeddings` (e.g. `HuggingFaceEmbeddings`) are given, documents are
+    embedded once at load into an L2-normalized float32 matrix and each query
+    is scored with a single matrix-vector product instead of TF-IDF.
+
+    Results are memoized per normalized query (case and whitespace) in an
+    LRU of `cache_size` entries. On the TF-IDF path, a query whose TF-IDF
+    vector has cosine similarity >= `semantic_threshold` with a recently
+    answered one reuses its documents; pass `semantic_threshold=None` to
+    only reuse exact repeats.
+
+    The fitted vectorizer, TF-IDF matrix and file contents are pickled under
+    `RETRIEVER_CACHE_DIR` (default `~/.cache/cso_retriever`) and reused while
+    no markdown file is added, removed or modified; set it to an empty string
+    to always refit.
+
     Usage:
         retriever = LocalRetriever(data_dir='examples/data')
         docs = retriever.get_relevant_documents('reset password')
     """
 
-    def __init__(self, data_dir: str = "examples/data", k: int = 4):
+    def __init__(self,
+                 data_dir: str = "examples/data",
+                 k: int = 4,
+                 embeddings=None,
+                 cache_size: int = 1024,
+                 semantic_threshold: Optional[float] = 0.85,
+                 cache_dir: Optional[str] = None):
         self.data_dir = Path(data_dir)
         self.k = k
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self._results: "OrderedDict[str, Tuple[SimpleDoc, ...]]" = OrderedDict()
+        # Guards `_results` and `_semantic`: one retriever can serve several
+        # threads, e.g. the Streamlit sessions sharing a cached resource
+        self._cache_lock = threading.Lock()
+        self._semantic: Optional[_SparseSemanticCache] = None
+        if semantic_threshold is not None and embeddings is None and cache_size > 0:
+            self._semantic = _SparseSemanticCache(max_entries=cache_size, threshold=semantic_threshold)
         self._docs: List[SimpleDoc] = []
         self._vectorizer = None
         self._matrix = None
+        self._matrix_t = None
+        self._emb: Optional[np.ndarray] = None
+        if cache_dir is None:
+            cache_dir = os.getenv("RETRIEVER_CACHE_DIR", "~/.cache/cso_retriever")
+        self._cache_file: Optional[Path] = None
+        if cache_dir:
+            dir_key = hashlib.blake2b(str(self.data_dir.resolve()).encode("utf-8"), digest_size=8)
+            self._cache_file = Path(cache_dir).expanduser() / f"tfidf_{dir_key.hexdigest()}.pkl"
         self._fit()
 
+    @staticmethod
+    def _corpus_signature(paths: List[Path]) -> str:
+        """Digest of every file's path, mtime and size."""
+        h = hashlib.blake2b(digest_size=16)
+        for p in paths:
+            st = p.stat()
+            h.update(f"{p}\0{st.st_mtime_ns}\0{st.st_size}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def _load_fit(self, signature: str):
+        """Return (texts, vectorizer, matrix) from the cache file if it matches."""
+        if self._cache_file is None or not self._cache_file.exists():
+            return None
+        try:
+            with open(self._cache_file, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable retriever cache {self._cache_file}: {e}")
+            return None
+        if data.get("version") != _FIT_CACHE_VERSION or data.get("signature") != signature:
+            return None
+        return data["texts"], data["vectorizer"], data["matrix"]
+
+    def _save_fit(self, signature: str, texts: List[str]):
+        if self._cache_file is None:
+            return
+        data = {
+            "version": _FIT_CACHE_VERSION,
+            "signature": signature,
+            "texts": texts,
+            "vectorizer": self._vectorizer,
+            "matrix": self._matrix,
+        }
+        tmp_file = self._cache_file.with_suffix(".tmp")
+        try:
+            self._cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self._cache_file)
+        except OSError as e:
+            logger.warning(f"Could not write retriever cache {self._cache_file}: {e}")
+
     def _fit(self):
-        texts = []
-        for p in sorted(self.data_dir.rglob("*.md")):
-            txt = p.read_text(encoding="utf-8")
-            texts.append(txt)
-            self._docs.append(SimpleDoc(page_content=txt, metadata={"source": str(p)}))
+        paths = sorted(self.data_dir.rglob("*.md"))
+        signature = self._corpus_signature(paths) if self._cache_file is not None else ""
+        fitted = self._load_fit(signature) if paths else None
+
+        if fitted is not None:
+            texts, self._vectorizer, self._matrix = fitted
+        else:
+            texts = read_texts(paths)
+
+        for p, txt in zip(paths, texts):
+            doc = SimpleDoc(page_content=txt, metadata={"source": str(p)})
+            doc.content_lower  # precompute for keyword scoring of answers
+            self._docs.append(doc)
 
         if texts:
-            self._vectorizer = TfidfVectorizer(stop_words="english").fit(texts)
-            self._matrix = self._vectorizer.transform(texts)
+            if fitted is None:
+                self._vectorizer = _make_vectorizer().fit(texts)
+                # Rows are L2-normalized, so a sparse dot product is the cosine similarity
+                self._matrix = self._vectorizer.transform(texts).tocsr()
+                self._save_fit(signature, texts)
+            self._matrix_t = self._matrix.T.tocsr()
         else:
-            self._vectorizer = TfidfVectorizer(stop_words="english")
+            self._vectorizer = _make_vectorizer()
             self._matrix = np.zeros((0, 0))
 
+        if self.embeddings is not None and texts:
+            if hasattr(self.embeddings, "embed_documents_array"):
+                emb = np.array(self.embeddings.embed_documents_array(texts), dtype=np.float32)
+            else:
+                emb = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            self._emb = np.ascontiguousarray(l2_normalize(emb, inplace=True))
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        if hasattr(self.embeddings, "embed_query_vectors"):
+            q = np.asarray(self.embeddings.embed_query_vectors(queries), dtype=np.float32)
+        else:
+            q = np.asarray([self.embeddings.embed_query(text) for text in queries], dtype=np.float32)
+        return l2_normalize(q)
+
+    def _scores(self, queries: List[str], tfidf=None) -> np.ndarray:
+        """(n_queries, n_docs) cosine similarities."""
+        if self._emb is not None:
+            return self._embed_queries(queries) @ self._emb.T
+        if tfidf is None:
+            tfidf = self._vectorizer.transform(queries)
+        return (tfidf @ self._matrix_t).toarray()
+
+    def _remember(self, key: str, docs: Tuple[SimpleDoc, ...]):
+        """Store a result; the caller holds `_cache_lock`."""
+        self._results[key] = docs
+        self._results.move_to_end(key)
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
     def get_relevant_documents(self, query: str) -> List[SimpleDoc]:
+        return self.batch_get_relevant_documents([query])[0]
+
+    def batch_get_relevant_documents(self, queries: List[str]) -> List[List[SimpleDoc]]:
+        """Score several queries against the corpus in one matrix product."""
         if self._matrix.size == 0:
-            return []
-        qv = self._vectorizer.transform([query])
-        scores = cosine_similarity(qv, self._matrix)[0]
-        idxs = np.argsort(scores)[::-1][: self.k]
-        return [self._docs[i] for i in idxs if scores[i] > 0]
+            return [[] for _ in queries]
+
+        keys = [" ".join(q.lower().split()) for q in queries]
+        results: List[Optional[Tuple[SimpleDoc, ...]]] = [None] * len(queries)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._results.get(key)
+                if cached is not None:
+                    self._results.move_to_end(key)
+                    results[i] = cached
+        misses = [i for i, docs in enumerate(results) if docs is None]
+
+        tfidf = None
+        if misses and self._semantic is not None:
+            # TF-IDF rows are L2-normalized, so the cache's dot product is their cosine
+            tfidf = self._vectorizer.transform([queries[i] for i in misses])
+            remaining = []
+            with self._cache_lock:
+                for row, match in enumerate(self._semantic.lookup_many(tfidf)):
+                    if match is None:
+                        remaining.append(row)
+                    else:
+                        results[misses[row]] = match[0]
+                        self._remember(keys[misses[row]], match[0])
+            tfidf = tfidf[remaining]
+            misses = [misses[row] for row in remaining]
+
+        if misses:
+            scores = self._scores([queries[i] for i in misses], tfidf)
+            for row, i in enumerate(misses):
+                idxs = top_k_indices(scores[row], self.k)
+                results[i] = tuple(self._docs[j] for j in idxs if scores[row, j] > 0)
+            with self._cache_lock:
+                for row, i in enumerate(misses):
+                    if self.cache_size > 0:
+                        self._remember(keys[i], results[i])
+                    if tfidf is not None and tfidf[row].nnz:
+                        self._semantic.add(tfidf[row], results[i])
+        return [list(docs) for docs in results]
 
     # compatibility helper used by run_demo when it calls `retriever.get_relevant_documents`
@@ -1,7 +1,22 @@
 """Conversation memory management for multi-turn conversations."""
-from typing import List, Dict, Optional
-from datetime import datetime
+from collections import deque
+from itertools import islice
+from typing import Deque, List, Dict, Optional
 import json
+import re
+
+from .timestamps import now_compact, now_isoformat
+
+# Follow-up indicators, matched by substring as one alternation built at import
+_FOLLOW_UP_PHRASES = (
+    'what about', 'how about', 'and', 'also', 'too',
+    'what if', 'can i also', 'do you also', 'is there',
+    'another question', 'one more', 'additionally'
+)
+_FOLLOW_UP_RE = re.compile('|'.join(re.escape(p) for p in _FOLLOW_UP_PHRASES))
+
+# Context line prefix per role; any role other than 'user' is the assistant
+_ROLE_PREFIXES = {'user': 'User: ', 'assistant': 'Assistant: '}
 
 
 class ConversationMemory:
@@ -14,17 +29,18 @@ class ConversationMemory:
             max_messages: Maximum number of messages to keep in memory
             session_id: Unique identifier for this conversation session
         """
-        self.messages: List[Dict] = []
+        # Bounded: appending past max_messages drops the oldest message
+        self.messages: Deque[Dict] = deque(maxlen=max_messages)
         self.max_messages = max_messages
         self.session_id = session_id or self._generate_session_id()
         self.metadata = {
-            'created_at': datetime.now().isoformat(),
+            'created_at': now_isoformat(),
             'total_messages': 0
         }
     
     def _generate_session_id(self) -> str:
         """Generate a unique session ID."""
-        return f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        return f"session_{now_compact()}"
     
     def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
         """Add a message to conversation history.
@@ -37,16 +53,24 @@ class ConversationMemory:
         message = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_isoformat(),
             "metadata": metadata or {}
         }
         
         self.messages.append(message)
         self.metadata['total_messages'] += 1
+    
+    def get_recent_messages(self, num_messages: int) -> List[Dict]:
+        """Get the most recent messages, oldest first.
         
-        # Keep only recent messages to avoid memory issues
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages:]
+        Args:
+            num_messages: Number of messages to return (all if not positive)
+            
+        Returns:
+            List of up to `num_messages` messages
+        """
+        start = len(self.messages) - num_messages if 0 < num_messages < len(self.messages) else 0
+        return list(islice(self.messages, start, None))
     
     def get_context(self, num_messages: int = 5) -> str:
         """Get conversation context as formatted string.
@@ -57,14 +81,10 @@ class ConversationMemory:
         Returns:
             Formatted conversation context
         """
-        recent_messages = self.messages[-num_messages:]
-        
-        context_parts = []
-        for msg in recent_messages:
-            role_label = "User" if msg["role"] == "user" else "Assistant"
-            context_parts.append(f"{role_label}: {msg['content']}")
-        
-        return "\n".join(context_parts)
+        return "\n".join(
+            _ROLE_PREFIXES.get(msg["role"], 'Assistant: ') + msg['content']
+            for msg in self.get_recent_messages(num_messages)
+        )
     
     def get_recent_topics(self) -> List[str]:
         """Extract recent topics from conversation.
@@ -73,7 +93,7 @@ class ConversationMemory:
             List of topics discussed (from metadata)
         """
         topics = set()
-        for msg in self.messages[-5:]:
+        for msg in self.get_recent_messages(5):
             if 'category' in msg.get('metadata', {}):
                 topics.add(msg['metadata']['category'])
         return list(topics)
@@ -84,11 +104,11 @@ class ConversationMemory:
         Returns:
             List of all messages
         """
-        return self.messages.copy()
+        return list(self.messages)
     
     def clear(self):
         """Clear conversation history."""
-        self.messages = []
+        self.messages.clear()
         self.metadata['total_messages'] = 0
     
     def to_dict(self) -> Dict:
@@ -99,7 +119,7 @@ class ConversationMemory:
         """
         return {
             'session_id': self.session_id,
-            'messages': self.messages,
+            'messages': list(self.messages),
             'metadata': self.metadata
         }
     
@@ -122,7 +142,7 @@ class ConversationMemory:
             ConversationMemory instance
         """
         memory = cls(session_id=data.get('session_id'))
-        memory.messages = data.get('messages', [])
+        memory.messages = deque(data.get('messages', []), maxlen=memory.max_messages)
         memory.metadata = data.get('metadata', {})
         return memory
     
@@ -154,23 +174,14 @@ class ConversationMemory:
         Returns:
             True if query appears to be a follow-up
         """
-        query_lower = query.lower()
-        
-        # Follow-up indicators
-        follow_up_phrases = [
-            'what about', 'how about', 'and', 'also', 'too',
-            'what if', 'can i also', 'do you also', 'is there',
-            'another question', 'one more', 'additionally'
-        ]
-        
         # Short queries often reference previous context
         if len(query.split()) <= 3:
             return True
         
         # Check for follow-up phrases
-        for phrase in follow_up_phrases:
-            if phrase in query_lower:
-                return True
+        query_lower = query.lower()
+        if _FOLLOW_UP_RE.search(query_lower):
+            return True
         
         # Check if query references recent topics
         recent_topics = self.get_recent_topics()
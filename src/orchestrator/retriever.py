@@ -1,7 +1,17 @@
+import asyncio
+import functools
+import logging
 import os
-from typing import List
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
 
 from .embeddings import HuggingFaceEmbeddings
+from .scoring import l2_normalize
+from .semantic_cache import SemanticCache
 
 try:
     from langchain.vectorstores import Chroma
@@ -17,59 +27,480 @@ except Exception:
     chromadb = None
     _CHROMADB = False
 
+logger = logging.getLogger("customer_support.retriever")
+
+AnnProfile = Literal["fast", "balanced", "recall"]
+
+# Per-search recall/latency trade-offs for the in-process FAISS index:
+# `ef_search` applies to HNSW graphs, `nprobe` to IVF indexes. The graph
+# degree is fixed when the index is built (`VectorStoreConfig.hnsw_m`).
+ANN_PROFILES = {
+    "fast": {"ef_search": 16, "nprobe": 4},
+    "balanced": {"ef_search": 64, "nprobe": 16},
+    "recall": {"ef_search": 256, "nprobe": 64},
+}
+
 
 class SimpleDoc:
     def __init__(self, page_content: str, metadata: dict | None = None):
         self.page_content = page_content
         self.metadata = metadata or {}
 
+    @functools.cached_property
+    def content_lower(self) -> str:
+        """Lowercased `page_content`, computed once per document."""
+        return self.page_content.lower()
 
-def _make_chromadb_retriever(collection, embeddings, k: int):
-    def get_relevant_documents(query: str) -> List[SimpleDoc]:
-        q_emb = embeddings.embed_query(query)
-        # chromadb collection.query expects list of embeddings
-        resp = collection.query(query_embeddings=[q_emb], n_results=k, include=["documents", "metadatas"])
-        docs = []
-        items = resp.get("documents", [[]])[0]
-        metas = resp.get("metadatas", [[]])[0]
-        for d, m in zip(items, metas):
-            docs.append(SimpleDoc(page_content=d, metadata=m))
-        return docs
 
-    return get_relevant_documents
+class RetrieverWrapper:
+    """Retriever over a chromadb collection exposing `get_relevant_documents(query)`.
 
+    Query embeddings go through the embeddings' LRU, and callers that already
+    hold a query vector can search with it directly. Search methods take an
+    optional `ann_profile` overriding the default recall/latency trade-off.
+    Profiles only apply to an attached ANN index, where they are passed per
+    search call; Chroma queries ignore them and use the collection's own
+    `hnsw:search_ef`, since changing it would modify shared, persisted state.
 
-def get_retriever(persist_directory: str = "./.chroma", k: int = 4):
-    """Load the Chroma vectorstore and return a retriever-like object.
+    Results are cached in two tiers per (k, ann_profile): an exact LRU of
+    `cache_size` query strings, then the nearest cached query embedding with
+    cosine similarity >= `semantic_threshold` (None disables that tier).
+    Hits skip the vector search; `clear_cache` drops both after the
+    collection or index changes.
 
-    If `langchain`'s `Chroma` is available, returns its retriever. Otherwise
-    falls back to a small chromadb-based retriever compatible with the
-    `get_relevant_documents(query)` shape used in the demo.
+    Chroma queries return only ids and metadata. Document text is fetched
+    with one `get` for the ids not seen before and kept in an LRU of
+    `document_cache_size` documents, so popular documents are not shipped
+    over the transport on every query.
     """
-    hf_model = os.getenv("HUGGINGFACE_EMBEDDING_MODEL")
-    embeddings = HuggingFaceEmbeddings(model_name=hf_model)
 
-    if _LANGCHAIN_CHROMA and Chroma is not None:
-        vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-        retriever = vectordb.as_retriever(search_kwargs={"k": k})
-        return retriever
+    def __init__(self,
+                 collection,
+                 embeddings,
+                 k: int,
+                 ann_profile: AnnProfile = "balanced",
+                 cache_size: int = 1024,
+                 semantic_threshold: Optional[float] = 0.97,
+                 document_cache_size: int = 4096):
+        self.collection = collection
+        self.embeddings = embeddings
+        self.k = k
+        self.ann_profile = ann_profile
+        self.index = None  # optional in-process ANN index, see `attach_index`
+        self.cache_size = cache_size
+        self.semantic_threshold = semantic_threshold
+        self._cache_lock = threading.Lock()
+        self._results: "OrderedDict[Tuple[str, int, str], Tuple[SimpleDoc, ...]]" = OrderedDict()
+        self._semantic: Dict[Tuple[int, str], SemanticCache] = {}
+        self.document_cache_size = document_cache_size
+        self._documents: "OrderedDict[str, SimpleDoc]" = OrderedDict()
+        self.centroid: Optional[np.ndarray] = None  # see `compute_centroid`
+        self.scope_threshold: Optional[float] = None
+
+    def attach_index(self, index):
+        """Serve searches from an in-process ANN index (e.g. `FaissIndex`) instead of Chroma."""
+        self.index = index
+        self.clear_cache()
+
+    def ingest(self,
+               texts: List[str],
+               metadatas: Optional[List[dict]] = None,
+               ids: Optional[List[str]] = None,
+               batch_size: int = 5000) -> int:
+        """Embed texts and add them to the collection in large batches.
+
+        Each batch is embedded in one call (the model pads and runs its own
+        sub-batches) and written with one `collection.add` carrying the
+        precomputed vectors, which is far faster than per-document adds.
+        Cached results are dropped afterwards; an attached ANN index is not
+        updated and should be rebuilt by the caller.
+
+        Args:
+            texts: Document texts
+            metadatas: Optional metadata per text
+            ids: Optional ids per text; generated from the collection size if omitted
+            batch_size: Documents per `add` call, capped by the client's maximum
+
+        Returns:
+            Number of documents added
+        """
+        if not texts:
+            return 0
+        if ids is None:
+            offset = self.collection.count()
+            ids = [f"doc-{offset + i}" for i in range(len(texts))]
+        max_batch = getattr(getattr(self.collection, "_client", None), "max_batch_size", None)
+        if isinstance(max_batch, int) and max_batch > 0:
+            batch_size = min(batch_size, max_batch)
+
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            if hasattr(self.embeddings, "embed_documents_array"):
+                embs = self.embeddings.embed_documents_array(batch)
+            else:
+                embs = self.embeddings.embed_documents(batch)
+            self.collection.add(
+                ids=ids[start:start + batch_size],
+                documents=batch,
+                metadatas=metadatas[start:start + batch_size] if metadatas is not None else None,
+                embeddings=embs
+            )
+        self.clear_cache()
+        logger.info(f"Ingested {len(texts)} documents in batches of up to {batch_size}")
+        return len(texts)
+
+    def compute_centroid(self, threshold: float, page_size: int = 5000) -> Optional[np.ndarray]:
+        """Average the stored embeddings to enable `is_out_of_scope`.
+
+        The mean of the L2-normalized document vectors points at what the
+        corpus is about; a query far from it can be refused before retrieval
+        or the LLM run. Recompute after ingesting new documents.
+
+        Args:
+            threshold: Minimum query cosine similarity to the centroid
+            page_size: Embeddings read per `collection.get`
+
+        Returns:
+            The unit centroid, or None for an empty collection
+        """
+        total = None
+        offset = 0
+        while True:
+            page = self.collection.get(include=["embeddings"], limit=page_size, offset=offset)
+            embs = page.get("embeddings")
+            if embs is None or not len(embs):
+                break
+            unit = l2_normalize(embs).sum(axis=0)
+            total = unit if total is None else total + unit
+            offset += len(embs)
+        self.centroid = None if total is None else l2_normalize(total)
+        self.scope_threshold = threshold
+        return self.centroid
+
+    def is_out_of_scope(self, vec) -> bool:
+        """Whether a query embedding is too far from the corpus centroid to answer.
+
+        Always False until `compute_centroid` has run.
+        """
+        if self.centroid is None or self.scope_threshold is None:
+            return False
+        return float(l2_normalize(vec).ravel() @ self.centroid) < self.scope_threshold
+
+    def activate_numba_scorer(self) -> bool:
+        """Compile the rerank and top-k kernels used by an attached vector index.
+
+        Compilation happens once per process (Numba caches it on disk), so
+        call this at setup rather than paying for it on the first query.
+
+        Returns:
+            True if Numba is available, False if the NumPy fallbacks are used
+        """
+        from .scoring import warmup_scoring
+
+        return warmup_scoring()
+
+    def clear_cache(self):
+        """Forget cached results, e.g. after documents were ingested."""
+        with self._cache_lock:
+            self._results.clear()
+            self._semantic = {}
+            self._documents.clear()
+
+    def _cached(self, queries: List[str], k: int, profile: str) -> List[Optional[Tuple[SimpleDoc, ...]]]:
+        """Exact-tier lookups; None for each miss."""
+        if self.cache_size <= 0:
+            return [None] * len(queries)
+        hits = []
+        with self._cache_lock:
+            for query in queries:
+                key = (query, k, profile)
+                docs = self._results.get(key)
+                if docs is not None:
+                    self._results.move_to_end(key)
+                hits.append(docs)
+        return hits
+
+    def _search_vectors_cached(self, q_embs: np.ndarray, k: int, ann_profile: Optional[AnnProfile],
+                               queries: Optional[List[str]] = None) -> List[List[SimpleDoc]]:
+        """Search with embeddings through the similarity tier, caching what is searched."""
+        profile = ann_profile or self.ann_profile
+        results: List[Optional[Tuple[SimpleDoc, ...]]] = [None] * len(q_embs)
+        semantic = None
+        if self.semantic_threshold is not None and self.cache_size > 0:
+            with self._cache_lock:
+                semantic = self._semantic.get((k, profile))
+                if semantic is None:
+                    semantic = self._semantic[(k, profile)] = SemanticCache(
+                        max_entries=self.cache_size, threshold=self.semantic_threshold
+                    )
+                for i, vec in enumerate(q_embs):
+                    match = semantic.lookup(vec)
+                    if match is not None:
+                        results[i] = match[0]
+
+        misses = [i for i, docs in enumerate(results) if docs is None]
+        searched = set(misses)
+        if misses:
+            found = self._search(q_embs[misses].tolist(), k, ann_profile)
+            for i, docs in zip(misses, found):
+                results[i] = tuple(docs)
+
+        if self.cache_size > 0:
+            with self._cache_lock:
+                for i, docs in enumerate(results):
+                    if queries is not None:
+                        key = (queries[i], k, profile)
+                        self._results[key] = docs
+                        self._results.move_to_end(key)
+                    if semantic is not None and i in searched:
+                        semantic.add(q_embs[i], docs)
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+        return [list(docs) for docs in results]
+
+    def _search(self, q_embs, k: int, ann_profile: Optional[AnnProfile] = None) -> List[List[SimpleDoc]]:
+        if self.index is not None:
+            params = ANN_PROFILES[ann_profile or self.ann_profile]
+            return self.index.search(q_embs, k, ef_search=params["ef_search"], nprobe=params["nprobe"])
+        return self._query_collection(q_embs, k)
+
+    def _query_collection(self, q_embs, k: int) -> List[List[SimpleDoc]]:
+        """Query Chroma for ids and metadata, fetching text only for unseen documents."""
+        # chromadb collection.query expects list of embeddings; ids are always returned
+        resp = self.collection.query(query_embeddings=q_embs, n_results=k, include=["metadatas"])
+        id_rows = resp.get("ids") or []
+        meta_rows = resp.get("metadatas") or []
+
+        known: Dict[str, SimpleDoc] = {}
+        with self._cache_lock:
+            for doc_id in {doc_id for row in id_rows for doc_id in row}:
+                doc = self._documents.get(doc_id)
+                if doc is not None:
+                    self._documents.move_to_end(doc_id)
+                    known[doc_id] = doc
+        missing = [doc_id for row in id_rows for doc_id in row if doc_id not in known]
+        if missing:
+            page = self.collection.get(ids=list(dict.fromkeys(missing)), include=["documents"])
+            texts = dict(zip(page["ids"], page["documents"]))
+            for ids, metas in zip(id_rows, meta_rows):
+                for doc_id, meta in zip(ids, metas):
+                    if doc_id not in known:
+                        known[doc_id] = SimpleDoc(page_content=texts.get(doc_id) or "", metadata=meta)
+            with self._cache_lock:
+                for doc_id in texts:
+                    self._documents[doc_id] = known[doc_id]
+                while len(self._documents) > self.document_cache_size:
+                    self._documents.popitem(last=False)
+
+        return [[known[doc_id] for doc_id in ids] for ids in id_rows]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embeddings.embed_query_vector(query)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Embed a query off the event loop, batched with concurrent callers when supported."""
+        if hasattr(self.embeddings, "aembed_query_vector"):
+            return await self.embeddings.aembed_query_vector(query)
+        return await asyncio.to_thread(self.embed_query, query)
+
+    def get_relevant_documents(self, query: str, ann_profile: Optional[AnnProfile] = None) -> List[SimpleDoc]:
+        return self.batch_get_relevant_documents([query], ann_profile=ann_profile)[0]
+
+    def get_relevant_documents_with_vector(self, vec, top_k: Optional[int] = None,
+                                           ann_profile: Optional[AnnProfile] = None) -> List[SimpleDoc]:
+        """Search with a precomputed query embedding."""
+        q_embs = np.asarray(vec, dtype=np.float32).reshape(1, -1)
+        return self._search_vectors_cached(q_embs, top_k or self.k, ann_profile)[0]
+
+    def batch_get_relevant_documents(self, queries: List[str],
+                                     ann_profile: Optional[AnnProfile] = None) -> List[List[SimpleDoc]]:
+        """Retrieve documents for several queries with one embedding pass and one query call."""
+        if not queries:
+            return []
+        hits = self._cached(queries, self.k, ann_profile or self.ann_profile)
+        misses = [i for i, docs in enumerate(hits) if docs is None]
+        results = [list(docs) if docs is not None else None for docs in hits]
+        if misses:
+            miss_queries = [queries[i] for i in misses]
+            q_embs = np.asarray(self.embeddings.embed_query_vectors(miss_queries), dtype=np.float32)
+            found = self._search_vectors_cached(q_embs, self.k, ann_profile, queries=miss_queries)
+            for i, docs in zip(misses, found):
+                results[i] = docs
+        return results
+
+    async def abatch_get_relevant_documents(self, queries: List[str],
+                                            ann_profile: Optional[AnnProfile] = None) -> List[List[SimpleDoc]]:
+        """Async `batch_get_relevant_documents`, e.g. for multi-query expansion.
+
+        Uncached queries are embedded concurrently (coalesced into one encode
+        call by the embeddings' micro-batcher) and searched together in one
+        collection or index call off the event loop.
+        """
+        if not queries:
+            return []
+        hits = self._cached(queries, self.k, ann_profile or self.ann_profile)
+        misses = [i for i, docs in enumerate(hits) if docs is None]
+        results = [list(docs) if docs is not None else None for docs in hits]
+        if misses:
+            miss_queries = [queries[i] for i in misses]
+            if hasattr(self.embeddings, "aembed_query_vector"):
+                vecs = await asyncio.gather(*(self.embeddings.aembed_query_vector(q) for q in miss_queries))
+                q_embs = np.asarray(np.stack(vecs), dtype=np.float32)
+            else:
+                q_embs = np.asarray(
+                    await asyncio.to_thread(self.embeddings.embed_query_vectors, miss_queries), dtype=np.float32
+                )
+            found = await asyncio.to_thread(
+                self._search_vectors_cached, q_embs, self.k, ann_profile, miss_queries
+            )
+            for i, docs in zip(misses, found):
+                results[i] = docs
+        return results
 
+
+def batch_get_relevant_documents(retriever, queries: List[str],
+                                 ann_profile: Optional[AnnProfile] = None) -> List[list]:
+    """Retrieve documents for several queries using the retriever's batched path if it has one.
+
+    Falls back to LangChain's Runnable `batch` and finally to one call per query.
+    `ann_profile` is only honoured by retrievers with an ANN index.
+    """
+    if hasattr(retriever, "batch_get_relevant_documents"):
+        if isinstance(retriever, RetrieverWrapper):
+            return retriever.batch_get_relevant_documents(queries, ann_profile=ann_profile)
+        return retriever.batch_get_relevant_documents(queries)
+    if hasattr(retriever, "batch"):
+        return retriever.batch(queries)
+    return [retriever.get_relevant_documents(q) for q in queries]
+
+
+async def abatch_get_relevant_documents(retriever, queries: List[str],
+                                        ann_profile: Optional[AnnProfile] = None) -> List[list]:
+    """Async `batch_get_relevant_documents` that keeps the event loop free.
+
+    Uses the retriever's own coroutine when it has one, then LangChain's
+    Runnable `abatch`, and otherwise runs the blocking batched path in a thread.
+    """
+    if isinstance(retriever, RetrieverWrapper):
+        return await retriever.abatch_get_relevant_documents(queries, ann_profile=ann_profile)
+    if hasattr(retriever, "abatch") and not hasattr(retriever, "batch_get_relevant_documents"):
+        return await retriever.abatch(queries)
+    return await asyncio.to_thread(batch_get_relevant_documents, retriever, queries, ann_profile)
+
+
+def chroma_client(persist_directory: str):
+    """Open the Chroma store, on a server when `CHROMA_HTTP_URL` is set.
+
+    `PersistentClient` keeps the collection's HNSW index in this process's
+    memory (on the order of 100 GB per million vectors with payloads) and
+    blocks on disk writes, so it suits development and small knowledge
+    bases. With `CHROMA_HTTP_URL` (e.g. `http://localhost:8001`) an
+    `HttpClient` talks to a Chroma server, which owns that memory and takes
+    writes while the API keeps serving queries.
+
+    Args:
+        persist_directory: Local persistence directory used without a server
+
+    Returns:
+        A chromadb client
+    """
     if not _CHROMADB:
-        raise RuntimeError("No Chroma/Chromadb available. Install requirements and try again.")
+        raise RuntimeError("chromadb not installed. Add `chromadb` to requirements.txt")
+
+    url = os.getenv("CHROMA_HTTP_URL")
+    if url:
+        parts = urlsplit(url)
+        ssl = parts.scheme == "https"
+        return chromadb.HttpClient(host=parts.hostname or "localhost",
+                                   port=parts.port or (443 if ssl else 8000), ssl=ssl)
 
     # Use new PersistentClient API (legacy Client(Settings) is deprecated)
     try:
-        client = chromadb.PersistentClient(path=persist_directory)
+        return chromadb.PersistentClient(path=persist_directory)
     except Exception:
         # Fallback: in-memory client if persistent path fails
-        client = chromadb.Client()
+        return chromadb.Client()
+
+
+def setup_retriever(vector_store_config) -> RetrieverWrapper:
+    """Open the retriever described by a `VectorStoreConfig`.
+
+    Args:
+        vector_store_config: `config.vector_store` section
+
+    Returns:
+        The shared `get_retriever` instance for those settings, with the
+        scoring kernels compiled when candidates will be reranked and the
+        corpus centroid computed when `scope_threshold` is set
+    """
+    retriever = get_retriever(
+        persist_directory=vector_store_config.persist_directory,
+        ann_profile=vector_store_config.ann_profile,
+        cache_size=vector_store_config.retrieval_cache_size,
+        semantic_threshold=vector_store_config.retrieval_semantic_threshold
+    )
+    if vector_store_config.rerank_factor > 0:
+        retriever.activate_numba_scorer()
+    if vector_store_config.scope_threshold is not None and retriever.centroid is None:
+        retriever.compute_centroid(vector_store_config.scope_threshold)
+    return retriever
+
+
+@functools.lru_cache(maxsize=4)
+def _shared_embeddings(model_name: Optional[str]) -> HuggingFaceEmbeddings:
+    """One loaded embedding model per name, shared by every retriever in the process."""
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+@functools.lru_cache(maxsize=4)
+def get_retriever(persist_directory: str = "./.chroma",
+                  k: int = 4,
+                  ann_profile: AnnProfile = "balanced",
+                  cache_size: int = 1024,
+                  semantic_threshold: Optional[float] = 0.97,
+                  document_cache_size: int = 4096):
+    """Load the Chroma vectorstore and return a retriever-like object.
+
+    If `langchain`'s `Chroma` is available, the collection it persisted is
+    opened through it. Otherwise falls back to chromadb directly. Either way
+    the result is a `RetrieverWrapper` compatible with the
+    `get_relevant_documents(query)` shape used in the demo. The store is
+    opened with `chroma_client`, so `CHROMA_HTTP_URL` selects a Chroma server.
+
+    Retrievers are cached per argument set, so repeated calls reuse the
+    Chroma client and the loaded embedding model.
+
+    Args:
+        persist_directory: Chroma persistence directory
+        k: Number of documents returned per query
+        ann_profile: Default ANN search profile, one of `ANN_PROFILES`
+        cache_size: Entries in the retriever's result cache (0 disables it)
+        semantic_threshold: Query similarity for reusing cached results (None disables)
+        document_cache_size: Documents whose text is kept between Chroma queries
+    """
+    if ann_profile not in ANN_PROFILES:
+        raise ValueError(f"Unknown ann_profile {ann_profile!r}; expected one of {list(ANN_PROFILES)}")
+
+    hf_model = os.getenv("HUGGINGFACE_EMBEDDING_MODEL")
+    embeddings = _shared_embeddings(hf_model)
+
+    wrapper_kwargs = dict(ann_profile=ann_profile, cache_size=cache_size,
+                          semantic_threshold=semantic_threshold, document_cache_size=document_cache_size)
+
+    if _LANGCHAIN_CHROMA and Chroma is not None:
+        if os.getenv("CHROMA_HTTP_URL"):
+            vectordb = Chroma(client=chroma_client(persist_directory), embedding_function=embeddings)
+        else:
+            vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+        # Query the underlying collection directly so precomputed vectors can be reused
+        return RetrieverWrapper(vectordb._collection, embeddings, k, **wrapper_kwargs)
+
+    if not _CHROMADB:
+        raise RuntimeError("No Chroma/Chromadb available. Install requirements and try again.")
+
+    client = chroma_client(persist_directory)
     try:
         collection = client.get_collection("orchestrator")
     except Exception:
         collection = client.create_collection("orchestrator")
-    # return a function-like object with get_relevant_documents
-    class RetrieverWrapper:
-        def get_relevant_documents(self, query: str):
-            return _make_chromadb_retriever(collection, embeddings, k)(query)
-
-    return RetrieverWrapper()
+    return RetrieverWrapper(collection, embeddings, k, **wrapper_kwargs)
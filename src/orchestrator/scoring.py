@@ -0,0 +1,144 @@
+"""Vector scoring kernels used to rerank retrieval candidates.
+
+`score_chunks` and `top_k_indices` are JIT-compiled with Numba when it is
+installed and fall back to NumPy (a matrix-vector product and
+`argpartition`) otherwise.
+"""
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import numba
+    _NUMBA_AVAILABLE = True
+except Exception:
+    numba = None
+    _NUMBA_AVAILABLE = False
+
+
+def _score_chunks_numpy(query_vec: np.ndarray, mat: np.ndarray) -> np.ndarray:
+    return mat @ query_vec
+
+
+if _NUMBA_AVAILABLE:
+    @numba.njit(fastmath=True, parallel=True, cache=True)
+    def _score_chunks(query_vec, mat):
+        n, d = mat.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in numba.prange(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += mat[i, j] * query_vec[j]
+            out[i] = acc
+        return out
+else:
+    _score_chunks = _score_chunks_numpy
+
+
+def _top_k_numpy(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _top_k_jit_ready(scores, k):
+    """Insertion into a sorted buffer of `k` slots: one pass, no full sort."""
+    n = scores.shape[0]
+    k = min(k, n)
+    best = np.empty(k, dtype=np.int64)
+    best_scores = np.empty(k, dtype=scores.dtype)
+    filled = 0
+    for i in range(n):
+        s = scores[i]
+        if filled == k and s <= best_scores[k - 1]:
+            continue
+        j = filled if filled < k else k - 1
+        while j > 0 and best_scores[j - 1] < s:
+            best[j] = best[j - 1]
+            best_scores[j] = best_scores[j - 1]
+            j -= 1
+        best[j] = i
+        best_scores[j] = s
+        if filled < k:
+            filled += 1
+    return best
+
+
+if _NUMBA_AVAILABLE:
+    _top_k = numba.njit(cache=True)(_top_k_jit_ready)
+else:
+    _top_k = _top_k_numpy
+
+
+def l2_normalize(vectors, inplace: bool = False) -> np.ndarray:
+    """Scale a vector or the rows of a matrix to unit L2 norm.
+
+    Normalizing once up front turns every later similarity into a plain dot
+    product.
+
+    Args:
+        vectors: (dim,) or (n, dim) embeddings
+        inplace: Divide a float32 array in place instead of allocating a
+            copy; use the returned array either way
+
+    Returns:
+        float32 array of the same shape; zero vectors stay zero
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    if inplace:
+        vectors /= norms
+        return vectors
+    return vectors / norms
+
+
+def score_chunks(query_vec: np.ndarray, mat: np.ndarray) -> np.ndarray:
+    """Dot-product score of one query against every row of `mat`.
+
+    Args:
+        query_vec: (dim,) float32 query embedding
+        mat: (n, dim) float32 candidate embeddings
+
+    Returns:
+        (n,) float32 scores; cosine similarity when both sides are L2-normalized
+    """
+    return _score_chunks(
+        np.ascontiguousarray(query_vec, dtype=np.float32),
+        np.ascontiguousarray(mat, dtype=np.float32)
+    )
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first, without a full sort.
+
+    Args:
+        scores: (n,) scores
+        k: Number of indices to select
+
+    Returns:
+        (min(k, n),) int64 indices
+    """
+    scores = np.ascontiguousarray(scores)
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.int64)
+    return _top_k(scores, k)
+
+
+def top_k(query_vec: np.ndarray, mat: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and scores of the `k` best-scoring rows, best first."""
+    scores = score_chunks(query_vec, mat)
+    order = top_k_indices(scores, k)
+    return order, scores[order]
+
+
+def warmup_scoring() -> bool:
+    """Compile (or load from Numba's on-disk cache) the scoring kernels.
+
+    Returns:
+        True if the Numba kernels are in use, False for the NumPy fallbacks
+    """
+    scores = score_chunks(np.zeros(4, dtype=np.float32), np.zeros((2, 4), dtype=np.float32))
+    top_k_indices(scores, 1)
+    return _NUMBA_AVAILABLE
@@ -0,0 +1,227 @@
+"""Similarity-keyed caching for paraphrased queries.
+
+`SemanticCache` maps embeddings to values by cosine similarity.
+`SemanticQueryCache` layers it under the exact-match `QueryCache`, so
+"How do I reset my password" can be answered from the cached response to
+"how can I reset password" without running retrieval and the LLM again.
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import QueryCache
+from .scoring import l2_normalize, score_chunks
+
+
+class SemanticCache:
+    """Fixed-size ring buffer of unit vectors searched by exact inner product.
+
+    Entries are L2-normalized on insert, so a dot product is the cosine
+    similarity. Once full, new entries overwrite the oldest.
+    """
+
+    def __init__(self,
+                 max_entries: int = 1000,
+                 threshold: float = 0.95,
+                 safe_radius: float = 0.0,
+                 compare_key: Optional[Callable[[Any], Any]] = None):
+        """Initialize an empty cache.
+
+        Args:
+            max_entries: Number of vectors kept
+            threshold: Minimum cosine similarity for a hit
+            safe_radius: When > 0, a hit is refused if an entry with a
+                different value scores within this distance of the best
+                match, so a query sitting between two cached answers misses
+            compare_key: Maps a value to what the `safe_radius` check
+                compares (values themselves by default); entries mapped to
+                None are left out of the check
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.safe_radius = safe_radius
+        self.compare_key = compare_key
+        self._vectors: Optional[np.ndarray] = None  # allocated on first add
+        self._values: List[Any] = [None] * max_entries
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        return l2_normalize(np.asarray(vector, dtype=np.float32).ravel())
+
+    def add(self, vector, value: Any):
+        """Store a value under an embedding, replacing the oldest when full."""
+        vector = self._unit(vector)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        self._vectors[self._next] = vector
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+
+    def lookup(self, vector) -> Optional[Tuple[Any, float]]:
+        """Find the value of the most similar stored embedding.
+
+        Args:
+            vector: Query embedding
+
+        Returns:
+            Tuple of (value, similarity), or None if nothing is close enough
+        """
+        if not self._count:
+            return None
+
+        scores = score_chunks(self._unit(vector), self._vectors[:self._count])
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        if similarity < self.threshold:
+            return None
+
+        value = self._values[best]
+        if self.safe_radius > 0:
+            compare_key = self.compare_key or (lambda v: v)
+            best_key = compare_key(value)
+            for i in np.flatnonzero(scores >= similarity - self.safe_radius):
+                other = compare_key(self._values[i])
+                if other is not None and other != best_key:
+                    return None
+        return value, similarity
+
+    def clear(self):
+        """Remove all entries."""
+        self._vectors = None
+        self._values = [None] * self.max_entries
+        self._next = 0
+        self._count = 0
+
+
+class SemanticQueryCache(QueryCache):
+    """`QueryCache` that also serves paraphrases of cached queries.
+
+    Lookups try the exact local tier, then the shared backend, then the
+    nearest cached query embedding. Embeddings go through the retriever's
+    embedding LRU, so the one computed on a miss is reused for retrieval.
+    Similarity matches only consider entries cached with the same `top_k`.
+    """
+
+    def __init__(self,
+                 ttl_minutes: int = 60,
+                 max_size: int = 1000,
+                 backend=None,
+                 embeddings=None,
+                 threshold: float = 0.95,
+                 safe_radius: float = 0.0):
+        """Initialize the cache.
+
+        Args:
+            ttl_minutes: Time-to-live for cache entries in minutes
+            max_size: Maximum number of entries to store
+            backend: Optional shared cache tier
+            embeddings: Object with `embed_query_vector` or `embed_query`;
+                similarity lookups are skipped until one is attached
+            threshold: Minimum cosine similarity between queries for a hit
+            safe_radius: Ambiguity margin, see `SemanticCache`
+        """
+        super().__init__(ttl_minutes=ttl_minutes, max_size=max_size, backend=backend)
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.safe_radius = safe_radius
+        self.semantic_hits = 0
+        self._semantic: Dict[Optional[int], SemanticCache] = {}
+
+    def attach_embeddings(self, embeddings):
+        """Enable similarity lookups with the given embeddings."""
+        self.embeddings = embeddings
+
+    def _embed(self, query: str) -> np.ndarray:
+        if hasattr(self.embeddings, "embed_query_vector"):
+            return self.embeddings.embed_query_vector(query)
+        return np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+
+    def _semantic_lookup(self, vector, top_k: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Find a live entry for the nearest cached query and count it as a hit."""
+        index = self._semantic.get(top_k)
+        match = index.lookup(vector) if index is not None else None
+        if match is None:
+            return None
+
+        key, _ = match
+        entry = self.cache.get(key)
+        # The exact tier may have expired or evicted the entry since it was indexed
+        if entry is None or not self._is_live(entry):
+            return None
+
+        self.cache.move_to_end(key)
+        entry['hit_count'] += 1
+        self.misses -= 1
+        self.hits += 1
+        self.semantic_hits += 1
+        return entry
+
+    def _cached_answer(self, key) -> Optional[str]:
+        """Answer cached under an exact-tier key: paraphrases with the same answer never conflict."""
+        entry = self.cache.get(key)
+        return entry['response'].get('answer') if entry is not None else None
+
+    def _index_query(self, query: str, top_k: Optional[int], vector):
+        index = self._semantic.get(top_k)
+        if index is None:
+            index = self._semantic[top_k] = SemanticCache(
+                max_entries=self.max_size,
+                threshold=self.threshold,
+                safe_radius=self.safe_radius,
+                compare_key=self._cached_answer
+            )
+        index.add(vector, self._get_cache_key(query, top_k))
+
+    def get(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        entry = self._lookup(query, top_k)
+        if entry is None and self.embeddings is not None:
+            entry = self._semantic_lookup(self._embed(query), top_k)
+        return entry['response'] if entry else None
+
+    async def _alookup(self, query: str, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        entry = await super()._alookup(query, top_k)
+        if entry is not None or self.embeddings is None:
+            return entry
+
+        return self._semantic_lookup(await self._aembed(query), top_k)
+
+    async def _aembed(self, query: str) -> np.ndarray:
+        # Encoding a new query is CPU work; keep it off the event loop
+        if hasattr(self.embeddings, "aembed_query_vector"):
+            return await self.embeddings.aembed_query_vector(query)
+        return await asyncio.to_thread(self._embed, query)
+
+    async def _aset_local(self, query: str, response: Dict[str, Any], top_k: Optional[int] = None):
+        vector = await self._aembed(query) if self.embeddings is not None else None
+        self.set(query, response, top_k, vector=vector)
+
+    def set(self, query: str, response: Dict[str, Any], top_k: Optional[int] = None, vector=None):
+        """Cache a response and index its query embedding.
+
+        Args:
+            query: Query string
+            response: Response to cache
+            top_k: Number of documents requested
+            vector: Precomputed query embedding; embedded here, blocking, when omitted
+        """
+        super().set(query, response, top_k)
+        if self.embeddings is not None:
+            self._index_query(query, top_k, self._embed(query) if vector is None else vector)
+
+    def clear(self):
+        super().clear()
+        self._semantic = {}
+        self.semantic_hits = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats['semantic_hits'] = self.semantic_hits
+        stats['semantic_threshold'] = self.threshold
+        return stats
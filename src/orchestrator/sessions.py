@@ -0,0 +1,353 @@
+"""Bounded session stores for conversation memories."""
+import asyncio
+import json
+import logging
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+try:
+    import redis.asyncio as aioredis
+    _REDIS_AVAILABLE = True
+except Exception:
+    aioredis = None
+    _REDIS_AVAILABLE = False
+
+from .memory import ConversationMemory
+
+logger = logging.getLogger("customer_support.sessions")
+
+
+class SessionStore:
+    """LRU + TTL store mapping session IDs to `ConversationMemory` objects.
+
+    Recency is tracked by the position in an `OrderedDict`, so lookups,
+    inserts and evictions are all O(1). Sessions idle for longer than
+    `ttl_s` are dropped lazily on access and by `purge_expired`.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_s: float = 3600):
+        """Initialize session store.
+
+        Args:
+            max_size: Maximum number of sessions kept in memory
+            ttl_s: Idle time in seconds after which a session expires
+        """
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._sessions: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+        self._last_seen: dict = {}
+        self._lock = asyncio.Lock()
+        self._purge_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return now - self._last_seen[session_id] > self.ttl_s
+
+    def _touch(self, session_id: str, now: float):
+        self._sessions.move_to_end(session_id)
+        self._last_seen[session_id] = now
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._last_seen.pop(session_id, None)
+
+    async def get(self, session_id: str) -> Optional[ConversationMemory]:
+        """Get an existing session.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            The session's memory, or None if unknown or expired
+        """
+        async with self._lock:
+            if session_id not in self._sessions:
+                return None
+
+            now = time.monotonic()
+            if self._expired(session_id, now):
+                self._drop(session_id)
+                return None
+
+            self._touch(session_id, now)
+            return self._sessions[session_id]
+
+    async def get_or_create(self, session_id: str) -> ConversationMemory:
+        """Get a session, creating it (and evicting the oldest if full) when missing.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            The session's memory
+        """
+        async with self._lock:
+            now = time.monotonic()
+
+            if session_id in self._sessions and not self._expired(session_id, now):
+                self._touch(session_id, now)
+                return self._sessions[session_id]
+
+            memory = ConversationMemory(session_id=session_id)
+            self._insert(session_id, memory, now)
+            return memory
+
+    def _insert(self, session_id: str, memory: ConversationMemory, now: float):
+        """Add a session, evicting the least recently used ones over `max_size`."""
+        self._sessions[session_id] = memory
+        self._touch(session_id, now)
+
+        while len(self._sessions) > self.max_size:
+            oldest, _ = self._sessions.popitem(last=False)
+            self._last_seen.pop(oldest, None)
+
+    async def persist(self, memory: ConversationMemory):
+        """Save messages added to a session since it was loaded.
+
+        The in-process store keeps sessions only in memory, so this is a no-op.
+
+        Args:
+            memory: Session memory that was modified
+        """
+
+    async def delete(self, session_id: str) -> bool:
+        """Delete a session.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            True if the session existed
+        """
+        async with self._lock:
+            existed = session_id in self._sessions
+            self._drop(session_id)
+            return existed
+
+    async def purge_expired(self) -> int:
+        """Drop all sessions past their TTL.
+
+        Returns:
+            Number of sessions removed
+        """
+        async with self._lock:
+            now = time.monotonic()
+            # Entries are ordered by recency, so stop at the first live one
+            expired = []
+            for session_id in self._sessions:
+                if not self._expired(session_id, now):
+                    break
+                expired.append(session_id)
+
+            for session_id in expired:
+                self._drop(session_id)
+
+            return len(expired)
+
+    def start_purging(self, interval_s: float = 60):
+        """Start a background task that purges expired sessions periodically.
+
+        Args:
+            interval_s: Seconds between purges
+        """
+        async def _purge_loop():
+            while True:
+                await asyncio.sleep(interval_s)
+                await self.purge_expired()
+
+        if self._purge_task is None:
+            self._purge_task = asyncio.create_task(_purge_loop())
+
+    async def stop_purging(self):
+        """Cancel the background purge task."""
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            try:
+                await self._purge_task
+            except asyncio.CancelledError:
+                pass
+            self._purge_task = None
+
+
+class RedisSessionStore(SessionStore):
+    """Session store shared by API workers through Redis.
+
+    Each session is a sorted set of JSON messages scored by timestamp
+    (`session:<id>:messages`, trimmed to the memory's `max_messages`) plus a
+    metadata hash (`session:<id>`), both expiring after `ttl_s` of inactivity.
+    The in-process LRU from `SessionStore` serves hot sessions without a
+    round-trip; workers publish the IDs of sessions they write so the others
+    drop their stale local copies. Redis errors are logged and the store keeps
+    working from the local tier.
+    """
+
+    KEY_PREFIX = "session:"
+    CHANNEL = "session:invalidate"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", max_size: int = 10_000, ttl_s: float = 3600):
+        """Initialize Redis session store.
+
+        Args:
+            url: Redis connection URL
+            max_size: Maximum number of sessions kept in the local tier
+            ttl_s: Idle time in seconds after which a session expires
+        """
+        if not _REDIS_AVAILABLE:
+            raise RuntimeError("redis not installed. Install it: pip install redis")
+        super().__init__(max_size=max_size, ttl_s=ttl_s)
+        self.url = url
+        self.client = aioredis.from_url(url, decode_responses=True)
+        self._worker_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        # Number of messages of each loaded memory already written to Redis
+        self._saved_totals: "weakref.WeakKeyDictionary[ConversationMemory, int]" = weakref.WeakKeyDictionary()
+
+    def _meta_key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    def _messages_key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}:messages"
+
+    async def get(self, session_id: str) -> Optional[ConversationMemory]:
+        memory = await super().get(session_id)
+        if memory is not None:
+            return memory
+
+        memory = await self._load(session_id)
+        if memory is not None:
+            async with self._lock:
+                self._insert(session_id, memory, time.monotonic())
+        return memory
+
+    async def get_or_create(self, session_id: str) -> ConversationMemory:
+        memory = await self.get(session_id)
+        if memory is not None:
+            return memory
+        return await super().get_or_create(session_id)
+
+    async def delete(self, session_id: str) -> bool:
+        existed = await super().delete(session_id)
+        try:
+            removed = await self.client.delete(self._meta_key(session_id), self._messages_key(session_id))
+            await self._publish(session_id)
+            existed = existed or removed > 0
+        except Exception as e:
+            logger.warning(f"Redis session delete failed: {e}")
+        return existed
+
+    async def persist(self, memory: ConversationMemory):
+        """Write the session's new messages and metadata to Redis and notify other workers."""
+        session_id = memory.session_id
+        total = memory.metadata.get('total_messages', len(memory.messages))
+        unsaved = min(total - self._saved_totals.get(memory, 0), len(memory.messages))
+        new_messages = memory.get_recent_messages(unsaved) if unsaved > 0 else []
+
+        messages_key = self._messages_key(session_id)
+        meta_key = self._meta_key(session_id)
+        ttl = int(self.ttl_s)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            if new_messages:
+                pipe.zadd(messages_key, {
+                    json.dumps(msg): datetime.fromisoformat(msg['timestamp']).timestamp()
+                    for msg in new_messages
+                })
+                pipe.zremrangebyrank(messages_key, 0, -(memory.max_messages + 1))
+            pipe.hset(meta_key, mapping={
+                'created_at': memory.metadata.get('created_at', ''),
+                'total_messages': total
+            })
+            pipe.expire(messages_key, ttl)
+            pipe.expire(meta_key, ttl)
+            pipe.publish(self.CHANNEL, f"{self._worker_id}:{session_id}")
+            await pipe.execute()
+            self._saved_totals[memory] = total
+        except Exception as e:
+            logger.warning(f"Redis session write failed, keeping session local: {e}")
+
+    async def _load(self, session_id: str) -> Optional[ConversationMemory]:
+        """Rebuild a session from Redis, or return None if it is unknown."""
+        try:
+            meta = await self.client.hgetall(self._meta_key(session_id))
+            if not meta:
+                return None
+            raw_messages = await self.client.zrange(self._messages_key(session_id), 0, -1)
+        except Exception as e:
+            logger.warning(f"Redis session read failed: {e}")
+            return None
+
+        memory = ConversationMemory.from_dict({
+            'session_id': session_id,
+            'messages': [json.loads(m) for m in raw_messages],
+            'metadata': {
+                'created_at': meta.get('created_at', ''),
+                'total_messages': int(meta.get('total_messages', len(raw_messages)))
+            }
+        })
+        self._saved_totals[memory] = memory.metadata['total_messages']
+        return memory
+
+    async def _publish(self, session_id: str):
+        await self.client.publish(self.CHANNEL, f"{self._worker_id}:{session_id}")
+
+    async def _listen(self):
+        """Drop local copies of sessions written by other workers."""
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    worker_id, _, session_id = str(message["data"]).partition(":")
+                    if worker_id != self._worker_id:
+                        async with self._lock:
+                            self._drop(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Session invalidation listener failed, retrying: {e}")
+                await asyncio.sleep(5)
+
+    def start_purging(self, interval_s: float = 60):
+        """Start the local expiry sweep and the invalidation listener."""
+        super().start_purging(interval_s)
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop_purging(self):
+        """Stop the background tasks."""
+        await super().stop_purging()
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+def make_session_store(backend: str, redis_url: str = "", max_size: int = 10_000,
+                       ttl_s: float = 3600) -> SessionStore:
+    """Create the session store selected in configuration.
+
+    Args:
+        backend: "memory" (per process) or "redis" (shared by workers)
+        redis_url: Redis connection URL for the redis backend
+        max_size: Maximum number of sessions kept in process
+        ttl_s: Idle time in seconds after which a session expires
+
+    Returns:
+        A SessionStore
+    """
+    if backend == "redis":
+        return RedisSessionStore(redis_url, max_size=max_size, ttl_s=ttl_s)
+    if backend != "memory":
+        raise ValueError(f"Unknown session backend: {backend}")
+    return SessionStore(max_size=max_size, ttl_s=ttl_s)
@@ -0,0 +1,16 @@
+"""Concurrent reads of knowledge-base files, shared by ingestion and the local retriever."""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+# Threads used to read source files
+_READ_WORKERS = 32
+
+
+def read_texts(paths: List[Path]) -> List[str]:
+    """Read UTF-8 files concurrently; the GIL is released during the reads."""
+    if len(paths) < 2:
+        return [p.read_text(encoding="utf-8") for p in paths]
+    with ThreadPoolExecutor(max_workers=min(_READ_WORKERS, len(paths))) as pool:
+        return list(pool.map(functools.partial(Path.read_text, encoding="utf-8"), paths))
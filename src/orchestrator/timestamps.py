@@ -0,0 +1,34 @@
+"""Fast local-time timestamps for per-message bookkeeping.
+
+`datetime.now().isoformat()` builds a datetime and formats every field on
+each call. These helpers read `time.time_ns()` and only re-run `strftime`
+when the second changes, appending the microseconds with integer math. Times
+are local and naive, like `datetime.now()`, so they compare and parse
+(`datetime.fromisoformat`) the same way as existing records.
+"""
+import time
+from typing import Tuple
+
+# (epoch second, formatted prefix) of the last call, per format
+_iso_second: Tuple[int, str] = (-1, "")
+_compact_second: Tuple[int, str] = (-1, "")
+
+
+def now_isoformat() -> str:
+    """Current local time as `YYYY-MM-DDTHH:MM:SS.ffffff`."""
+    global _iso_second
+    seconds, nanos = divmod(time.time_ns(), 1_000_000_000)
+    cached = _iso_second
+    if cached[0] != seconds:
+        cached = _iso_second = (seconds, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(seconds)))
+    return f"{cached[1]}.{nanos // 1000:06d}"
+
+
+def now_compact() -> str:
+    """Current local time as `YYYYMMDD_HHMMSS_ffffff`, for identifiers."""
+    global _compact_second
+    seconds, nanos = divmod(time.time_ns(), 1_000_000_000)
+    cached = _compact_second
+    if cached[0] != seconds:
+        cached = _compact_second = (seconds, time.strftime("%Y%m%d_%H%M%S", time.localtime(seconds)))
+    return f"{cached[1]}_{nanos // 1000:06d}"
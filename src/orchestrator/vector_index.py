@@ -0,0 +1,407 @@
+"""In-process ANN index over the persisted Chroma embeddings.
+
+Chroma remains the store of record; this module loads its vectors once and
+serves searches from a FAISS index: exact inner product over normalized
+vectors for typical knowledge-base sizes, and HNSW or IVF-PQ so retrieval
+stays sub-linear as the knowledge base grows. Built indexes can be written
+to disk and reused while the collection is unchanged.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import pickle
+from pathlib import Path
+from typing import Iterator, List, Literal, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+    _FAISS_AVAILABLE = True
+except Exception:
+    faiss = None
+    _FAISS_AVAILABLE = False
+
+from .retriever import SimpleDoc
+from .scoring import l2_normalize, score_chunks, top_k_indices
+
+logger = logging.getLogger("customer_support.vector_index")
+
+IndexType = Literal["auto", "flat", "hnsw", "ivfpq"]
+Quantization = Literal["none", "int8", "fp16"]
+
+# FAISS scalar quantizer per storage type
+_SQ_TYPES = {"int8": "QT_8bit", "fp16": "QT_fp16"}
+
+# Bump when the on-disk index layout changes
+_INDEX_CACHE_VERSION = 2
+
+
+class FaissIndex:
+    """FAISS index with a row id -> document mapping.
+
+    "flat" scans L2-normalized vectors exhaustively with inner product
+    (cosine) in one pass per query batch; "auto" uses it below
+    `flat_max_vectors` and HNSW above. The graph indexes use L2 distance,
+    matching Chroma's default collection space, so results rank the same as
+    the collection they were loaded from. With int8 or fp16 quantization the
+    flat and HNSW indexes store scalar-quantized vectors (int8 uses a per
+    dimension min/max trained from the data), a quarter or half of the
+    float32 size, so the memory-bound scan reads that much less. With
+    `rerank_factor > 0` a quantized or approximate index over-fetches
+    candidates and reorders them by exact cosine similarity against the
+    original vectors. Those need a float32 copy next to the index, which
+    outweighs the quantization saving while it is in RAM; once the index
+    is saved the copy is memory-mapped from disk, so only the candidate
+    rows read by reranking are paged in.
+    """
+
+    def __init__(self,
+                 dim: int,
+                 index_type: IndexType = "auto",
+                 hnsw_m: int = 32,
+                 ef_construction: int = 200,
+                 nlist: int = 4096,
+                 pq_m: int = 16,
+                 pq_nbits: int = 8,
+                 quantization: Quantization = "none",
+                 rerank_factor: int = 0,
+                 flat_max_vectors: int = 20_000):
+        """Initialize an empty index.
+
+        Args:
+            dim: Embedding dimension
+            index_type: "flat" (IndexFlatIP), "hnsw" (IndexHNSWFlat),
+                "ivfpq" (IndexIVFPQ) or "auto" (flat or HNSW by corpus size)
+            hnsw_m: HNSW graph degree
+            ef_construction: HNSW build-time candidate list size
+            nlist: Maximum number of IVF cells (capped by the corpus size)
+            pq_m: Number of PQ sub-quantizers; must divide `dim`
+            pq_nbits: Bits per PQ code
+            quantization: "int8" or "fp16" stores flat and HNSW vectors with
+                a scalar quantizer; IVF-PQ is always compressed by its PQ codes
+            rerank_factor: Candidates fetched per requested result for exact
+                reranking; 0 disables reranking. Ignored for an unquantized
+                "flat" index, which is already exact
+            flat_max_vectors: Largest corpus "auto" searches exhaustively
+        """
+        if not _FAISS_AVAILABLE:
+            raise RuntimeError("faiss not installed. Install it: pip install faiss-cpu")
+
+        self.dim = dim
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.flat_max_vectors = flat_max_vectors
+        self.index = None
+        self._unit_vectors: Optional[np.ndarray] = None  # kept only for reranking
+        self.docs: List[SimpleDoc] = []
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _create_index(self, n_vectors: int):
+        if self.index_type == "auto":
+            self.index_type = "flat" if n_vectors <= self.flat_max_vectors else "hnsw"
+            logger.info(f"Using a {self.index_type} index for {n_vectors} vectors")
+
+        sq_type = _SQ_TYPES.get(self.quantization)
+        if self.index_type == "flat":
+            if sq_type is not None:
+                return faiss.IndexScalarQuantizer(
+                    self.dim, getattr(faiss.ScalarQuantizer, sq_type), faiss.METRIC_INNER_PRODUCT
+                )
+            return faiss.IndexFlatIP(self.dim)
+
+        if self.index_type == "ivfpq" and n_vectors < 39 * 2 ** self.pq_nbits:
+            logger.info(f"Too few vectors ({n_vectors}) to train PQ codebooks, using HNSW")
+            self.index_type = "hnsw"
+
+        if self.index_type == "hnsw":
+            if sq_type is not None:
+                index = faiss.IndexHNSWSQ(self.dim, getattr(faiss.ScalarQuantizer, sq_type), self.hnsw_m)
+            else:
+                index = faiss.IndexHNSWFlat(self.dim, self.hnsw_m)
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+
+        # Keep ~39 training points per cell, as FAISS recommends
+        nlist = max(1, min(self.nlist, n_vectors // 39, int(4 * math.sqrt(n_vectors))))
+        quantizer = faiss.IndexFlatL2(self.dim)
+        return faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.pq_m, self.pq_nbits)
+
+    def build(self, vectors: np.ndarray, docs: List[SimpleDoc]):
+        """(Re)build the index from embeddings and their documents.
+
+        Args:
+            vectors: (n, dim) embedding matrix
+            docs: Document for each row of `vectors`
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index = self._create_index(len(vectors))
+        if self.index_type == "flat":
+            vectors = np.ascontiguousarray(l2_normalize(vectors))
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        self.index = index
+        self.docs = list(docs)
+        for doc in self.docs:
+            doc.content_lower  # documents are static; lowercase them once for answer scoring
+        self._unit_vectors = None
+        exact = self.index_type == "flat" and self.quantization not in _SQ_TYPES
+        if self.rerank_factor > 0 and not exact:
+            # Flat vectors were normalized above; graph indexes keep the raw ones
+            self._unit_vectors = vectors if self.index_type == "flat" else l2_normalize(vectors)
+
+    def save(self, directory: str, signature: str):
+        """Write the index to `directory` under a collection signature.
+
+        Files from other signatures are removed, so the directory holds one
+        index at a time.
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        index_file = path / f"index_{signature}.faiss"
+        meta_file = path / f"index_{signature}.pkl"
+        vectors_file = path / f"index_{signature}.npy"
+        tmp = index_file.with_suffix(".faiss.tmp")
+        faiss.write_index(self.index, str(tmp))
+        os.replace(tmp, index_file)
+        rerank = self._unit_vectors is not None
+        if rerank:
+            tmp = vectors_file.with_suffix(".npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, self._unit_vectors)
+            os.replace(tmp, vectors_file)
+        tmp = meta_file.with_suffix(".pkl.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({
+                "version": _INDEX_CACHE_VERSION,
+                "index_type": self.index_type,
+                "rerank": rerank
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, meta_file)
+        if rerank:
+            # Drop the in-RAM copy for the memory-mapped file
+            self._unit_vectors = np.load(vectors_file, mmap_mode="r")
+
+        for stale in path.glob("index_*"):
+            if stale.stem != f"index_{signature}":
+                stale.unlink(missing_ok=True)
+
+    def load(self, directory: str, signature: str, docs: List[SimpleDoc]) -> bool:
+        """Read an index written by `save` for the same signature.
+
+        Args:
+            directory: Directory passed to `save`
+            signature: Signature of the current collection contents
+            docs: Documents in collection order, one per index row
+
+        Returns:
+            Whether a matching index was loaded
+        """
+        index_file = Path(directory) / f"index_{signature}.faiss"
+        meta_file = Path(directory) / f"index_{signature}.pkl"
+        try:
+            with open(meta_file, "rb") as f:
+                meta = pickle.load(f)
+            if meta.get("version") != _INDEX_CACHE_VERSION:
+                return False
+            index = faiss.read_index(str(index_file))
+            unit_vectors = None
+            if meta["rerank"]:
+                unit_vectors = np.load(Path(directory) / f"index_{signature}.npy", mmap_mode="r")
+        except (OSError, pickle.UnpicklingError, RuntimeError, EOFError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Ignoring unreadable FAISS index cache: {e}")
+            return False
+        if index.ntotal != len(docs) or (unit_vectors is not None and len(unit_vectors) != len(docs)):
+            return False
+
+        self.index = index
+        self.dim = index.d
+        self.index_type = meta["index_type"]
+        self._unit_vectors = unit_vectors
+        self.docs = list(docs)
+        for doc in self.docs:
+            doc.content_lower
+        return True
+
+    def search(self,
+               q_embs,
+               k: int,
+               ef_search: Optional[int] = None,
+               nprobe: Optional[int] = None) -> List[List[SimpleDoc]]:
+        """Find the `k` nearest documents for each query embedding.
+
+        `ef_search` and `nprobe` go to FAISS as per-call search parameters
+        rather than being set on the index, so concurrent searches with
+        different values do not affect each other.
+
+        Args:
+            q_embs: (n_queries, dim) query embeddings
+            k: Number of results per query
+            ef_search: HNSW search candidate list size
+            nprobe: Number of IVF cells visited
+
+        Returns:
+            One list of documents per query, nearest first
+        """
+        if self.index is None or not self.docs:
+            return [[] for _ in range(len(q_embs))]
+
+        q = np.ascontiguousarray(q_embs, dtype=np.float32)
+        if self.index_type == "flat":
+            q = np.ascontiguousarray(l2_normalize(q))
+        n_candidates = min(k * self.rerank_factor if self._unit_vectors is not None else k, len(self.docs))
+
+        # Per-call parameters: the index is shared by concurrent searches
+        params = None
+        if ef_search is not None and self.index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=max(ef_search, n_candidates))
+        elif nprobe is not None and self.index_type == "ivfpq":
+            params = faiss.SearchParametersIVF(nprobe=nprobe)
+        _, ids = self.index.search(q, n_candidates, params=params)
+
+        if self._unit_vectors is None:
+            return [[self.docs[i] for i in row if i >= 0] for row in ids]
+
+        # One normalization for the whole batch instead of one per query
+        q_unit = q if self.index_type == "flat" else l2_normalize(q)
+        results = []
+        for query_vec, row in zip(q_unit, ids):
+            candidates = row[row >= 0]
+            scores = score_chunks(query_vec, self._unit_vectors[candidates])
+            best = candidates[top_k_indices(scores, k)]
+            results.append([self.docs[i] for i in best])
+        return results
+
+
+def _collection_pages(collection, include: List[str], page_size: int) -> Iterator[dict]:
+    """Page through a chromadb collection with `get`."""
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        yield page
+        offset += len(ids)
+        if len(ids) < page_size:
+            break
+
+
+def load_collection_vectors(collection, page_size: int = 10_000):
+    """Read all embeddings and documents from a chromadb collection.
+
+    Args:
+        collection: chromadb collection
+        page_size: Rows fetched per `get` call
+
+    Returns:
+        Tuple of the (n, dim) float32 embedding matrix and the documents
+    """
+    vectors, docs = [], []
+    for page in _collection_pages(collection, ["embeddings", "documents", "metadatas"], page_size):
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        docs.extend(
+            SimpleDoc(page_content=d, metadata=m or {})
+            for d, m in zip(page["documents"], page["metadatas"])
+        )
+
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32), docs
+    return np.concatenate(vectors), docs
+
+
+def _collection_signature(collection, params: dict, page_size: int = 10_000) -> Tuple[str, List[SimpleDoc]]:
+    """Hash the collection's ids, texts and metadata together with the index parameters.
+
+    Returns:
+        Tuple of the hex signature and the documents in collection order
+    """
+    h = hashlib.blake2b(json.dumps(params, sort_keys=True, default=str).encode(), digest_size=16)
+    docs = []
+    for page in _collection_pages(collection, ["documents", "metadatas"], page_size):
+        for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+            meta = meta or {}
+            h.update(f"{doc_id}\0{text}\0{json.dumps(meta, sort_keys=True, default=str)}\0".encode())
+            docs.append(SimpleDoc(page_content=text, metadata=meta))
+    return h.hexdigest(), docs
+
+
+def build_faiss_index(collection,
+                      index_type: IndexType = "auto",
+                      cache_dir: Optional[str] = None,
+                      **kwargs) -> Optional[FaissIndex]:
+    """Build a `FaissIndex` from everything stored in a collection.
+
+    Args:
+        collection: chromadb collection to load
+        index_type: "auto", "flat", "hnsw" or "ivfpq"
+        cache_dir: Directory to persist the built index in; when the
+            collection is unchanged since it was written, the index is read
+            back instead of loading the embeddings and rebuilding
+        **kwargs: Extra `FaissIndex` parameters
+
+    Returns:
+        The built index, or None if the collection is empty
+    """
+    signature = None
+    if cache_dir:
+        signature, docs = _collection_signature(collection, {"index_type": index_type, **kwargs})
+        if docs:
+            index = FaissIndex(0, index_type=index_type, **kwargs)
+            if index.load(cache_dir, signature, docs):
+                logger.info(f"Loaded FAISS {index.index_type} index over {len(index)} vectors from {cache_dir}")
+                return index
+
+    vectors, docs = load_collection_vectors(collection)
+    if len(docs) == 0:
+        logger.warning("Collection is empty, skipping FAISS index build")
+        return None
+
+    index = FaissIndex(vectors.shape[1], index_type=index_type, **kwargs)
+    index.build(vectors, docs)
+    logger.info(f"Built FAISS {index.index_type} index over {len(index)} vectors")
+    if signature is not None:
+        try:
+            index.save(cache_dir, signature)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Could not persist FAISS index to {cache_dir}: {e}")
+    return index
+
+
+def attach_faiss_index(retriever, vector_store_config) -> Optional[FaissIndex]:
+    """Build the index a `VectorStoreConfig` describes and serve the retriever from it.
+
+    With `faiss_cache_dir` set, an index persisted by an earlier process for
+    the same collection is read back instead of rebuilt.
+
+    Args:
+        retriever: `RetrieverWrapper` over the collection to index
+        vector_store_config: `config.vector_store` section
+
+    Returns:
+        The attached index, or None if the collection is empty
+    """
+    index = build_faiss_index(
+        retriever.collection,
+        index_type=vector_store_config.faiss_index_type,
+        hnsw_m=vector_store_config.hnsw_m,
+        ef_construction=vector_store_config.hnsw_ef_construction,
+        quantization=vector_store_config.quantization,
+        rerank_factor=vector_store_config.rerank_factor,
+        flat_max_vectors=vector_store_config.flat_max_vectors,
+        cache_dir=vector_store_config.faiss_cache_dir
+    )
+    retriever.attach_index(index)
+    return index
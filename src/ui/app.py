@@ -3,10 +3,12 @@
 Provides an interactive chat interface with history, metrics, and document visualization.
 """
 import streamlit as st
-import requests
+import httpx
+import json
 from datetime import datetime
 import time
-from typing import List, Dict, Any
+from pathlib import Path
+from typing import List, Dict, Any, Iterator
 
 # Page config
 st.set_page_config(
@@ -18,109 +20,33 @@ st.set_page_config(
 
 # Constants
 API_URL = "http://localhost:8000"
+RENDERED_MESSAGES = 20  # most recent messages drawn with documents, feedback and details
+
+
+@st.cache_resource
+def _css() -> str:
+    """Custom stylesheet, read from disk once per server process."""
+    return (Path(__file__).parent / "static" / "app.css").read_text(encoding="utf-8")
+
 
 # Custom CSS
-st.markdown("""
-<style>
-    /* Main background */
-    .stApp {
-        background-color: #1a1a2e;
-    }
-    
-    /* Chat messages */
-    .stChatMessage {
-        background-color: #16213e;
-        border-radius: 10px;
-        padding: 10px;
-        margin: 5px 0;
-        color: #eaeaea;
-    }
-    
-    /* User messages */
-    .stChatMessage[data-testid="user-message"] {
-        background-color: #0f3460;
-    }
-    
-    /* Assistant messages */
-    .stChatMessage[data-testid="assistant-message"] {
-        background-color: #16213e;
-    }
-    
-    /* Metric cards */
-    .metric-card {
-        background-color: #16213e;
-        border: 1px solid #2d4059;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #eaeaea;
-    }
-    
-    /* Document cards */
-    .doc-card {
-        background-color: #0f3460;
-        border-left: 4px solid #4CAF50;
-        border-radius: 4px;
-        padding: 12px;
-        margin: 8px 0;
-        color: #eaeaea;
-    }
-    
-    /* Text color */
-    .stMarkdown, p, span, div {
-        color: #eaeaea;
-    }
-    
-    /* Sidebar */
-    section[data-testid="stSidebar"] {
-        background-color: #16213e;
-    }
-    
-    section[data-testid="stSidebar"] * {
-        color: #eaeaea;
-    }
-    
-    /* Input fields */
-    .stTextInput input, .stTextArea textarea {
-        background-color: #0f3460;
-        color: #eaeaea;
-        border: 1px solid #2d4059;
-    }
-    
-    /* Buttons */
-    .stButton button {
-        background-color: #0f3460;
-        color: #eaeaea;
-        border: 1px solid #2d4059;
-    }
-    
-    .stButton button:hover {
-        background-color: #16213e;
-        border-color: #4CAF50;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: #16213e;
-        color: #eaeaea;
-    }
-    
-    /* Metrics */
-    [data-testid="stMetricValue"] {
-        color: #4CAF50;
-    }
-    
-    [data-testid="stMetricLabel"] {
-        color: #eaeaea;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>{_css()}</style>", unsafe_allow_html=True)
+
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """Keep-alive HTTP client shared by every rerun and session."""
+    return httpx.Client(base_url=API_URL, timeout=30.0)
 
 
+@st.cache_data(ttl=5)
 def check_api_health() -> Dict[str, Any]:
-    """Check if the API is running and healthy."""
+    """Check if the API is running and healthy.
+    
+    Cached for a few seconds so sidebar reruns don't each make a round trip.
+    """
     try:
-        response = requests.get(f"{API_URL}/health", timeout=5)
+        response = get_http_client().get("/health", timeout=1.5)
         return response.json() if response.status_code == 200 else None
     except:
         return None
@@ -129,8 +55,8 @@ def check_api_health() -> Dict[str, Any]:
 def query_api(query: str, session_id: str, use_workflow: bool = False, top_k: int = 3) -> Dict[str, Any]:
     """Send query to the API with session support."""
     try:
-        response = requests.post(
-            f"{API_URL}/query",
+        response = get_http_client().post(
+            "/query",
             json={
                 "query": query,
                 "session_id": session_id,
@@ -143,17 +69,52 @@ def query_api(query: str, session_id: str, use_workflow: bool = False, top_k: in
             return response.json()
         else:
             return {"error": f"API error: {response.status_code}"}
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {"error": "Request timed out. Please try again."}
     except Exception as e:
         return {"error": f"Connection error: {str(e)}"}
 
 
+def stream_query_api(query: str, session_id: str, top_k: int, result: Dict[str, Any]) -> Iterator[str]:
+    """Yield answer chunks from the server-sent `/query_stream` endpoint.
+    
+    Once the stream ends, `result` holds the final event's confidence,
+    documents and metrics, or an `error` message.
+    """
+    try:
+        with get_http_client().stream(
+            "POST",
+            "/query_stream",
+            json={"query": query, "session_id": session_id, "top_k": top_k}
+        ) as response:
+            if response.status_code != 200:
+                result["error"] = f"API error: {response.status_code}"
+                return
+            event = None
+            for line in response.iter_lines():
+                if not line:
+                    event = None
+                elif line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "done":
+                        result.update(data)
+                    elif event == "error":
+                        result["error"] = data.get("detail", "Streaming failed")
+                    else:
+                        yield data
+    except httpx.TimeoutException:
+        result["error"] = "Request timed out. Please try again."
+    except Exception as e:
+        result["error"] = f"Connection error: {str(e)}"
+
+
 def submit_feedback(query: str, answer: str, rating: int, session_id: str, comment: str = "") -> Dict[str, Any]:
     """Submit feedback for a response."""
     try:
-        response = requests.post(
-            f"{API_URL}/feedback",
+        response = get_http_client().post(
+            "/feedback",
             json={
                 "query": query,
                 "answer": answer,
@@ -171,7 +132,7 @@ def submit_feedback(query: str, answer: str, rating: int, session_id: str, comme
 def ingest_documents() -> Dict[str, Any]:
     """Trigger document ingestion."""
     try:
-        response = requests.post(f"{API_URL}/ingest", json={}, timeout=5)
+        response = get_http_client().post("/ingest", json={}, timeout=5)
         return response.json() if response.status_code == 200 else None
     except Exception as e:
         return {"error": str(e)}
@@ -192,81 +153,90 @@ def initialize_session_state():
         st.session_state.feedback_given = set()
 
 
+def render_feedback(content: str, metadata: Dict, message_id: str = None):
+    """Show the rating buttons for an assistant message, or that it was rated."""
+    if message_id and message_id not in st.session_state.feedback_given:
+        st.markdown("---")
+        st.markdown("**Was this helpful?**")
+        col1, col2, col3, col4 = st.columns([1, 1, 1, 5])
+        
+        with col1:
+            if st.button("👍", key=f"up_{message_id}"):
+                feedback = submit_feedback(
+                    metadata.get('query', ''),
+                    content,
+                    5,
+                    st.session_state.session_id,
+                    "Helpful"
+                )
+                if feedback and 'error' not in feedback:
+                    st.success("Thanks for the feedback!")
+                    st.session_state.feedback_given.add(message_id)
+                    st.rerun()
+        
+        with col2:
+            if st.button("👎", key=f"down_{message_id}"):
+                feedback = submit_feedback(
+                    metadata.get('query', ''),
+                    content,
+                    2,
+                    st.session_state.session_id,
+                    "Not helpful"
+                )
+                if feedback and 'error' not in feedback:
+                    st.info("Thanks! We'll work on improving this.")
+                    st.session_state.feedback_given.add(message_id)
+                    st.rerun()
+    
+    elif message_id in st.session_state.feedback_given:
+        st.markdown("*✓ Feedback submitted*")
+
+
+def render_assistant_details(content: str, metadata: Dict, message_id: str = None):
+    """Show an answer's cache indicator, documents, feedback buttons and metrics."""
+    # Show cache indicator
+    if metadata.get('cached'):
+        st.success("⚡ Instant response from cache")
+    
+    # Always show documents first if available
+    documents = metadata.get('documents')
+    if documents:
+        st.markdown("---")
+        st.markdown("### 📚 Referenced Documents")
+        for i, doc in enumerate(documents, 1):
+            with st.expander(f"📄 {doc['source_name']}", expanded=(i == 1)):
+                st.markdown(doc['content'])
+    
+    # Feedback buttons
+    render_feedback(content, metadata, message_id)
+    
+    # Show metrics in expander
+    with st.expander("📊 Query Details", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Confidence", f"{metadata.get('confidence', 0):.2%}")
+        
+        with col2:
+            st.metric("Response Time", f"{metadata.get('total_time', 0):.2f}s")
+        
+        with col3:
+            st.metric("Documents", metadata.get('num_documents', 0))
+        
+        with col4:
+            st.metric("Conv. Turns", metadata.get('conversation_turns', 0))
+        
+        if metadata.get('should_escalate'):
+            st.warning("⚠️ This query may require human escalation")
+
+
 def display_message(role: str, content: str, metadata: Dict = None, message_id: str = None):
     """Display a chat message with optional metadata and feedback."""
     with st.chat_message(role):
         st.markdown(content)
         
         if metadata and role == "assistant":
-            # Show cache indicator
-            if metadata.get('cached'):
-                st.success("⚡ Instant response from cache")
-            
-            # Always show documents first if available
-            if metadata.get('documents'):
-                st.markdown("---")
-                st.markdown("### 📚 Referenced Documents")
-                for i, doc in enumerate(metadata['documents'], 1):
-                    source_name = doc['source'].replace('.md', '').replace('_', ' ').title()
-                    with st.expander(f"📄 {source_name}", expanded=(i == 1)):
-                        st.markdown(doc['content'])
-            
-            # Feedback buttons
-            if message_id and message_id not in st.session_state.feedback_given:
-                st.markdown("---")
-                st.markdown("**Was this helpful?**")
-                col1, col2, col3, col4 = st.columns([1, 1, 1, 5])
-                
-                with col1:
-                    if st.button("👍", key=f"up_{message_id}"):
-                        feedback = submit_feedback(
-                            metadata.get('query', ''),
-                            content,
-                            5,
-                            st.session_state.session_id,
-                            "Helpful"
-                        )
-                        if feedback and 'error' not in feedback:
-                            st.success("Thanks for the feedback!")
-                            st.session_state.feedback_given.add(message_id)
-                            st.rerun()
-                
-                with col2:
-                    if st.button("👎", key=f"down_{message_id}"):
-                        feedback = submit_feedback(
-                            metadata.get('query', ''),
-                            content,
-                            2,
-                            st.session_state.session_id,
-                            "Not helpful"
-                        )
-                        if feedback and 'error' not in feedback:
-                            st.info("Thanks! We'll work on improving this.")
-                            st.session_state.feedback_given.add(message_id)
-                            st.rerun()
-            
-            elif message_id in st.session_state.feedback_given:
-                st.markdown("*✓ Feedback submitted*")
-            
-            # Show metrics in expander
-            with st.expander("📊 Query Details", expanded=False):
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("Confidence", f"{metadata.get('confidence', 0):.2%}")
-                
-                with col2:
-                    st.metric("Response Time", f"{metadata.get('total_time', 0):.2f}s")
-                
-                with col3:
-                    st.metric("Documents", metadata.get('num_documents', 0))
-                
-                with col4:
-                    turns = metadata.get('conversation_turns', 0)
-                    st.metric("Conv. Turns", turns)
-                
-                if metadata.get('should_escalate'):
-                    st.warning("⚠️ This query may require human escalation")
+            render_assistant_details(content, metadata, message_id)
 
 
 def main():
@@ -364,8 +334,17 @@ def main():
     st.markdown("### 💬 Chat")
     st.caption(f"Session ID: `{st.session_state.session_id}`")
     
-    # Display chat history
-    for idx, msg in enumerate(st.session_state.messages):
+    # Display chat history; older messages are collapsed into one plain block
+    messages = st.session_state.messages
+    first_rendered = max(len(messages) - RENDERED_MESSAGES, 0)
+    if first_rendered:
+        with st.expander(f"🕘 Earlier messages ({first_rendered})", expanded=False):
+            st.markdown("\n\n".join(
+                f"**{'You' if msg['role'] == 'user' else 'Assistant'}:** {msg['content']}"
+                for msg in messages[:first_rendered]
+            ))
+    for idx in range(first_rendered, len(messages)):
+        msg = messages[idx]
         message_id = f"msg_{idx}"
         display_message(
             msg["role"],
@@ -386,83 +365,67 @@ def main():
         
         # Get AI response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                start_time = time.time()
-                response = query_api(
-                    query,
-                    st.session_state.session_id,
-                    use_workflow,
-                    top_k
+            start_time = time.time()
+            if use_workflow:
+                # The LangGraph workflow returns its answer in one piece
+                with st.spinner("Thinking..."):
+                    response = query_api(
+                        query,
+                        st.session_state.session_id,
+                        use_workflow,
+                        top_k
+                    )
+            else:
+                # Render chunks as they arrive instead of waiting for the whole answer
+                response = {}
+                streamed = st.write_stream(
+                    stream_query_api(query, st.session_state.session_id, top_k, response)
                 )
-                elapsed_time = time.time() - start_time
-                
-                if "error" in response:
-                    st.error(f"❌ {response['error']}")
-                    answer = f"Sorry, I encountered an error: {response['error']}"
-                    metadata = None
-                else:
-                    answer = response.get("answer", "No answer generated")
-                    metrics = response.get("metrics", {})
-                    metadata = {
-                        "query": query,
-                        "confidence": response.get("confidence", 0),
-                        "should_escalate": response.get("should_escalate", False),
-                        "documents": response.get("documents", []),
-                        "cached": response.get("cached", False),
-                        "total_time": metrics.get("total_time", elapsed_time),
-                        "num_documents": len(response.get("documents", [])),
-                        "conversation_turns": metrics.get("conversation_turns", 0)
-                    }
-                    
-                    # Update session stats
-                    st.session_state.query_count += 1
-                    st.session_state.total_response_time += metadata["total_time"]
+                if streamed:
+                    response["answer"] = streamed
+            elapsed_time = time.time() - start_time
+            
+            if "error" in response:
+                st.error(f"❌ {response['error']}")
+                answer = f"Sorry, I encountered an error: {response['error']}"
+                metadata = None
+            else:
+                answer = response.get("answer", "No answer generated")
+                metrics = response.get("metrics", {})
+                total_time = metrics.get("total_time", elapsed_time)
+                documents = response.get("documents", [])
+                for doc in documents:
+                    # Formatted once here instead of on every rerun that redraws the message
+                    doc['source_name'] = doc['source'].replace('.md', '').replace('_', ' ').title()
+                metadata = {
+                    "query": query,
+                    "confidence": response.get("confidence", 0),
+                    "should_escalate": response.get("should_escalate", False),
+                    "documents": documents,
+                    "cached": response.get("cached", False),
+                    "total_time": total_time,
+                    "num_documents": len(documents),
+                    "conversation_turns": metrics.get("conversation_turns", 0)
+                }
                 
+                # Update session stats
+                st.session_state.query_count += 1
+                st.session_state.total_response_time += total_time
+            
+            if use_workflow or "error" in response:
                 st.markdown(answer)
-                
-                # Show cache indicator
-                if metadata and metadata.get('cached'):
-                    st.success("⚡ Instant response from cache")
-                
-                # Show documents first if available
-                if metadata and metadata.get('documents'):
-                    st.markdown("---")
-                    st.markdown("### 📚 Referenced Documents")
-                    for i, doc in enumerate(metadata['documents'], 1):
-                        source_name = doc['source'].replace('.md', '').replace('_', ' ').title()
-                        with st.expander(f"📄 {source_name}", expanded=(i == 1)):
-                            st.markdown(doc['content'])
-                
-                # Show metadata in collapsed expander
-                if metadata:
-                    with st.expander("📊 Query Details", expanded=False):
-                        col1, col2, col3, col4 = st.columns(4)
-                        
-                        with col1:
-                            st.metric("Confidence", f"{metadata['confidence']:.2%}")
-                        
-                        with col2:
-                            st.metric("Response Time", f"{metadata['total_time']:.2f}s")
-                        
-                        with col3:
-                            st.metric("Documents", metadata['num_documents'])
-                        
-                        with col4:
-                            turns = metadata.get('conversation_turns', 0)
-                            st.metric("Conv. Turns", turns)
-                        
-                        if metadata['should_escalate']:
-                            st.warning("⚠️ This query may require human escalation")
+            
+            # Same widget keys as the history render, so the next rerun handles clicks
+            if metadata:
+                render_assistant_details(answer, metadata, f"msg_{len(st.session_state.messages)}")
         
-        # Save assistant message
+        # Save assistant message; the next interaction draws it from history
         st.session_state.messages.append({
             "role": "assistant",
             "content": answer,
             "metadata": metadata,
             "timestamp": datetime.now()
         })
-        
-        st.rerun()
     
     # Sample queries
     with st.expander("💡 Sample Queries"):
@@ -26,6 +26,21 @@ except Exception:
 
 st.set_page_config(page_title="Customer Support Orchestrator", page_icon="🤖", layout="wide")
 
+
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def load_retriever(mode: str, data_dir: str):
+    """Build the retriever once per mode and data directory, across reruns and sessions."""
+    if mode == "local":
+        return LocalRetriever(data_dir=data_dir)
+    from src.orchestrator.retriever import get_retriever
+    return get_retriever(persist_directory=".chroma")
+
+
+@st.cache_resource
+def load_llm() -> MockLLM:
+    return MockLLM()
+
+
 st.title("🤖 Customer Support Orchestrator")
 st.markdown("**RAG + LangChain + LangGraph Demo**")
 
@@ -53,14 +68,9 @@ if st.button("Submit Query", type="primary"):
     else:
         with st.spinner("Processing your query through the workflow..."):
             try:
-                # Initialize retriever and LLM
-                if mode == "local":
-                    retriever = LocalRetriever(data_dir=data_dir)
-                else:
-                    from src.orchestrator.retriever import get_retriever
-                    retriever = get_retriever(persist_directory=".chroma")
-                
-                llm = MockLLM()
+                # Reuse the cached retriever and LLM
+                retriever = load_retriever(mode, data_dir)
+                llm = load_llm()
                 
                 # Run workflow
                 if _LANGGRAPH_AVAILABLE and run_support_workflow:
@@ -1,4 +1,5 @@
 """Basic tests for the Customer Support Orchestrator."""
+import functools
 import sys
 import os
 
@@ -6,13 +7,25 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, ROOT)
 
 from src.orchestrator.local_retriever import LocalRetriever
-from src.orchestrator.agents import MockLLM
+from src.orchestrator.agents import MockLLM, SupportOrchestrator
 from src.orchestrator.embeddings import HuggingFaceEmbeddings
 
 
+@functools.lru_cache(maxsize=1)
+def sample_retriever() -> LocalRetriever:
+    """TF-IDF retriever over the example data, fitted once for all tests."""
+    return LocalRetriever(data_dir="examples/data")
+
+
+@functools.lru_cache(maxsize=1)
+def mock_llm() -> MockLLM:
+    """One MockLLM shared by the tests."""
+    return MockLLM()
+
+
 def test_local_retriever():
     """Test local retriever with TF-IDF."""
-    retriever = LocalRetriever(data_dir="examples/data")
+    retriever = sample_retriever()
     docs = retriever.get_relevant_documents("reset password")
     assert len(docs) > 0, "Should retrieve at least one document"
     assert hasattr(docs[0], 'page_content'), "Document should have page_content attribute"
@@ -21,8 +34,8 @@ def test_local_retriever():
 
 def test_mock_llm():
     """Test MockLLM answer generation."""
-    llm = MockLLM()
-    retriever = LocalRetriever(data_dir="examples/data")
+    llm = mock_llm()
+    retriever = sample_retriever()
     docs = retriever.get_relevant_documents("reset password")
     answer = llm.generate_answer("How do I reset my password?", docs)
     assert len(answer) > 0, "Answer should not be empty"
@@ -51,8 +64,8 @@ def test_langgraph_workflow():
             print("⊘ LangGraph not available, skipping workflow test")
             return
         
-        retriever = LocalRetriever(data_dir="examples/data")
-        llm = MockLLM()
+        retriever = sample_retriever()
+        llm = mock_llm()
         
         result = run_support_workflow("How do I reset my password?", retriever, llm)
         
@@ -65,10 +78,301 @@ def test_langgraph_workflow():
         print(f"⊘ LangGraph workflow test skipped: {e}")
 
 
+def test_session_store_lru_and_ttl():
+    """Test session store eviction and expiry."""
+    import asyncio
+    from src.orchestrator.sessions import SessionStore
+
+    async def run():
+        store = SessionStore(max_size=2, ttl_s=3600)
+        first = await store.get_or_create("a")
+        await store.get_or_create("b")
+        assert await store.get("a") is first, "Existing session should be returned"
+        await store.get_or_create("c")  # evicts "b", the least recently used
+        assert await store.get("b") is None
+        assert len(store) == 2
+
+        store.ttl_s = -1
+        assert await store.purge_expired() == 2, "All sessions should be expired"
+        assert await store.get("a") is None
+
+    asyncio.run(run())
+    print("✓ Session store test passed")
+
+
+def test_single_flight_shares_result_and_exception():
+    """Test that concurrent calls on one key run once and share the outcome."""
+    import asyncio
+    from src.orchestrator.concurrency import SingleFlight
+
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"answer": "shared"}
+
+        tasks = [asyncio.ensure_future(flight.do("q", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert len(flight) == 1, "Only one call should be in flight"
+        release.set()
+        results = await asyncio.gather(*tasks)
+        assert len(calls) == 1, "The work should run once"
+        assert all(r is results[0] for r in results), "Callers should share one result"
+        assert len(flight) == 0, "The key should be released"
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        errors = await asyncio.gather(*(flight.do("q", fail) for _ in range(5)), return_exceptions=True)
+        assert len(calls) == 2, "The failing work should run once"
+        assert all(isinstance(e, ValueError) for e in errors)
+        assert all(e is errors[0] for e in errors), "Callers should share one exception"
+
+        # A call after the key is released runs again
+        assert await flight.do("q", work) == {"answer": "shared"}
+        assert len(calls) == 3
+
+    asyncio.run(run())
+    print("✓ SingleFlight test passed")
+
+
+def test_micro_batcher_order_size_and_stop():
+    """Test batch sizes, result order and failing pending requests on stop."""
+    import asyncio
+    from src.orchestrator.concurrency import MicroBatcher
+
+    async def run():
+        sizes = []
+
+        def double(items):
+            sizes.append(len(items))
+            return [x * 2 for x in items]
+
+        batcher = MicroBatcher(double, max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+        assert results == [i * 2 for i in range(7)], "Results should match their submissions"
+        assert sum(sizes) == 7 and max(sizes) <= 3, f"Unexpected batch sizes: {sizes}"
+        await batcher.stop()
+
+        # A long wait keeps the requests pending until stop() fails them
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=60_000)
+        pending = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        outcomes = await asyncio.gather(*pending, return_exceptions=True)
+        assert all(isinstance(e, RuntimeError) for e in outcomes), outcomes
+
+    asyncio.run(run())
+    print("✓ MicroBatcher test passed")
+
+
+def test_feedback_line_scanning():
+    """Test chunked line reading and the timestamp fast path of the feedback log."""
+    import json
+    import tempfile
+    from pathlib import Path
+    from src.orchestrator import feedback
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "feedback.jsonl"
+        # Pad the first record so the second one straddles the read-chunk boundary
+        pad = "x" * (feedback._READ_CHUNK_SIZE - 100)
+        first = json.dumps({"timestamp": "2024-01-01T00:00:00.000001", "pad": pad})
+        straddling = json.dumps({"timestamp": "2024-01-02T00:00:00.000002", "comment": "y" * 100})
+        reordered = json.dumps({"rating": 5, "timestamp": "2024-01-03T00:00:00.000003"})
+        last = json.dumps({"timestamp": "2024-01-04T00:00:00.000004"})
+        path.write_bytes(
+            (first + "\n" + straddling + "\r\n\n" + reordered + "\r\n" + last).encode("utf-8")
+        )
+        assert len(first) + 1 < feedback._READ_CHUNK_SIZE < len(first) + 1 + len(straddling)
+        
+        lines = list(feedback._iter_lines(path))
+        assert [json.loads(line) for line in lines] == [
+            json.loads(first), json.loads(straddling), json.loads(reordered), json.loads(last)
+        ], "Blank lines should be skipped and the unterminated last line kept"
+        assert [feedback._line_timestamp(line) for line in lines] == [
+            b"2024-01-01T00:00:00.000001", b"2024-01-02T00:00:00.000002",
+            b"2024-01-03T00:00:00.000003", b"2024-01-04T00:00:00.000004"
+        ]
+    print("✓ Feedback line scanning test passed")
+
+
+def test_clear_old_feedback_keeps_newer_records():
+    """Test that pruning keeps exactly the records newer than the cutoff."""
+    import json
+    import tempfile
+    from datetime import datetime, timedelta
+    from pathlib import Path
+    from src.orchestrator.feedback import FeedbackCollector
+    
+    def stamp(days_ago):
+        return (datetime.now() - timedelta(days=days_ago)).isoformat(timespec="microseconds")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "feedback.jsonl"
+        records = [
+            {"timestamp": stamp(120), "rating": 1},
+            {"timestamp": stamp(10), "rating": 5},
+            {"rating": 2, "timestamp": stamp(91)},
+            {"rating": 4, "timestamp": stamp(89)},
+            {"timestamp": stamp(1), "rating": 3},
+        ]
+        path.write_bytes("\r\n".join(json.dumps(r) for r in records).encode("utf-8"))
+        
+        collector = FeedbackCollector(str(path))
+        collector.clear_old_feedback(days=90)
+        
+        data = path.read_bytes()
+        assert b"\r" not in data and data.endswith(b"\n"), "Kept lines should be LF-terminated"
+        kept = [json.loads(line) for line in data.splitlines()]
+        assert kept == [records[1], records[3], records[4]], kept
+        assert not path.with_suffix(".tmp").exists()
+    print("✓ Feedback pruning test passed")
+
+
+def test_query_cache_disk_roundtrip():
+    """Test cache persistence under each serializer, and ignoring foreign files."""
+    import pickle
+    import tempfile
+    import time
+    from pathlib import Path
+    from src.orchestrator import cache as cache_module
+    from src.orchestrator.cache import QueryCache
+    
+    formats = [False] + ([True] if cache_module._MSGPACK_AVAILABLE else [])
+    original = cache_module._MSGPACK_AVAILABLE
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cache.bin"
+        try:
+            for use_msgpack in formats:
+                cache_module._MSGPACK_AVAILABLE = use_msgpack
+                cache = QueryCache(ttl_minutes=10)
+                cache.set("How do I reset my password?", {"answer": "Use the link."}, top_k=3)
+                cache.set("billing", {"answer": "See invoices."})
+                cache.set("stale", {"answer": "old"})
+                cache.cache[cache._get_cache_key("stale")]['cached_at'] -= 11 * 60
+                assert cache.get("billing") is not None
+                cache.save_to_disk(str(path))
+                
+                magic = cache_module._MSGPACK_MAGIC if use_msgpack else cache_module._PICKLE_MAGIC
+                assert path.read_bytes().startswith(magic)
+                
+                restored = QueryCache(ttl_minutes=10)
+                restored.load_from_disk(str(path))
+                assert restored.get("how do i reset my password", top_k=3) == {"answer": "Use the link."}
+                assert restored.get("billing") == {"answer": "See invoices."}
+                assert restored.get("stale") is None, "Expired entries should not be restored"
+                entry = restored.cache[restored._get_cache_key("billing")]
+                assert entry['hit_count'] == 2, "Hit counts should survive"
+                assert time.monotonic() - entry['cached_at'] < 60, "Entry age should survive"
+        finally:
+            cache_module._MSGPACK_AVAILABLE = original
+        
+        # Older versions and unknown magic are ignored rather than raising
+        old = {'version': cache_module.CACHE_FILE_VERSION - 1, 'entries': [(time.time(), 0, "q", None, {})]}
+        for payload in (cache_module._PICKLE_MAGIC + pickle.dumps(old), b"QCXX" + b"garbage", b"{}"):
+            path.write_bytes(payload)
+            restored = QueryCache()
+            restored.load_from_disk(str(path))
+            assert len(restored.cache) == 0
+    print("✓ Query cache persistence test passed")
+
+
+def test_semantic_cache_safe_radius_compares_answers():
+    """Test that nearby cached paraphrases only conflict when their answers differ."""
+    import numpy as np
+    from src.orchestrator.semantic_cache import SemanticQueryCache
+    
+    vectors = {"reset password": [1.0, 0.0], "password reset": [1.0, 0.01], "reset my password": [1.0, -0.005]}
+    
+    class Embeddings:
+        def embed_query_vector(self, text):
+            return np.array(vectors[text], dtype=np.float32)
+    
+    cache = SemanticQueryCache(embeddings=Embeddings(), threshold=0.9, safe_radius=0.01)
+    cache.set("reset password", {"answer": "Use the reset link."})
+    cache.set("password reset", {"answer": "Use the reset link."})
+    assert cache.get("reset my password") == {"answer": "Use the reset link."}
+    
+    cache.set("password reset", {"answer": "Contact support."})
+    assert cache.get("reset my password") is None, "Ambiguous paraphrases should miss"
+    print("✓ Semantic cache safe radius test passed")
+
+
+def test_answer_with_judgment_parsing():
+    """Test parsing of the combined answer/confidence/escalation output."""
+    orchestrator = SupportOrchestrator(retriever=None, mode="local")
+    
+    judgment = orchestrator._parse_judgment(
+        "How do I reset my password?",
+        'JSON: {"answer": "Use the reset link.", "confidence": 0.9, "escalate": false}'
+    )
+    assert judgment == {"answer": "Use the reset link.", "confidence": 0.9, "escalate": False}
+    
+    # Truncated JSON falls back to regex extraction, confidence is clamped
+    judgment = orchestrator._parse_judgment("q", '{"answer": "Yes", "confidence": 1.5, "escalate": true')
+    assert judgment == {"answer": "Yes", "confidence": 1.0, "escalate": True}
+    
+    # Plain text falls back to the heuristics
+    judgment = orchestrator._parse_judgment("I need a manager", "Sorry.")
+    assert judgment["answer"] == "Sorry." and judgment["escalate"] is True
+    
+    # The escalation rules still apply when the JSON says not to escalate
+    judgment = orchestrator._parse_judgment(
+        "I want to speak to a manager, this is urgent",
+        '{"answer": "Sure, click reset.", "confidence": 0.9, "escalate": false}'
+    )
+    assert judgment["escalate"] is True, "Urgent queries must escalate"
+    judgment = orchestrator._parse_judgment(
+        "Can I change my plan?",
+        '{"answer": "I don\'t know.", "confidence": 0.9, "escalate": false}'
+    )
+    assert judgment["escalate"] is True, "Unsure answers must escalate"
+    print("✓ Answer judgment parsing test passed")
+
+
+def test_judge_classifier_roundtrip():
+    """Test judge prediction, save/load and the feedback training set."""
+    import tempfile
+    import numpy as np
+    from src.orchestrator.judge import JudgeClassifier, feedback_training_set
+    
+    judge = JudgeClassifier(weights=np.array([1.0, 0.0, 1.0, 0.0]), bias=-1.0)
+    path = os.path.join(tempfile.mkdtemp(), "judge_test.npz")
+    judge.save(path)
+    loaded = JudgeClassifier.load(path)
+    
+    confidence = loaded.predict(np.array([[1.0, 0.0]]), np.array([[1.0, 0.0]]))
+    assert abs(confidence[0] - 1 / (1 + np.exp(-1.0))) < 1e-6
+    
+    queries, answers, labels = feedback_training_set([
+        {"query": "q1", "answer": "a1", "rating": 5},
+        {"query": "q2", "answer": "a2", "rating": 3},
+        {"query": "q3", "answer": "a3", "rating": 1},
+    ])
+    assert queries == ["q1", "q3"] and labels == [1, 0]
+    print("✓ Judge classifier test passed")
+
+
 if __name__ == "__main__":
     print("Running Customer Support Orchestrator Tests\n")
     test_local_retriever()
     test_mock_llm()
     test_embeddings()
     test_langgraph_workflow()
+    test_session_store_lru_and_ttl()
+    test_single_flight_shares_result_and_exception()
+    test_micro_batcher_order_size_and_stop()
+    test_feedback_line_scanning()
+    test_clear_old_feedback_keeps_newer_records()
+    test_query_cache_disk_roundtrip()
+    test_semantic_cache_safe_radius_compares_answers()
+    test_answer_with_judgment_parsing()
+    test_judge_classifier_roundtrip()
     print("\n✓ All tests completed successfully!")